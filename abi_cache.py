@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ABI与合约实例缓存
+
+abi.py 中的ABI字符串只在第一次使用时解析一次，并预先生成函数选择器和
+输出类型表；web3 合约对象按 (Web3实例, ABI, 地址) 缓存，多个封装实例共用。
+web3 / eth_utils 只在真正需要时才导入，导入封装模块本身不会加载 web3。
+"""
+
+import json
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Tuple
+
+from abi import OptionTokenAbiJson, PointTokenAbiJson, PredictionAbiJson
+
+# 封装类使用的ERC20 ABI
+ERC20_ABI = [
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "name",
+        "outputs": [{"name": "", "type": "string"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "symbol",
+        "outputs": [{"name": "", "type": "string"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "decimals",
+        "outputs": [{"name": "", "type": "uint8"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [{"name": "_owner", "type": "address"}],
+        "name": "balanceOf",
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "constant": False,
+        "inputs": [
+            {"name": "_spender", "type": "address"},
+            {"name": "_value", "type": "uint256"}
+        ],
+        "name": "approve",
+        "outputs": [{"name": "", "type": "bool"}],
+        "payable": False,
+        "stateMutability": "nonpayable",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [
+            {"name": "_owner", "type": "address"},
+            {"name": "_spender", "type": "address"}
+        ],
+        "name": "allowance",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "totalSupply",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "payable": False,
+        "stateMutability": "view",
+        "type": "function"
+    }
+]
+
+# ABI名称 -> JSON字符串或已解析的ABI列表
+ABI_SOURCES = {
+    'erc20': ERC20_ABI,
+    'prediction': PredictionAbiJson,
+    'option_token': OptionTokenAbiJson,
+    'point_token': PointTokenAbiJson,
+}
+
+
+class AbiFunction(NamedTuple):
+    """ABI中的一个函数"""
+    name: str
+    signature: str
+    selector: bytes
+    input_types: Tuple[str, ...]
+    output_types: Tuple[str, ...]
+
+
+def _canonical_type(param: dict) -> str:
+    """参数的规范类型，tuple 展开为 (a,b,...) 形式"""
+    param_type = param['type']
+    if param_type.startswith('tuple'):
+        inner = ','.join(_canonical_type(c) for c in param.get('components', []))
+        return f"({inner}){param_type[len('tuple'):]}"
+    return param_type
+
+
+@lru_cache(maxsize=None)
+def get_abi(name: str) -> List[dict]:
+    """
+    解析后的ABI，同一名称只解析一次
+
+    Args:
+        name: ABI_SOURCES 中的名称
+
+    Returns:
+        ABI列表（共享对象，不要修改）
+    """
+    source = ABI_SOURCES[name]
+    return json.loads(source) if isinstance(source, str) else source
+
+
+@lru_cache(maxsize=None)
+def function_table(name: str) -> Dict[str, List[AbiFunction]]:
+    """
+    函数名到 AbiFunction 列表的映射，重载函数对应多个条目
+
+    Args:
+        name: ABI_SOURCES 中的名称
+
+    Returns:
+        函数表
+    """
+    from eth_utils import function_signature_to_4byte_selector
+
+    table: Dict[str, List[AbiFunction]] = {}
+    for entry in get_abi(name):
+        if entry.get('type') != 'function':
+            continue
+        input_types = tuple(_canonical_type(p) for p in entry.get('inputs', []))
+        signature = f"{entry['name']}({','.join(input_types)})"
+        table.setdefault(entry['name'], []).append(AbiFunction(
+            name=entry['name'],
+            signature=signature,
+            selector=function_signature_to_4byte_selector(signature),
+            input_types=input_types,
+            output_types=tuple(_canonical_type(p) for p in entry.get('outputs', [])),
+        ))
+    return table
+
+
+@lru_cache(maxsize=None)
+def selector_table(name: str) -> Dict[bytes, AbiFunction]:
+    """4字节选择器到 AbiFunction 的映射，用于解码调用数据和返回值"""
+    return {function.selector: function
+            for functions in function_table(name).values()
+            for function in functions}
+
+
+def decode_output(name: str, selector: bytes, data: bytes) -> tuple:
+    """
+    按选择器解码函数返回值
+
+    Args:
+        name: ABI_SOURCES 中的名称
+        selector: 4字节函数选择器
+        data: eth_call 返回的原始数据
+
+    Returns:
+        解码后的返回值元组
+    """
+    from eth_abi import decode
+
+    return decode(selector_table(name)[selector].output_types, data)
+
+
+@lru_cache(maxsize=4096)
+def checksum_address(address: str) -> str:
+    """带缓存的校验和地址转换"""
+    from eth_utils import to_checksum_address
+
+    return to_checksum_address(address)
+
+
+def _web3_cache(web3) -> Dict[tuple, object]:
+    """挂在Web3实例上的缓存字典，生命周期与Web3实例相同"""
+    cache = getattr(web3, '_abi_cache', None)
+    if cache is None:
+        cache = web3._abi_cache = {}
+    return cache
+
+
+def contract_class(web3, name: str):
+    """
+    指定ABI的合约类，每个Web3实例只创建一次
+
+    Args:
+        web3: Web3实例
+        name: ABI_SOURCES 中的名称
+
+    Returns:
+        web3 合约类（尚未绑定地址）
+    """
+    cache = _web3_cache(web3)
+    key = ('class', name)
+    if key not in cache:
+        cache[key] = web3.eth.contract(abi=get_abi(name))
+    return cache[key]
+
+
+def get_contract(web3, name: str, address: str):
+    """
+    绑定地址的合约对象，同一 (Web3实例, ABI, 地址) 共用一个对象
+
+    Args:
+        web3: Web3实例
+        name: ABI_SOURCES 中的名称
+        address: 合约地址
+
+    Returns:
+        web3 合约对象
+    """
+    address = checksum_address(address)
+    cache = _web3_cache(web3)
+    key = (name, address)
+    if key not in cache:
+        cache[key] = contract_class(web3, name)(address=address)
+    return cache[key]
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量报价封装类
+
+一次性对一组 (option, delta) 报价，用于绘制完整的价格冲击/滑点曲线。
+链上模式把同一个区块上的全部 eth_call 合并为 JSON-RPC 批量请求（一次往返），
+节点不支持批量请求时退回线程池并发；离线模式直接使用 PoolModel 向量化计算，
+两种模式的结果都按区块缓存。
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+import fast_abi
+from abi_cache import checksum_address
+from pool_model import PoolModel, from_sd59x18, to_sd59x18
+
+
+class BatchQuoter:
+    """向量化报价接口，支持链上和离线两种后端"""
+
+    def __init__(self, prediction=None, model: Optional[PoolModel] = None,
+                 max_workers: int = 16, cache_blocks: int = 4, batch_size: int = 500):
+        """
+        初始化报价器
+
+        Args:
+            prediction: PredictionContract实例，提供时使用链上报价
+            model: PoolModel实例，离线报价时使用
+            max_workers: 节点不支持批量请求时并发eth_call的线程数
+            cache_blocks: 最多缓存的区块数
+            batch_size: 单个批量请求最多包含的调用数（节点通常限制批量大小）
+        """
+        if prediction is None and model is None:
+            raise ValueError("prediction和model至少需要提供一个")
+        self.prediction = prediction
+        self.model = model
+        self.max_workers = max_workers
+        self.cache_blocks = cache_blocks
+        self.batch_size = batch_size
+        # 区块号(离线模式为状态哈希) -> {(kind, option, delta): amount}
+        self._cache: "OrderedDict[object, Dict[tuple, int]]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers) if prediction is not None else None
+
+    @property
+    def is_offline(self) -> bool:
+        return self.prediction is None
+
+    def _block_cache(self, key) -> Dict[tuple, int]:
+        """获取某个区块的缓存，淘汰最旧的区块"""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        self._cache[key] = {}
+        while len(self._cache) > self.cache_blocks:
+            self._cache.popitem(last=False)
+        return self._cache[key]
+
+    def _call_batch(self, calls, block_identifier) -> list:
+        """
+        在同一区块上执行一组 RawCall，按 batch_size 合并为JSON-RPC批量请求
+
+        Returns:
+            与 calls 顺序一致的解码结果
+        """
+        web3 = self.prediction.web3
+        if not hasattr(web3, 'batch_requests'):
+            return list(self._executor.map(lambda call: call.call(block_identifier), calls))
+        results = []
+        for start in range(0, len(calls), self.batch_size):
+            chunk = calls[start:start + self.batch_size]
+            with web3.batch_requests() as batch:
+                for call in chunk:
+                    batch.add(web3.eth.call(call.params(), block_identifier))
+                results.extend(call.decode(raw) for call, raw in zip(chunk, batch.execute()))
+        return results
+
+    def _raw_call(self, data: bytes, round_up: bool = False):
+        # getAmountOut / getAmountsOut 返回 SD59x18，换算为与离线模型相同的原始整数单位
+        return fast_abi.RawCall(self.prediction.web3, checksum_address(self.prediction.prediction_address),
+                                data, lambda raw: from_sd59x18(fast_abi.decode_int(raw), round_up))
+
+    def _current_key(self, block_identifier=None):
+        if self.is_offline:
+            return self.model.state_hash()
+        if block_identifier is None or block_identifier == 'latest':
+            return self.prediction.web3.eth.block_number
+        return block_identifier
+
+    def quote(self, options: Sequence[int], deltas: Sequence[int], block_identifier=None) -> np.ndarray:
+        """
+        批量deposit报价
+
+        Args:
+            options: 选项索引数组
+            deltas: 投入金额数组（原始单位），与options广播
+            block_identifier: 报价所基于的区块，默认最新区块
+
+        Returns:
+            与输入同形状的输出数量数组
+        """
+        options, deltas = np.broadcast_arrays(np.asarray(options, dtype=np.int64),
+                                              np.asarray(deltas, dtype=np.int64))
+        key = self._current_key(block_identifier)
+        cache = self._block_cache(key)
+
+        if self.is_offline:
+            missing = [(int(o), int(d)) for o, d in zip(options.ravel(), deltas.ravel())
+                       if ('deposit', int(o), int(d)) not in cache]
+            if missing:
+                m_opts, m_deltas = np.array(missing, dtype=np.int64).T
+                outs = self.model.get_amount_out(m_opts, m_deltas)
+                for (o, d), out in zip(missing, outs):
+                    cache[('deposit', o, d)] = int(out)
+        else:
+            missing = list({(int(o), int(d)) for o, d in zip(options.ravel(), deltas.ravel())
+                            if ('deposit', int(o), int(d)) not in cache})
+            if missing:
+                outs = self._call_batch([self._raw_call(fast_abi.get_amount_out_data(o, d)) for o, d in missing], key)
+                for pair, out in zip(missing, outs):
+                    cache[('deposit',) + pair] = int(out)
+
+        result = np.fromiter((cache[('deposit', int(o), int(d))]
+                              for o, d in zip(options.ravel(), deltas.ravel())),
+                             dtype=object, count=options.size)
+        return result.reshape(options.shape)
+
+    def quote_vectors(self, xs: Sequence[Sequence[int]], block_identifier=None) -> np.ndarray:
+        """
+        通过 getAmountsOut 对一组储备变化向量报价，链上模式合并为一次批量请求
+
+        Args:
+            xs: 储备变化向量列表，每个向量为各选项的储备变化量
+            block_identifier: 报价所基于的区块
+
+        Returns:
+            每个向量需要支付（正）或得到（负）的基础代币数量
+        """
+        key = self._current_key(block_identifier)
+        cache = self._block_cache(key)
+        cache_keys = [('vector', tuple(int(v) for v in x)) for x in xs]
+        missing = list(dict.fromkeys(k for k in cache_keys if k not in cache))
+        if missing:
+            if self.is_offline:
+                outs = [self.model.get_amounts_out(k[1]) for k in missing]
+            else:
+                # 储备变化向量按 SD59x18 传入；与离线模型一致，成本向上取整
+                outs = self._call_batch([self._raw_call(fast_abi.get_amounts_out_data([to_sd59x18(v) for v in k[1]]),
+                                                        round_up=True) for k in missing], key)
+            for cache_key, out in zip(missing, outs):
+                cache[cache_key] = int(out)
+        return np.array([cache[k] for k in cache_keys], dtype=object)
+
+    def quote_vector(self, x: Sequence[int], block_identifier=None) -> int:
+        """
+        通过 getAmountsOut 对一个储备变化向量报价
+
+        Args:
+            x: 各选项储备变化量
+            block_identifier: 报价所基于的区块
+
+        Returns:
+            需要支付（正）或得到（负）的基础代币数量
+        """
+        return int(self.quote_vectors([x], block_identifier)[0])
+
+    def price_impact_curve(self, option: int, deltas: Sequence[int], block_identifier=None) -> Dict[str, np.ndarray]:
+        """
+        计算单个选项的价格冲击曲线
+
+        Args:
+            option: 选项索引
+            deltas: 交易规模数组（原始单位）
+            block_identifier: 报价所基于的区块
+
+        Returns:
+            包含 delta、amount_out、execution_price、price_impact 的字典
+        """
+        deltas = np.asarray(deltas, dtype=np.int64)
+        amount_out = self.quote(np.full(deltas.shape, option), deltas, block_identifier).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            execution_price = np.where(amount_out > 0, deltas / amount_out, np.nan)
+        # 以最小规模的成交价作为参考价
+        reference = execution_price[np.nanargmin(deltas)] if len(deltas) else np.nan
+        return {
+            'delta': deltas,
+            'amount_out': amount_out,
+            'execution_price': execution_price,
+            'price_impact': execution_price / reference - 1.0,
+        }
+
+    def clear_cache(self):
+        """清空报价缓存"""
+        self._cache.clear()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+操作器吞吐量基准测试
+
+对完整的批量操作流程（快照、选择、执行、等待确认、操作后快照、记录）计时，
+支持三种后端：
+    offline  本地 PoolModel，不发送RPC请求
+    fork     本地分叉节点（例如 anvil --fork-url ...），默认 http://127.0.0.1:8545
+    rpc      远程RPC节点（例如Tenderly测试链）
+
+固定随机种子和操作权重，结果以JSON输出，便于在不同提交之间对比：
+
+    python benchmark.py --backend offline --steps 2000 --output bench.json
+    python benchmark.py --backend fork --backend rpc --rpc-url https://... --steps 50
+
+链上后端的地址和私钥可以通过参数或环境变量（RPC_URL、PREDICTION_ADDRESS、
+BASE_TOKEN_ADDRESS、ACCOUNT_ADDRESS、ACCOUNT_PRIVATE_KEY、LP_PROVIDER_ADDRESS、
+LP_PROVIDER_PRIVATE_KEY）提供。
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+from instrumentation import registry
+from operation_stats import OperationStats
+
+# 固定的操作组合，与页面默认权重一致
+DEFAULT_MIX = {'deposit': 30, 'withdraw': 25, 'add_liquidity': 20, 'remove_liquidity': 10}
+
+DEFAULT_FORK_URL = 'http://127.0.0.1:8545'
+
+MEMORY_ROWS = 10000
+
+
+def operation_weights(num_options: int, mix: Dict[str, int] = DEFAULT_MIX) -> Dict[str, int]:
+    """把按操作类型给出的权重展开为每个选项的操作权重"""
+    weights = {}
+    for i in range(num_options):
+        weights[f'deposit_o{i + 1}'] = mix['deposit']
+        weights[f'withdraw_o{i + 1}'] = mix['withdraw']
+    weights['add_liquidity'] = mix['add_liquidity']
+    weights['remove_liquidity'] = mix['remove_liquidity']
+    return weights
+
+
+def build_offline_operator(num_options: int, factor: float, liquidity: int, balance: int):
+    """
+    创建离线操作器
+
+    Args:
+        num_options: 选项数量
+        factor: 流动性因子（原始单位）
+        liquidity: 池子初始基础代币和LP供应量（原始整数）
+        balance: 交易账户和LP提供者的初始余额（原始整数）
+
+    Returns:
+        OfflineContractOperator
+    """
+    from offline_operator import OfflineContractOperator
+    from pool_model import PoolModel
+
+    model = PoolModel(reserves=[0] * num_options, factor=factor,
+                      lp_supply=liquidity, pool_balance=liquidity)
+    return OfflineContractOperator(model, user_balance=balance, lp_provider_balance=balance)
+
+
+def build_chain_operator(args, rpc_url: str):
+    """创建连接链上节点的操作器"""
+    from chain_operator import ChainContractOperator
+
+    operator = ChainContractOperator(
+        rpc_url=rpc_url,
+        prediction_address=args.prediction,
+        base_token_address=args.base_token,
+        account_address=args.account,
+        account_private_key=args.account_key,
+        lp_provider_address=args.lp,
+        lp_provider_private_key=args.lp_key,
+        rpc_calls_per_second=args.rpc_budget or None,
+    )
+    if operator.num_options == 0:
+        raise RuntimeError(f"无法连接合约: {rpc_url}")
+    return operator
+
+
+def history_memory(operator, rows: int = MEMORY_ROWS) -> int:
+    """
+    测量追加 rows 条操作历史占用的内存
+
+    Returns:
+        字节数
+    """
+    balances, prices = operator.get_last_state()
+    if balances is None:
+        balances = operator.get_current_balances()
+        prices = operator.calculate_prices(balances)
+
+    # 合成的历史不参与统计和不变量检查
+    saved = operator.operation_history, operator.stats, operator.invariants
+    operator.operation_history = []
+    operator.stats = OperationStats()
+    operator.invariants = None
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(rows):
+            operator.record_operation('deposit_o1', 10 ** 6 + i, f"0x{i:064x}", True, balances, prices)
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+        operator.operation_history, operator.stats, operator.invariants = saved
+    return used
+
+
+def run_benchmark(operator, steps: int, seed: int, timeout: int = 60) -> Dict[str, object]:
+    """
+    执行固定步数的批量操作并统计
+
+    Args:
+        operator: ChainContractOperator 或 OfflineContractOperator
+        steps: 步数
+        seed: 随机种子
+        timeout: 每笔交易等待确认的超时时间（秒）
+
+    Returns:
+        统计结果字典
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    operator.rng.seed(seed)
+    registry.reset()
+    operator.rpc_accounting.reset()
+    weights = operation_weights(operator.num_options)
+
+    latencies = np.zeros(steps)
+    statuses: Dict[str, int] = {}
+    executed = succeeded = 0
+    started = time.perf_counter()
+    for i in range(steps):
+        step_started = time.perf_counter()
+        step = operator.run_batch_step(weights, timeout=timeout)
+        latencies[i] = time.perf_counter() - step_started
+        statuses[step['status']] = statuses.get(step['status'], 0) + 1
+        if step['status'] == 'no_balances':
+            latencies = latencies[:i + 1]
+            break
+        if step['status'] == 'done':
+            executed += 1
+            succeeded += int(step['success'])
+    elapsed = time.perf_counter() - started
+
+    rpc_calls = operator.rpc_accounting.total_calls()
+    return {
+        'steps': len(latencies),
+        'operations': executed,
+        'succeeded': succeeded,
+        'statuses': statuses,
+        'elapsed_seconds': elapsed,
+        'ops_per_second': executed / elapsed if elapsed > 0 else 0.0,
+        'step_latency_ms': {
+            'p50': float(np.percentile(latencies, 50) * 1000) if len(latencies) else 0.0,
+            'p99': float(np.percentile(latencies, 99) * 1000) if len(latencies) else 0.0,
+            'mean': float(latencies.mean() * 1000) if len(latencies) else 0.0,
+        },
+        'rpc_calls': rpc_calls,
+        'rpc_calls_per_op': rpc_calls / executed if executed else 0.0,
+        'memory_bytes_per_10k_rows': history_memory(operator) * 10000 // MEMORY_ROWS,
+        'stages': registry.summary(),
+        'rpc': operator.rpc_accounting.summary(),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="操作器吞吐量基准测试")
+    parser.add_argument('--backend', action='append', choices=['offline', 'fork', 'rpc'],
+                        help="要测试的后端，可重复指定，默认 offline")
+    parser.add_argument('--steps', type=int, default=1000, help="每个后端执行的步数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--timeout', type=int, default=60, help="等待交易确认的超时时间（秒）")
+    parser.add_argument('--output', help="结果JSON文件路径，默认输出到标准输出")
+
+    offline = parser.add_argument_group('offline')
+    offline.add_argument('--num-options', type=int, default=2, help="选项数量")
+    offline.add_argument('--factor', type=float, default=1e9, help="流动性因子（原始单位）")
+    offline.add_argument('--liquidity', type=int, default=10 ** 12, help="池子初始流动性（原始整数）")
+    offline.add_argument('--balance', type=int, default=10 ** 11, help="账户初始余额（原始整数）")
+
+    chain = parser.add_argument_group('fork / rpc')
+    chain.add_argument('--rpc-url', default=os.environ.get('RPC_URL'), help="远程RPC节点地址")
+    chain.add_argument('--fork-url', default=os.environ.get('FORK_URL', DEFAULT_FORK_URL), help="本地分叉节点地址")
+    chain.add_argument('--prediction', default=os.environ.get('PREDICTION_ADDRESS'))
+    chain.add_argument('--base-token', default=os.environ.get('BASE_TOKEN_ADDRESS'))
+    chain.add_argument('--account', default=os.environ.get('ACCOUNT_ADDRESS'))
+    chain.add_argument('--account-key', default=os.environ.get('ACCOUNT_PRIVATE_KEY'))
+    chain.add_argument('--lp', default=os.environ.get('LP_PROVIDER_ADDRESS'))
+    chain.add_argument('--lp-key', default=os.environ.get('LP_PROVIDER_PRIVATE_KEY'))
+    chain.add_argument('--rpc-budget', type=float, default=0, help="每秒RPC调用上限，0为不限")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    backends = args.backend or ['offline']
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'steps': args.steps,
+        'mix': DEFAULT_MIX,
+        'results': {},
+    }
+
+    for backend in backends:
+        if backend == 'offline':
+            operator = build_offline_operator(args.num_options, args.factor, args.liquidity, args.balance)
+        else:
+            rpc_url = args.fork_url if backend == 'fork' else args.rpc_url
+            if not rpc_url:
+                print(f"跳过 {backend}: 未配置RPC地址", file=sys.stderr)
+                continue
+            operator = build_chain_operator(args, rpc_url)
+
+        print(f"开始测试 {backend}，{args.steps} 步...", file=sys.stderr)
+        result = run_benchmark(operator, args.steps, args.seed, args.timeout)
+        result['num_options'] = operator.num_options
+        report['results'][backend] = result
+        print(f"{backend}: {result['ops_per_second']:.1f} ops/s, "
+              f"p50 {result['step_latency_ms']['p50']:.2f}ms, "
+              f"p99 {result['step_latency_ms']['p99']:.2f}ms, "
+              f"{result['rpc_calls_per_op']:.1f} RPC/op", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,800 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+链上合约操作类
+
+驱动单个Prediction市场的交易账户和LP提供者账户。选项数量从合约的
+options() 读取，各选项的余额和价格以按选项索引的定长数组保存，
+每次快照通过一次批量请求读取全部数据。
+余额、价格和操作金额在内部一律使用原始整数，只在渲染时按小数位数换算。
+"""
+
+import copy
+import random
+import time
+from datetime import datetime
+
+import numpy as np
+import streamlit as st
+
+from abi_cache import checksum_address
+from erc20_contract import ERC20Contract
+from fast_abi import RawCall, balance_of_data, decode_int, price_data, reserves_data, total_supply_data
+from instrumentation import install_rpc_timing, registry
+from operation_stats import OperationStats
+from pool_model import from_sd59x18
+from prediction_contract import PredictionContract
+from rpc_accounting import RpcAccounting
+
+# 不按选项区分的标量余额字段
+SCALAR_BALANCE_KEYS = ['pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance', 'user_lp_balance',
+                       'lp_supply']
+
+# 以基础代币计价的余额字段
+BASE_BALANCE_KEYS = ['pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance']
+
+# 合约 price() 返回的定点小数位数
+PRICE_DECIMALS = 6
+
+_INT64_MIN, _INT64_MAX = int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max)
+
+
+def int_array(values):
+    """
+    原始整数转换为数组
+
+    uint256 / int256 的余额和储备可能超出int64范围（例如18位小数的代币），
+    全部落在范围内时返回int64数组，否则退回保存Python int的object数组，不丢失精度
+
+    Args:
+        values: 整数序列
+
+    Returns:
+        int64 或 object 数组
+    """
+    values = [int(value) for value in values]
+    if all(_INT64_MIN <= value <= _INT64_MAX for value in values):
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=object)
+
+
+def operation_names(num_options):
+    """返回N选项市场的全部操作名称，例如 deposit_o1 ... withdraw_oN"""
+    return ([f'deposit_o{i + 1}' for i in range(num_options)] +
+            [f'withdraw_o{i + 1}' for i in range(num_options)] +
+            ['add_liquidity', 'remove_liquidity'])
+
+
+def parse_operation(operation):
+    """
+    解析操作名称
+
+    Args:
+        operation: 例如 'deposit_o2'、'add_liquidity'
+
+    Returns:
+        (操作类型, 选项索引)，流动性操作的选项索引为-1
+    """
+    if operation.startswith(('deposit_o', 'withdraw_o')):
+        kind, option = operation.rsplit('_o', 1)
+        return kind, int(option) - 1
+    return operation, -1
+
+
+def operation_label(operation):
+    """操作的显示名称，例如 'deposit_o2' -> 'Deposit O2'"""
+    kind, option = parse_operation(operation)
+    label = kind.replace('_', ' ').title()
+    return f"{label} O{option + 1}" if option >= 0 else label
+
+
+def receipt_gas_used(receipt):
+    """交易收据中的Gas使用量，没有收据时返回None"""
+    return receipt.gasUsed if receipt is not None else None
+
+
+class ChainContractOperator:
+    def __init__(self, rpc_url, prediction_address, base_token_address,
+                 account_address, account_private_key,
+                 lp_provider_address, lp_provider_private_key,
+                 rpc_calls_per_second=None, ws_url=None):
+        # 从参数接收配置
+        self.RPC_URL = rpc_url
+        self.PREDICTION_CONTRACT_ADDRESS = prediction_address
+        self.BASE_TOKEN_ADDRESS = base_token_address
+        self.ACCOUNT_ADDRESS = account_address
+        self.ACCOUNT_PRIVATE_KEY = account_private_key
+        self.LP_PROVIDER_ADDRESS = lp_provider_address
+        self.LP_PROVIDER_PRIVATE_KEY = lp_provider_private_key
+        # 可选的WebSocket节点，设置后快照和收据由新区块订阅推送，不再轮询
+        self.WS_URL = ws_url
+        self.subscription = None
+        # 最近一笔已确认交易所在区块，之后的快照不能早于该区块
+        self._min_snapshot_block = None
+        # RPC调用统计，rpc_calls_per_second 为每秒调用上限（None表示不限速）
+        self.rpc_accounting = RpcAccounting(calls_per_second=rpc_calls_per_second)
+
+        self.option_tokens = []
+        self.num_options = 0
+        self.base_decimals = 6
+        self.lp_decimals = 6
+        self.option_decimals = np.zeros(0, dtype=np.int64)
+        self.operation_history = []
+        self.stats = OperationStats()
+        # 可选的不变量检查器（InvariantChecker），每记录一条历史调用一次
+        self.invariants = None
+        # 操作选择和金额使用独立的随机数生成器，便于检查点保存和恢复
+        self.rng = random.Random()
+        self.init_contracts()
+
+    def init_contracts(self):
+        """初始化合约连接"""
+        try:
+            from web3 import Web3
+
+            from failover_provider import make_provider
+
+            # 初始化Web3连接，填写多个节点时按健康度故障转移并对冲只读请求
+            self.web3 = Web3(make_provider(self.RPC_URL))
+            # 按RPC方法记录耗时
+            install_rpc_timing(self.web3, registry)
+            # 按方法和逻辑操作统计调用次数，并按预算限速
+            self.rpc_accounting.install(self.web3)
+
+            if not self.web3.is_connected():
+                st.error("❌ Web3连接失败！")
+                return False
+
+            # 创建合约实例
+            self.prediction_for_trade = PredictionContract(
+                web3=self.web3,
+                prediction_address=self.PREDICTION_CONTRACT_ADDRESS,
+                private_key=self.ACCOUNT_PRIVATE_KEY,
+                account_address=self.ACCOUNT_ADDRESS
+            )
+
+            self.prediction_for_lp_send = PredictionContract(
+                web3=self.web3,
+                prediction_address=self.PREDICTION_CONTRACT_ADDRESS,
+                private_key=self.LP_PROVIDER_PRIVATE_KEY,
+                account_address=self.LP_PROVIDER_ADDRESS
+            )
+
+            self.base_token = ERC20Contract(
+                web3=self.web3,
+                token_address=self.BASE_TOKEN_ADDRESS,
+                private_key=self.ACCOUNT_PRIVATE_KEY,
+                account_address=self.ACCOUNT_ADDRESS
+            )
+
+            self.base_token_for_lp = ERC20Contract(
+                web3=self.web3,
+                token_address=self.BASE_TOKEN_ADDRESS,
+                private_key=self.LP_PROVIDER_PRIVATE_KEY,
+                account_address=self.LP_PROVIDER_ADDRESS
+            )
+
+            self.prediction_lp = ERC20Contract(
+                web3=self.web3,
+                token_address=self.PREDICTION_CONTRACT_ADDRESS,
+                private_key=self.LP_PROVIDER_PRIVATE_KEY,
+                account_address=self.LP_PROVIDER_ADDRESS
+            )
+
+            options = self.prediction_for_trade.get_options()
+
+            self.owner = self.prediction_for_trade.get_owner()
+
+            # 按选项索引排列的选项代币
+            self.option_tokens = [
+                ERC20Contract(
+                    web3=self.web3,
+                    token_address=option,
+                    private_key=self.ACCOUNT_PRIVATE_KEY,
+                    account_address=self.ACCOUNT_ADDRESS
+                )
+                for option in options
+            ]
+            self.num_options = len(self.option_tokens)
+
+            # 每个代币的小数位数只查询一次
+            self.base_decimals = self.base_token.get_decimals()
+            self.lp_decimals = self.prediction_lp.get_decimals()
+            self.option_decimals = np.array([token.get_decimals() for token in self.option_tokens], dtype=np.int64)
+
+            st.success(f"✅ 合约连接成功！选项数: {self.num_options}")
+
+            if self.WS_URL:
+                self.start_subscription()
+
+            account_allowance = self.base_token.get_allowance(self.ACCOUNT_ADDRESS, self.PREDICTION_CONTRACT_ADDRESS)
+
+            lp_allowance = self.base_token_for_lp.get_allowance(self.LP_PROVIDER_ADDRESS, self.PREDICTION_CONTRACT_ADDRESS)
+
+            if account_allowance < 100000000000000000000000000000000000000:
+                st.success("开始approve交易账户")
+
+                tx_hash = self.base_token.approve(self.PREDICTION_CONTRACT_ADDRESS, 1000000000000000000000000000000000000000)
+
+                tx_success, receipt = self.wait_for_transaction(tx_hash)
+                if tx_success:
+                    st.code(f"approve for trade hash: {tx_hash}")
+
+                    st.success("✅ approve for trade success")
+
+                else:
+                    st.error("❌ approve for trade failed")
+                    return False
+
+            if lp_allowance < 100000000000000000000000000000000000000:
+                st.success("开始approveLP提供者账户")
+
+                tx_hash = self.base_token_for_lp.approve(self.PREDICTION_CONTRACT_ADDRESS, 1000000000000000000000000000000000000000)
+
+                tx_success, receipt = self.wait_for_transaction(tx_hash)
+                if tx_success:
+                    st.code(f"approve for lp hash: {tx_hash}")
+
+                    st.success("✅ approve for lp success")
+
+                else:
+                    st.error("❌ approve for lp failed")
+                    return False
+
+            st.success("✅ 合约初始化成功！")
+
+            return True
+
+        except Exception as e:
+            st.error(f"❌ 合约初始化失败: {str(e)}")
+            return False
+
+    def start_subscription(self):
+        """订阅新区块和合约日志，每个区块推送一次快照"""
+        from head_subscription import HeadSubscription
+
+        self.close()
+        self.subscription = HeadSubscription(
+            self.WS_URL, checksum_address(self.PREDICTION_CONTRACT_ADDRESS),
+            self._snapshot_calls, self._build_balances)
+        self.subscription.start()
+
+    def close(self):
+        """停止区块订阅"""
+        if self.subscription is not None:
+            self.subscription.stop()
+            self.subscription = None
+
+    def session_view(self, history=None):
+        """
+        共用连接和合约封装的会话副本，操作历史、统计、不变量检查和随机数生成器各自独立
+
+        Args:
+            history: 副本使用的操作历史容器，默认为空列表
+
+        Returns:
+            新的操作器副本
+        """
+        view = copy.copy(self)
+        view.operation_history = [] if history is None else history
+        view.stats = OperationStats()
+        view.invariants = None
+        view.rng = random.Random()
+        view._min_snapshot_block = None
+        return view
+
+    def operation_names(self):
+        """当前市场的全部操作名称"""
+        return operation_names(self.num_options)
+
+    def _snapshot_calls(self):
+        """快照需要的全部合约调用，顺序为: 标量余额、各选项余额、各选项价格、各选项储备
+
+        调用数据用 fast_abi 预先编码，跳过 web3 合约函数对象
+        """
+        base = checksum_address(self.BASE_TOKEN_ADDRESS)
+        prediction = checksum_address(self.PREDICTION_CONTRACT_ADDRESS)
+        account = checksum_address(self.ACCOUNT_ADDRESS)
+        lp_provider = checksum_address(self.LP_PROVIDER_ADDRESS)
+        return ([
+            RawCall(self.web3, base, balance_of_data(prediction)),
+            RawCall(self.web3, base, balance_of_data(account)),
+            RawCall(self.web3, base, balance_of_data(lp_provider)),
+            RawCall(self.web3, base, balance_of_data(checksum_address(self.owner))),
+            RawCall(self.web3, prediction, balance_of_data(lp_provider)),
+            RawCall(self.web3, prediction, total_supply_data()),
+        ] + [
+            RawCall(self.web3, checksum_address(token.token_address), balance_of_data(account))
+            for token in self.option_tokens
+        ] + [
+            RawCall(self.web3, prediction, price_data(i)) for i in range(self.num_options)
+        ] + [
+            # reserves() 返回 SD59x18（int256），储备可以为负，换算为原始整数单位
+            RawCall(self.web3, prediction, reserves_data(i), lambda raw: from_sd59x18(decode_int(raw)))
+            for i in range(self.num_options)
+        ])
+
+    def _build_balances(self, results):
+        """把按 _snapshot_calls 顺序排列的结果转换为余额字典（原始整数）"""
+        n = self.num_options
+        offset = len(SCALAR_BALANCE_KEYS)
+        balances = {key: int(value) for key, value in zip(SCALAR_BALANCE_KEYS, results[:offset])}
+        balances['option_balances'] = int_array(results[offset:offset + n])
+        balances['option_prices'] = np.array([int(r) for r in results[offset + n:offset + 2 * n]], dtype=np.int64)
+        balances['reserves'] = int_array(results[offset + 2 * n:offset + 3 * n])
+        return balances
+
+    def get_current_balances(self):
+        """获取当前链上余额 - 单次批量请求版本"""
+        if self.subscription is not None:
+            # 使用订阅推送的快照，交易确认后等待包含该交易的区块
+            balances = self.subscription.snapshot_at(self._min_snapshot_block)
+            if balances is not None:
+                return balances
+            st.warning("⚠️ 区块订阅暂无快照，改用RPC查询")
+        with self.rpc_accounting.operation('snapshot'):
+            return self._get_current_balances()
+
+    def _get_current_balances(self):
+        import time
+
+        calls = self._snapshot_calls()
+
+        try:
+            start_time = time.time()
+
+            # web3 v7 支持JSON-RPC批量请求，一次往返读取全部数据
+            if not hasattr(self.web3, 'batch_requests'):
+                return self._get_balances_concurrent(calls)
+
+            with self.web3.batch_requests() as batch:
+                for call in calls:
+                    batch.add(self.web3.eth.call(call.params()))
+                results = [call.decode(raw) for call, raw in zip(calls, batch.execute())]
+
+            end_time = time.time()
+            st.info(f"⚡ 批量查询完成，耗时: {end_time - start_time:.2f}秒")
+
+            return self._build_balances(results)
+        except Exception as e:
+            st.error(f"❌ 批量查询失败，回退到并发方式: {str(e)}")
+            return self._get_balances_concurrent(calls)
+
+    def _get_balances_concurrent(self, calls):
+        """并发方式获取余额 - 节点不支持批量请求时使用"""
+        import asyncio
+        import time
+
+        def run_concurrent_queries():
+            """使用协程并发查询所有余额"""
+            async def query_all():
+                loop = asyncio.get_event_loop()
+
+                # 创建所有查询任务
+                tasks = [loop.run_in_executor(None, call.call) for call in calls]
+
+                # 并发执行所有查询
+                return await asyncio.gather(*tasks, return_exceptions=True)
+
+            # 尝试运行协程
+            try:
+                return asyncio.run(query_all())
+            except RuntimeError:
+                # 如果在已有事件循环中，使用nest_asyncio
+                try:
+                    import nest_asyncio
+                    nest_asyncio.apply()
+                    return asyncio.run(query_all())
+                except ImportError:
+                    return None
+
+        try:
+            start_time = time.time()
+
+            # 尝试协程并发查询
+            results = run_concurrent_queries()
+
+            if results is None:
+                # 协程失败，回退到同步方式
+                st.warning("⚠️ 协程环境不支持，使用同步查询")
+                return self._get_balances_sync(calls)
+
+            end_time = time.time()
+
+            # 检查是否有异常
+            for i, result in enumerate(results):
+                if isinstance(result, Exception):
+                    st.warning(f"⚠️ 查询第{i+1}项失败: {str(result)}")
+                    results[i] = 0  # 设置默认值
+
+            st.info(f"⚡ 并发查询完成，耗时: {end_time - start_time:.2f}秒")
+
+            return self._build_balances(results)
+        except Exception as e:
+            st.error(f"❌ 协程查询失败，回退到同步方式: {str(e)}")
+            return self._get_balances_sync(calls)
+
+    def _get_balances_sync(self, calls):
+        """同步方式获取余额 - 作为备用方案"""
+        try:
+            return self._build_balances([call.call() for call in calls])
+        except Exception as e:
+            st.error(f"❌ 同步查询也失败: {str(e)}")
+            return None
+
+    def calculate_prices(self, balances):
+        """从余额中提取价格信息"""
+        if not balances:
+            return {'option_prices': np.zeros(self.num_options, dtype=np.int64)}
+
+        return {
+            'option_prices': balances['option_prices']
+        }
+
+    def get_available_operations(self, balances):
+        """根据当前余额确定可执行的操作"""
+        available_ops = []
+
+        one_base = 10 ** self.base_decimals
+
+        # Deposit: 需要用户有BaseToken余额
+        if balances['user_balance'] > one_base:  # 至少1 USDC才能deposit
+            available_ops.extend(f'deposit_o{i + 1}' for i in range(self.num_options))
+
+        # Add Liquidity: 需要LP提供者有BaseToken余额
+        if balances['lp_provider_balance'] > one_base:
+            available_ops.append('add_liquidity')
+
+        # Remove Liquidity: 需要用户有LP代币
+        if balances['user_lp_balance'] > self._min_keep(self.lp_decimals):  # 至少0.1个LP代币
+            available_ops.append('remove_liquidity')
+
+        # Withdraw: 需要用户有对应的选项代币，至少0.1个
+        min_option_balance = 10 ** self.option_decimals // 10
+        available_ops.extend(f'withdraw_o{i + 1}'
+                             for i in np.flatnonzero(balances['option_balances'] > min_option_balance))
+
+        return available_ops
+
+    @staticmethod
+    def _min_keep(decimals):
+        """0.1个代币对应的原始数量"""
+        return 10 ** int(decimals) // 10
+
+    def operation_decimals(self, operation):
+        """操作金额所用代币的小数位数"""
+        kind, option = parse_operation(operation)
+        if kind == 'withdraw':
+            return int(self.option_decimals[option])
+        if kind == 'remove_liquidity':
+            return self.lp_decimals
+        return self.base_decimals
+
+    def deposit(self, option, amount_wei):
+        """向指定选项存入BaseToken，金额为原始整数"""
+        try:
+            # deposit(option_out, delta, min_receive)
+            tx_hash = self.prediction_for_trade.deposit(option, int(amount_wei), 0)
+            return tx_hash, True
+        except Exception as e:
+            st.error(f"❌ Deposit O{option + 1}失败: {str(e)}")
+            return None, False
+
+    def withdraw(self, option, amount_wei):
+        """从指定选项提取到BaseToken，金额为原始整数"""
+        try:
+            # withdraw(option_in, delta, min_receive)
+            tx_hash = self.prediction_for_trade.withdraw(option, int(amount_wei), 0)
+            return tx_hash, True
+        except Exception as e:
+            st.error(f"❌ Withdraw O{option + 1}失败: {str(e)}")
+            return None, False
+
+    def swap(self, option_out, option_in, amount_wei):
+        """卖出 option_in 选项代币换取 option_out，金额为卖出的原始整数"""
+        try:
+            # swap(option_out, option_in, delta, min_receive)
+            tx_hash = self.prediction_for_trade.swap(option_out, option_in, int(amount_wei), 0)
+            return tx_hash, True
+        except Exception as e:
+            st.error(f"❌ Swap O{option_in + 1}→O{option_out + 1}失败: {str(e)}")
+            return None, False
+
+    def add_liquidity(self, amount_wei):
+        """添加流动性，金额为原始整数"""
+        try:
+            tx_hash = self.prediction_for_lp_send.add_liquidity(int(amount_wei), self.LP_PROVIDER_ADDRESS)
+            return tx_hash, True
+        except Exception as e:
+            st.error(f"❌ Add Liquidity失败: {str(e)}")
+            return None, False
+
+    def remove_liquidity(self, amount_wei):
+        """移除流动性，金额为原始整数"""
+        try:
+            tx_hash = self.prediction_for_lp_send.remove_liquidity(int(amount_wei))
+            return tx_hash, True
+        except Exception as e:
+            st.error(f"❌ Remove Liquidity失败: {str(e)}")
+            return None, False
+
+    def execute_operation(self, operation, amount_wei):
+        """按操作名称执行操作，金额为原始整数，返回 (tx_hash, success)"""
+        with self.rpc_accounting.operation(operation):
+            return self._execute_operation(operation, amount_wei)
+
+    def _execute_operation(self, operation, amount_wei):
+        kind, option = parse_operation(operation)
+        if kind == 'deposit':
+            return self.deposit(option, amount_wei)
+        elif kind == 'withdraw':
+            return self.withdraw(option, amount_wei)
+        elif kind == 'add_liquidity':
+            return self.add_liquidity(amount_wei)
+        elif kind == 'remove_liquidity':
+            return self.remove_liquidity(amount_wei)
+        st.error(f"❌ 未知操作: {operation}")
+        return None, False
+
+    def _random_between(self, min_amount, max_amount):
+        """在整数区间内随机取值，区间为空时返回下限"""
+        return self.rng.randint(min_amount, max_amount) if max_amount > min_amount else min_amount
+
+    def get_smart_operation_amount(self, operation, balances):
+        """根据操作类型和当前余额智能确定操作金额（原始整数）"""
+        kind, option = parse_operation(operation)
+        one_base = 10 ** self.base_decimals
+
+        if kind == 'deposit':
+            # Deposit: 用户余额的5%-20%
+            max_amount = balances['user_balance'] * 20 // 100
+            min_amount = min(one_base, balances['user_balance'] * 5 // 100)
+            return self._random_between(min_amount, max_amount)
+
+        elif kind == 'add_liquidity':
+            # Add Liquidity: LP提供者余额的5%-15%
+            max_amount = balances['lp_provider_balance'] * 15 // 100
+            min_amount = min(one_base, balances['lp_provider_balance'] * 5 // 100)
+            return self._random_between(min_amount, max_amount)
+
+        elif kind == 'remove_liquidity':
+            # Remove Liquidity: 基于LP代币余额，最多移除一半
+            min_keep = self._min_keep(self.lp_decimals)
+            max_removable = max(0, balances['user_lp_balance'] - min_keep)  # 保留0.1个LP代币
+            max_amount = max_removable // 2  # 最多移除一半
+            min_amount = min(min_keep, max_amount)
+            return self._random_between(min_amount, max_amount)
+
+        elif kind == 'withdraw':
+            # Withdraw: 最多卖一半，但至少保留0.1个代币
+            min_keep = self._min_keep(self.option_decimals[option])
+            max_sellable = max(0, int(balances['option_balances'][option]) - min_keep)
+            max_amount = max_sellable // 2  # 最多卖一半
+            min_amount = min(min_keep, max_amount)
+            return self._random_between(min_amount, max_amount)
+
+        else:
+            return self._random_between(one_base, 10 * one_base)  # 默认值
+
+    def max_sellable(self, option, balances):
+        """指定选项当前最多可卖出的数量（原始整数）"""
+        min_keep = self._min_keep(self.option_decimals[option])
+        return max(0, int(balances['option_balances'][option]) - min_keep) // 2
+
+    def wait_for_transaction(self, tx_hash, timeout=120):
+        """等待交易确认并返回结果"""
+        try:
+            st.info(f"⏳ 等待交易确认... ({tx_hash[:10]}...)")
+            with registry.stage('receipt_wait'), self.rpc_accounting.operation('receipt_wait'):
+                if self.subscription is not None and self.subscription.running:
+                    receipt = self.subscription.wait_receipt(tx_hash, timeout=timeout)
+                else:
+                    receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+            self._min_snapshot_block = receipt.blockNumber
+
+            if receipt.status == 1:
+                st.success(f"✅ 交易成功确认！Gas使用: {receipt.gasUsed:,}")
+                return True, receipt
+            else:
+                st.error(f"❌ 交易失败！状态: {receipt.status}")
+                return False, receipt
+
+        except Exception as e:
+            st.error(f"❌ 等待交易确认失败: {str(e)}")
+            return False, None
+
+    def _record_with_fallback(self, operation, amount, tx_hash, fallback_balances, gas_used=None):
+        """记录失败的操作，优先使用上一个状态的数据"""
+        last_balances, last_prices = self.get_last_state()
+        if last_balances and last_prices:
+            self.record_operation(operation, amount, tx_hash, False, last_balances, last_prices, gas_used)
+        else:
+            prices_current = self.calculate_prices(fallback_balances)
+            self.record_operation(operation, amount, tx_hash, False, fallback_balances, prices_current, gas_used)
+
+    def reconcile_transaction(self, operation, amount, tx_hash, fallback_balances, timeout=60):
+        """
+        补记重启前已发送但尚未记录的交易
+
+        已上链的按收据结果记录；仍在交易池中的等待确认；节点上查不到的按失败记录
+
+        Args:
+            operation: 操作名称
+            amount: 操作金额（原始整数）
+            tx_hash: 交易哈希
+            fallback_balances: 没有历史记录时用于失败记录的余额
+            timeout: 等待确认的超时时间（秒）
+
+        Returns:
+            交易是否成功
+        """
+        try:
+            receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+        except Exception:
+            receipt = None
+        if receipt is None:
+            try:
+                self.web3.eth.get_transaction(tx_hash)
+            except Exception:
+                st.warning(f"⚠️ 节点上找不到交易 {tx_hash[:10]}...，按失败记录")
+            else:
+                _, receipt = self.wait_for_transaction(tx_hash, timeout=timeout)
+
+        if receipt is not None and receipt.status == 1:
+            self._min_snapshot_block = receipt.blockNumber
+            balances_after = self.get_current_balances()
+            if balances_after:
+                prices = self.calculate_prices(balances_after)
+                self.record_operation(operation, amount, tx_hash, True, balances_after, prices,
+                                      receipt_gas_used(receipt))
+                return True
+        self._record_with_fallback(operation, amount, tx_hash if receipt is not None else None,
+                                   fallback_balances, receipt_gas_used(receipt))
+        return False
+
+    def run_batch_step(self, operation_weights, timeout=60, on_selected=None, on_sent=None):
+        """
+        执行一次批量自动操作：快照、按权重选择操作、执行、等待确认、操作后快照、记录
+
+        Args:
+            operation_weights: 操作名称到权重的字典
+            timeout: 等待交易确认的超时时间（秒）
+            on_selected: 选定操作后的回调 on_selected(operation, amount)
+            on_sent: 交易发送后、等待确认前的回调 on_sent(operation, amount, tx_hash)
+
+        Returns:
+            字典，status 为 'done'、'no_balances'、'no_operations' 或 'no_weighted'，
+            status 为 'done' 时包含 operation、amount、success
+        """
+        # 获取当前余额
+        with registry.stage('snapshot'):
+            current_balances = self.get_current_balances()
+        if not current_balances:
+            return {'status': 'no_balances'}
+
+        selection_started = time.perf_counter()
+        # 获取可用操作
+        available_ops = self.get_available_operations(current_balances)
+        if not available_ops:
+            return {'status': 'no_operations'}
+
+        # 根据权重和可用操作选择操作，只保留可用操作的权重
+        filtered_weights = {op: weight for op, weight in operation_weights.items()
+                            if op in available_ops and weight > 0}
+        if not filtered_weights:
+            return {'status': 'no_weighted'}
+
+        operation = self.rng.choices(list(filtered_weights.keys()), weights=list(filtered_weights.values()))[0]
+
+        # 智能确定操作金额
+        amount = self.get_smart_operation_amount(operation, current_balances)
+        registry.record('op_selection', time.perf_counter() - selection_started)
+        if on_selected is not None:
+            on_selected(operation, amount)
+
+        tx_hash, success = None, False
+        try:
+            tx_hash, success = self.execute_operation(operation, amount)
+
+            if success and tx_hash:
+                if on_sent is not None:
+                    on_sent(operation, amount, tx_hash)
+                tx_success, receipt = self.wait_for_transaction(tx_hash, timeout=timeout)
+                if tx_success:
+                    # 获取操作后余额
+                    with registry.stage('post_snapshot'):
+                        balances_after = self.get_current_balances()
+                    prices = self.calculate_prices(balances_after)
+                    self.record_operation(operation, amount, tx_hash, True, balances_after, prices,
+                                          receipt_gas_used(receipt))
+                    return {'status': 'done', 'operation': operation, 'amount': amount, 'success': True}
+                # 交易失败 - 使用上一个状态的数据
+                self._record_with_fallback(operation, amount, tx_hash, current_balances, receipt_gas_used(receipt))
+            else:
+                self._record_with_fallback(operation, amount, None, current_balances)
+        except Exception as e:
+            st.error(f"操作 {operation_label(operation)} 失败: {str(e)}")
+            self._record_with_fallback(operation, amount, None, current_balances)
+        return {'status': 'done', 'operation': operation, 'amount': amount, 'success': False}
+
+    def get_last_state(self):
+        """获取上一个状态的余额和价格数据"""
+        if len(self.operation_history) > 0:
+            last_record = self.operation_history[-1]
+            # 较早的检查点中没有 lp_supply / reserves
+            balances = {key: last_record.get(key, 0) for key in SCALAR_BALANCE_KEYS}
+            balances['option_balances'] = last_record['option_balances']
+            balances['option_prices'] = last_record['option_prices']
+            balances['reserves'] = last_record.get('reserves', np.zeros(self.num_options, dtype=np.int64))
+            return balances, {'option_prices': last_record['option_prices']}
+        return None, None
+
+    def record_operation(self, operation_type, amount, tx_hash, success, balances, prices, gas_used=None):
+        """记录操作历史，选项余额、价格和储备以数组形式保存，同时更新运行统计"""
+        record = {
+            'timestamp': datetime.now(),
+            'operation': operation_type,
+            'amount': amount,
+            'tx_hash': tx_hash,
+            'success': success,
+        }
+        for key in SCALAR_BALANCE_KEYS:
+            record[key] = int(balances[key]) if balances else 0
+        record['option_balances'] = (int_array(balances['option_balances']) if balances
+                                     else np.zeros(self.num_options, dtype=np.int64))
+        record['option_prices'] = (np.array(prices['option_prices'], dtype=np.int64) if prices
+                                   else np.zeros(self.num_options, dtype=np.int64))
+        record['reserves'] = (int_array(balances['reserves']) if balances and 'reserves' in balances
+                              else np.zeros(self.num_options, dtype=np.int64))
+        self.operation_history.append(record)
+        self.stats.update(record, gas_used)
+        if self.invariants is not None:
+            self.invariants.maybe_check(self)
+
+    def history_columns(self):
+        """展开数组字段后的列表，渲染时使用，例如 user_o1_balance、o1_price"""
+        return ([f'user_o{i + 1}_balance' for i in range(self.num_options)] +
+                [f'o{i + 1}_price' for i in range(self.num_options)])
+
+    def history_frame(self, scaled=True, start=0, stop=None):
+        """
+        把操作历史转换为DataFrame，数组字段在此展开为按选项的列
+
+        Args:
+            scaled: 是否按小数位数换算为显示单位，False时保留原始整数
+            start: 起始记录下标，用于分块导出
+            stop: 结束记录下标（不含），None表示到末尾
+
+        Returns:
+            DataFrame
+        """
+        import pandas as pd
+
+        history = self.operation_history[start:stop]
+
+        def column(values, decimals):
+            values = int_array(values)
+            # 超出int64范围的object数组在换算时转为浮点数，原始值保留为Python int
+            return (values / 10.0 ** decimals).astype(np.float64) if scaled else values
+
+        df = pd.DataFrame({
+            key: [record[key] for record in history]
+            for key in ['timestamp', 'operation', 'tx_hash', 'success']
+        })
+        known_operations = set(self.operation_names())
+        amount_decimals = [self.operation_decimals(record['operation']) if record['operation'] in known_operations
+                           else self.base_decimals for record in history]
+        df['amount'] = column([record['amount'] for record in history], np.array(amount_decimals, dtype=np.int64))
+        for key in BASE_BALANCE_KEYS:
+            df[key] = column([record[key] for record in history], self.base_decimals)
+        df['user_lp_balance'] = column([record['user_lp_balance'] for record in history], self.lp_decimals)
+        df['lp_supply'] = column([record.get('lp_supply', 0) for record in history], self.lp_decimals)
+        if history:
+            option_balances = np.vstack([record['option_balances'] for record in history])
+            option_prices = np.vstack([record['option_prices'] for record in history])
+            for i in range(self.num_options):
+                df[f'user_o{i + 1}_balance'] = column(option_balances[:, i], self.option_decimals[i])
+                df[f'o{i + 1}_price'] = column(option_prices[:, i], PRICE_DECIMALS)
+        df['operation_id'] = range(start, start + len(df))
+        return df
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量运行的检查点
+
+长时间的批量运行定期把运行状态写入检查点目录：随机数生成器状态、当前步数、
+已发送但尚未确认的交易、最后一次快照、运行统计和操作历史的写入位置。
+操作历史按增量追加到 history.pkl，状态文件通过临时文件加 os.replace 原子替换，
+进程在任意时刻中断后都能读到一致的检查点。
+
+恢复时先读回历史和统计，再按链上结果补记中断前已发送的交易，然后从下一步继续，
+随机数生成器从保存的状态继续，后续的操作选择与未中断时一致。
+"""
+
+import os
+import pickle
+import time
+from typing import Any, Dict, List, Optional
+
+CHECKPOINT_VERSION = 1
+
+DEFAULT_CHECKPOINT_DIR = os.path.join('checkpoints', 'batch_run')
+
+
+class RunCheckpoint:
+    """批量运行的检查点读写"""
+
+    def __init__(self, directory: str = DEFAULT_CHECKPOINT_DIR, every: int = 10):
+        """
+        Args:
+            directory: 检查点目录
+            every: 没有待确认交易时每隔多少步保存一次
+        """
+        self.directory = directory
+        self.every = max(1, int(every))
+        self.state_path = os.path.join(directory, 'state.pkl')
+        self.history_path = os.path.join(directory, 'history.pkl')
+        self.total_steps = 0
+        self.operation_weights: Dict[str, int] = {}
+        self.history_offset = 0
+
+    def exists(self) -> bool:
+        """是否有未完成的运行"""
+        return os.path.exists(self.state_path)
+
+    # ========== 保存 ==========
+
+    def start(self, operator, total_steps: int, operation_weights: Dict[str, int], seed: Optional[int] = None):
+        """
+        开始新的运行，清除旧检查点并保存第0步
+
+        Args:
+            operator: ChainContractOperator
+            total_steps: 总步数
+            operation_weights: 操作权重
+            seed: 随机种子，None时沿用操作器当前的随机状态
+        """
+        self.finish()
+        os.makedirs(self.directory, exist_ok=True)
+        if seed is not None:
+            operator.rng.seed(seed)
+        self.total_steps = total_steps
+        self.operation_weights = dict(operation_weights)
+        # 已有的历史（例如初始化快照）也写入检查点，恢复后历史完整
+        self.history_offset = 0
+        self.save(operator, 0)
+
+    def _append_history(self, records: List[dict]):
+        if records:
+            with open(self.history_path, 'ab') as f:
+                pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def save(self, operator, step: int, pending: Optional[Dict[str, Any]] = None):
+        """
+        保存检查点
+
+        Args:
+            operator: ChainContractOperator
+            step: 下一步的序号；有待确认交易时为该交易所在的步
+            pending: 待确认交易 {'operation', 'amount', 'tx_hash'}
+        """
+        history = operator.operation_history
+        # 先追加历史，再替换状态文件；中断在两者之间时多出的历史会在恢复时截掉
+        self._append_history(history[self.history_offset:])
+        self.history_offset = len(history)
+
+        last_snapshot, _ = operator.get_last_state()
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'saved_at': time.time(),
+            'total_steps': self.total_steps,
+            'operation_weights': self.operation_weights,
+            'step': step,
+            'rng_state': operator.rng.getstate(),
+            'pending': pending,
+            'last_snapshot': last_snapshot,
+            'history_offset': self.history_offset,
+            'stats': operator.stats,
+        }
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.state_path)
+
+    def maybe_save(self, operator, step: int):
+        """每 every 步保存一次"""
+        if step % self.every == 0 or step >= self.total_steps:
+            self.save(operator, step)
+
+    def finish(self):
+        """运行结束，删除检查点文件"""
+        for path in (self.state_path, self.state_path + '.tmp', self.history_path, self.history_path + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # ========== 恢复 ==========
+
+    def load(self) -> Dict[str, Any]:
+        """读取状态文件"""
+        with open(self.state_path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"不支持的检查点版本: {state.get('version')}")
+        return state
+
+    def _load_history(self, offset: int) -> List[dict]:
+        records: List[dict] = []
+        if not os.path.exists(self.history_path):
+            return records
+        with open(self.history_path, 'rb') as f:
+            while len(records) < offset:
+                try:
+                    records.extend(pickle.load(f))
+                except (EOFError, pickle.UnpicklingError):
+                    # 最后一块可能在写入时中断
+                    break
+        return records[:offset]
+
+    def restore(self, operator) -> Dict[str, Any]:
+        """
+        把检查点恢复到操作器：操作历史、运行统计和随机数生成器状态
+
+        Args:
+            operator: 新创建的 ChainContractOperator
+
+        Returns:
+            状态字典
+        """
+        state = self.load()
+        records = self._load_history(state['history_offset'])
+        if len(records) < state['history_offset']:
+            raise ValueError(f"历史记录不完整: 需要 {state['history_offset']} 条，只读到 {len(records)} 条")
+        # 原地替换，保留操作器自己的历史容器（例如会话的溢出历史）
+        operator.operation_history.clear()
+        operator.operation_history.extend(records)
+        operator.stats = state['stats']
+        operator.rng.setstate(state['rng_state'])
+        self.total_steps = state['total_steps']
+        self.operation_weights = state['operation_weights']
+        self.history_offset = state['history_offset']
+        # 重写历史文件，去掉中断时多写的部分；先写临时文件再替换，重写中途中断时原文件仍然完整
+        temp_path = self.history_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            if records:
+                pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.history_path)
+        return state
+
+    def resume(self, operator, timeout: int = 60) -> int:
+        """
+        恢复检查点并补记中断前已发送的交易
+
+        Args:
+            operator: 新创建的 ChainContractOperator
+            timeout: 等待待确认交易的超时时间（秒）
+
+        Returns:
+            继续运行的起始步
+        """
+        state = self.restore(operator)
+        pending = state['pending']
+        if pending is None:
+            return state['step']
+
+        fallback = state['last_snapshot'] or operator.get_current_balances()
+        operator.reconcile_transaction(pending['operation'], pending['amount'], pending['tx_hash'],
+                                       fallback, timeout=timeout)
+        next_step = state['step'] + 1
+        self.save(operator, next_step)
+        return next_step
@@ -1,12 +1,29 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
+import numpy as np
+import os
 import random
+import tempfile
 import time
+import uuid
 from datetime import datetime
-from web3 import Web3
-from prediction_contract import PredictionContract
-from erc20_contract import ERC20Contract
+from chain_operator import ChainContractOperator, PRICE_DECIMALS, operation_label, parse_operation, receipt_gas_used
+from checkpoint import DEFAULT_CHECKPOINT_DIR, RunCheckpoint
+from history_export import EXPORT_FORMATS, export_history, summary_csv
+from instrumentation import registry
+from invariants import InvariantChecker
+from lp_analytics import LPAnalytics
+from page_profiler import PageProfiler
+from pool_monitor import PoolMonitor, RAW_RESOLUTION, ROLLUP_TIERS
+from pool_model import PoolModel
+from price_surface import PriceSurfaceGenerator
+from session_manager import DEFAULT_HISTORY_LIMIT, DEFAULT_IDLE_SECONDS, SessionManager
+from settlement import SettlementSimulator
+from utils import format_amount, to_wei
+
+# 各选项曲线的颜色
+PRICE_COLORS = ['teal', 'darkorange', 'crimson', 'olive', 'steelblue', 'goldenrod', 'slategray', 'orchid']
 
 # 配置Streamlit页面
 st.set_page_config(
@@ -41,440 +58,17 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# 链上合约操作类
-class ChainContractOperator:
-    def __init__(self, rpc_url, prediction_address, base_token_address, 
-                 account_address, account_private_key, 
-                 lp_provider_address, lp_provider_private_key):
-        # 从参数接收配置
-        self.RPC_URL = rpc_url
-        self.PREDICTION_CONTRACT_ADDRESS = prediction_address
-        self.BASE_TOKEN_ADDRESS = base_token_address
-        self.ACCOUNT_ADDRESS = account_address
-        self.ACCOUNT_PRIVATE_KEY = account_private_key
-        self.LP_PROVIDER_ADDRESS = lp_provider_address
-        self.LP_PROVIDER_PRIVATE_KEY = lp_provider_private_key
-
-        self.operation_history = []
-        self.init_contracts()
-    
-    def init_contracts(self):
-        """初始化合约连接"""
-        try:
-            # 初始化Web3连接
-            self.web3 = Web3(Web3.HTTPProvider(self.RPC_URL))
-            
-            if not self.web3.is_connected():
-                st.error("❌ Web3连接失败！")
-                return False
-            
-            # 创建合约实例
-            self.prediction_for_trade = PredictionContract(
-                web3=self.web3,
-                prediction_address=self.PREDICTION_CONTRACT_ADDRESS,
-                private_key=self.ACCOUNT_PRIVATE_KEY,
-                account_address=self.ACCOUNT_ADDRESS
-            )
-
-            self.prediction_for_lp_send = PredictionContract(
-                web3=self.web3,
-                prediction_address=self.PREDICTION_CONTRACT_ADDRESS,
-                private_key=self.LP_PROVIDER_PRIVATE_KEY,
-                account_address=self.LP_PROVIDER_ADDRESS
-            )
-            
-            self.base_token = ERC20Contract(
-                web3=self.web3,
-                token_address=self.BASE_TOKEN_ADDRESS,
-                private_key=self.ACCOUNT_PRIVATE_KEY,
-                account_address=self.ACCOUNT_ADDRESS
-            )
-
-            self.base_token_for_lp = ERC20Contract(
-                web3=self.web3,
-                token_address=self.BASE_TOKEN_ADDRESS,
-                private_key=self.LP_PROVIDER_PRIVATE_KEY,
-                account_address=self.LP_PROVIDER_ADDRESS
-            )
-
-            self.prediction_lp = ERC20Contract(
-                web3=self.web3,
-                token_address=self.PREDICTION_CONTRACT_ADDRESS,
-                private_key=self.LP_PROVIDER_PRIVATE_KEY,
-                account_address=self.LP_PROVIDER_ADDRESS
-            )
-
-            options = self.prediction_for_trade.get_options()
-
-            self.owner = self.prediction_for_trade.get_owner()
-
-            self.o1 = ERC20Contract(
-                web3=self.web3,
-                token_address=options[0],
-                private_key=self.ACCOUNT_PRIVATE_KEY,
-                account_address=self.ACCOUNT_ADDRESS
-            )
-
-            self.o2 = ERC20Contract(
-                web3=self.web3,
-                token_address=options[1],
-                private_key=self.ACCOUNT_PRIVATE_KEY,
-                account_address=self.ACCOUNT_ADDRESS
-            )
-
-
-
-            
-            st.success("✅ 合约连接成功！")
-
-            account_allowance = self.base_token.get_allowance(self.ACCOUNT_ADDRESS, self.PREDICTION_CONTRACT_ADDRESS)
-
-            lp_allowance = self.base_token_for_lp.get_allowance(self.LP_PROVIDER_ADDRESS, self.PREDICTION_CONTRACT_ADDRESS)
-
-            if account_allowance < 100000000000000000000000000000000000000:
-                st.success("开始approve交易账户")
-
-                tx_hash = self.base_token.approve(self.PREDICTION_CONTRACT_ADDRESS, 1000000000000000000000000000000000000000)
-
-                tx_success, receipt = self.wait_for_transaction(tx_hash)
-                if tx_success:
-                    st.code(f"approve for trade hash: {tx_hash}")
-                    
-                    st.success("✅ approve for trade success")
-                
-                else:
-                    st.error("❌ approve for trade failed")
-                    return False
-            
-            if lp_allowance < 100000000000000000000000000000000000000:
-                st.success("开始approveLP提供者账户")
-
-                tx_hash = self.base_token_for_lp.approve(self.PREDICTION_CONTRACT_ADDRESS, 1000000000000000000000000000000000000000)
-
-                tx_success, receipt = self.wait_for_transaction(tx_hash)
-                if tx_success:
-                    st.code(f"approve for lp hash: {tx_hash}")
-                    
-                    st.success("✅ approve for lp success")
-                    
-                else:
-                    st.error("❌ approve for lp failed")
-                    return False
-
-            st.success("✅ 合约初始化成功！")
-
-            return True
-            
-        except Exception as e:
-            st.error(f"❌ 合约初始化失败: {str(e)}")
-            return False
-    
-    def get_current_balances(self):
-        """获取当前链上余额 - 协程并发版本"""
-        import asyncio
-        import time
-        
-        def run_concurrent_queries():
-            """使用协程并发查询所有余额"""
-            async def query_all():
-                loop = asyncio.get_event_loop()
-                
-                # 创建所有查询任务
-                tasks = [
-                    loop.run_in_executor(None, self.base_token.get_balance_of, self.PREDICTION_CONTRACT_ADDRESS),
-                    loop.run_in_executor(None, self.base_token.get_balance_of, self.ACCOUNT_ADDRESS),
-                    loop.run_in_executor(None, self.base_token_for_lp.get_balance_of, self.LP_PROVIDER_ADDRESS),
-                    loop.run_in_executor(None, self.base_token.get_balance_of, self.owner),
-                    loop.run_in_executor(None, self.o1.get_balance_of, self.ACCOUNT_ADDRESS),
-                    loop.run_in_executor(None, self.o2.get_balance_of, self.ACCOUNT_ADDRESS),
-                    loop.run_in_executor(None, self.prediction_for_trade.get_price, 0),
-                    loop.run_in_executor(None, self.prediction_for_trade.get_price, 1),
-                    loop.run_in_executor(None, self.prediction_lp.get_balance_of, self.LP_PROVIDER_ADDRESS)
-                ]
-                
-                # 并发执行所有查询
-                return await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 尝试运行协程
-            try:
-                return asyncio.run(query_all())
-            except RuntimeError:
-                # 如果在已有事件循环中，使用nest_asyncio
-                try:
-                    import nest_asyncio
-                    nest_asyncio.apply()
-                    return asyncio.run(query_all())
-                except ImportError:
-                    return None
-        
-        try:
-            start_time = time.time()
-            
-            # 尝试协程并发查询
-            results = run_concurrent_queries()
-            
-            if results is None:
-                # 协程失败，回退到同步方式
-                st.warning("⚠️ 协程环境不支持，使用同步查询")
-                return self._get_balances_sync()
-            
-            end_time = time.time()
-            
-            # 处理结果
-            (pool_balance, user_balance, lp_provider_balance, owner_balance, 
-             user_o1_balance, user_o2_balance, o1_price_raw, 
-             o2_price_raw, lp_balance) = results
-            
-            # 检查是否有异常
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    st.warning(f"⚠️ 查询第{i+1}项失败: {str(result)}")
-                    results[i] = 0  # 设置默认值
-            
-            st.info(f"⚡ 并发查询完成，耗时: {end_time - start_time:.2f}秒")
-            
-            return {
-                'pool_balance': int(pool_balance) / 1e6,
-                'user_balance': int(user_balance) / 1e6,
-                'lp_provider_balance': int(lp_provider_balance) / 1e6,
-                'owner_balance': int(owner_balance) / 1e6,
-                'user_o1_balance': int(user_o1_balance) / 1e6,
-                'user_o2_balance': int(user_o2_balance) / 1e6,
-                'user_lp_balance': int(lp_balance) / 1e6,
-                'o1_price': int(o1_price_raw) / 1e6,
-                'o2_price': int(o2_price_raw) / 1e6
-            }
-        except Exception as e:
-            st.error(f"❌ 协程查询失败，回退到同步方式: {str(e)}")
-            return self._get_balances_sync()
-    
-    def _get_balances_sync(self):
-        """同步方式获取余额 - 作为备用方案"""
-        try:
-            # 获取池子余额
-            pool_balance = self.base_token.get_balance_of(self.PREDICTION_CONTRACT_ADDRESS)
-            # 获取用户余额
-            user_balance = self.base_token.get_balance_of(self.ACCOUNT_ADDRESS)
-            # 获取LP提供者余额
-            lp_provider_balance = self.base_token_for_lp.get_balance_of(self.LP_PROVIDER_ADDRESS)
-            # 获取owner余额
-            owner_balance = self.base_token.get_balance_of(self.owner)
-            # 获取用户的o1、o2代币余额
-            user_o1_balance = self.o1.get_balance_of(self.ACCOUNT_ADDRESS)
-            user_o2_balance = self.o2.get_balance_of(self.ACCOUNT_ADDRESS)
-            # 获取价格
-            o1_price_raw = self.prediction_for_trade.get_price(0)
-            o2_price_raw = self.prediction_for_trade.get_price(1)
-            # 获取lp代币余额
-            lp_balance = self.prediction_lp.get_balance_of(self.LP_PROVIDER_ADDRESS)
-            
-            return {
-                'pool_balance': int(pool_balance) / 1e6,
-                'user_balance': int(user_balance) / 1e6,
-                'lp_provider_balance': int(lp_provider_balance) / 1e6,
-                'owner_balance': int(owner_balance) / 1e6,
-                'user_o1_balance': int(user_o1_balance) / 1e6,
-                'user_o2_balance': int(user_o2_balance) / 1e6,
-                'user_lp_balance': int(lp_balance) / 1e6,
-                'o1_price': int(o1_price_raw) / 1e6,
-                'o2_price': int(o2_price_raw) / 1e6
-            }
-        except Exception as e:
-            st.error(f"❌ 同步查询也失败: {str(e)}")
-            return None
-    
-    def calculate_prices(self, balances):
-        """从余额中提取价格信息"""
-        if not balances:
-            return {'o1_price': 0, 'o2_price': 0}
-        
-        return {
-            'o1_price': balances['o1_price'],
-            'o2_price': balances['o2_price']
-        }
-    
-    def get_available_operations(self, balances):
-        """根据当前余额确定可执行的操作"""
-        available_ops = []
-        
-        # Deposit: 需要用户有BaseToken余额
-        if balances['user_balance'] > 1:  # 至少1 USDC才能deposit
-            available_ops.append('deposit_o1')  # deposit到option 0
-            available_ops.append('deposit_o2')  # deposit到option 1
-        
-        # Add Liquidity: 需要LP提供者有BaseToken余额  
-        if balances['lp_provider_balance'] > 1:
-            available_ops.append('add_liquidity')
-        
-        # Remove Liquidity: 需要用户有LP代币
-        if balances['user_lp_balance'] > 0.1:  # 至少0.1个LP代币
-            available_ops.append('remove_liquidity')
-        
-        # Withdraw o1: 需要用户有o1代币
-        if balances['user_o1_balance'] > 0.1:  # 至少0.1个o1代币
-            available_ops.append('withdraw_o1')
-            
-        # Withdraw o2: 需要用户有o2代币
-        if balances['user_o2_balance'] > 0.1:  # 至少0.1个o2代币
-            available_ops.append('withdraw_o2')
-        
-        return available_ops
-    
-    def deposit_o1(self, amount_usdc):
-        """向option 0 (O1) 存入BaseToken"""
-        try:
-            amount_wei = int(amount_usdc * 1e6)
-            # deposit(option_out, delta, min_receive)
-            tx_hash = self.prediction_for_trade.deposit(0, amount_wei, 0)  # option_out = 0 (O1)
-            return tx_hash, True
-        except Exception as e:
-            st.error(f"❌ Deposit O1失败: {str(e)}")
-            return None, False
-    
-    def deposit_o2(self, amount_usdc):
-        """向option 1 (O2) 存入BaseToken"""
-        try:
-            amount_wei = int(amount_usdc * 1e6)
-            # deposit(option_out, delta, min_receive)  
-            tx_hash = self.prediction_for_trade.deposit(1, amount_wei, 0)  # option_out = 1 (O2)
-            return tx_hash, True
-        except Exception as e:
-            st.error(f"❌ Deposit O2失败: {str(e)}")
-            return None, False
-
-    def withdraw_o1(self, amount_usdc):
-        """从option 0 (O1) 提取到BaseToken"""
-        try:
-            amount_wei = int(amount_usdc * 1e6)
-            # withdraw(option_in, delta, min_receive)
-            tx_hash = self.prediction_for_trade.withdraw(0, amount_wei, 0)  # option_in = 0 (O1)
-            return tx_hash, True
-        except Exception as e:
-            st.error(f"❌ Withdraw O1失败: {str(e)}")
-            return None, False
-    
-    def withdraw_o2(self, amount_usdc):
-        """从option 1 (O2) 提取到BaseToken"""
-        try:
-            amount_wei = int(amount_usdc * 1e6)
-            # withdraw(option_in, delta, min_receive)
-            tx_hash = self.prediction_for_trade.withdraw(1, amount_wei, 0)  # option_in = 1 (O2)
-            return tx_hash, True
-        except Exception as e:
-            st.error(f"❌ Withdraw O2失败: {str(e)}")
-            return None, False
-
-    def add_liquidity(self, amount_usdc):
-        """添加流动性"""
-        try:
-            amount_wei = int(amount_usdc * 1e6)
-            tx_hash = self.prediction_for_lp_send.add_liquidity(amount_wei, self.LP_PROVIDER_ADDRESS)
-            return tx_hash, True
-        except Exception as e:
-            st.error(f"❌ Add Liquidity失败: {str(e)}")
-            return None, False
-    
-    def remove_liquidity(self, amount_usdc):
-        """移除流动性"""
-        try:
-            amount_wei = int(amount_usdc * 1e6)
-            tx_hash = self.prediction_for_lp_send.remove_liquidity(amount_wei)
-            return tx_hash, True
-        except Exception as e:
-            st.error(f"❌ Remove Liquidity失败: {str(e)}")
-            return None, False
-    
-    def get_smart_operation_amount(self, operation, balances):
-        """根据操作类型和当前余额智能确定操作金额"""
-        if operation in ['deposit_o1', 'deposit_o2']:
-            # Deposit: 用户余额的5%-20%
-            max_amount = balances['user_balance'] * 0.2
-            min_amount = min(1.0, balances['user_balance'] * 0.05)
-            return random.uniform(min_amount, max_amount)
-            
-        elif operation == 'add_liquidity':
-            # Add Liquidity: LP提供者余额的5%-15%
-            max_amount = balances['lp_provider_balance'] * 0.15
-            min_amount = min(1.0, balances['lp_provider_balance'] * 0.05)
-            return random.uniform(min_amount, max_amount)
-            
-        elif operation == 'remove_liquidity':
-            # Remove Liquidity: 基于LP代币余额，最多移除一半
-            max_removable = max(0, balances['user_lp_balance'] - 0.1)  # 保留0.1个LP代币
-            max_amount = min(max_removable * 0.5, max_removable)  # 最多移除一半
-            min_amount = min(0.1, max_amount)
-            return random.uniform(min_amount, max_amount) if max_amount > min_amount else min_amount
-            
-        elif operation == 'withdraw_o1':
-            # Withdraw O1: 最多卖一半，但至少保留0.1个代币
-            max_sellable = max(0, balances['user_o1_balance'] - 0.1)
-            max_amount = min(max_sellable * 0.5, max_sellable)  # 最多卖一半
-            min_amount = min(0.1, max_amount)
-            return random.uniform(min_amount, max_amount) if max_amount > min_amount else min_amount
-            
-        elif operation == 'withdraw_o2':
-            # Withdraw O2: 最多卖一半，但至少保留0.1个代币
-            max_sellable = max(0, balances['user_o2_balance'] - 0.1) 
-            max_amount = min(max_sellable * 0.5, max_sellable)  # 最多卖一半
-            min_amount = min(0.1, max_amount)
-            return random.uniform(min_amount, max_amount) if max_amount > min_amount else min_amount
-            
-        else:
-            return random.uniform(1.0, 10.0)  # 默认值
-    
-    def wait_for_transaction(self, tx_hash, timeout=120):
-        """等待交易确认并返回结果"""
-        try:
-            st.info(f"⏳ 等待交易确认... ({tx_hash[:10]}...)")
-            receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
-            
-            if receipt.status == 1:
-                st.success(f"✅ 交易成功确认！Gas使用: {receipt.gasUsed:,}")
-                return True, receipt
-            else:
-                st.error(f"❌ 交易失败！状态: {receipt.status}")
-                return False, receipt
-                
-        except Exception as e:
-            st.error(f"❌ 等待交易确认失败: {str(e)}")
-            return False, None
-    
-    def get_last_state(self):
-        """获取上一个状态的余额和价格数据"""
-        if len(self.operation_history) > 0:
-            last_record = self.operation_history[-1]
-            return {
-                'pool_balance': last_record['pool_balance'],
-                'user_balance': last_record['user_balance'],
-                'lp_provider_balance': last_record['lp_provider_balance'],
-                'owner_balance': last_record['owner_balance'],
-                'user_o1_balance': last_record['user_o1_balance'],
-                'user_o2_balance': last_record['user_o2_balance'],
-                'user_lp_balance': last_record['user_lp_balance']
-            }, {
-                'o1_price': last_record['o1_price'],
-                'o2_price': last_record['o2_price']
-            }
-        return None, None
-
-    def record_operation(self, operation_type, amount, tx_hash, success, balances, prices):
-        """记录操作历史"""
-        self.operation_history.append({
-            'timestamp': datetime.now(),
-            'operation': operation_type,
-            'amount': amount,
-            'tx_hash': tx_hash,
-            'success': success,
-            'pool_balance': balances['pool_balance'] if balances else 0,
-            'user_balance': balances['user_balance'] if balances else 0,
-            'lp_provider_balance': balances['lp_provider_balance'] if balances else 0,
-            'owner_balance': balances['owner_balance'] if balances else 0,
-            'user_o1_balance': balances['user_o1_balance'] if balances else 0,  # 保留用于内部逻辑
-            'user_o2_balance': balances['user_o2_balance'] if balances else 0,  # 保留用于内部逻辑
-            'user_lp_balance': balances['user_lp_balance'] if balances else 0,  # LP代币余额
-            'o1_price': prices['o1_price'] if prices else 0,
-            'o2_price': prices['o2_price'] if prices else 0
-        })
+# 页面性能分析（可选），数据跨重跑保存在会话中
+if 'page_profiler' not in st.session_state:
+    st.session_state.page_profiler = PageProfiler()
+page_profiler = st.session_state.page_profiler
+page_profiler.set_enabled(st.sidebar.checkbox(
+    "🔬 页面性能分析",
+    value=False,
+    help="记录每次页面重跑中各区块的耗时和内存分配，结果显示在页面底部"
+))
+page_profiler.begin_run()
+page_profiler.mark('config')
 
 # Streamlit 应用
 st.title("🔗 预测市场合约模拟测试.")
@@ -490,7 +84,7 @@ with st.expander("📝 配置参数", expanded=False):
         st.subheader("🌐 网络配置")
         rpc_url = st.text_input(
             "tenderly的测试的RPC节点地址", 
-            help="tenderly的测试的RPC节点地址"
+            help="tenderly的测试的RPC节点地址；多个节点用逗号分隔时自动故障转移，慢请求会向第二个节点对冲"
         )
         
         prediction_address = st.text_input(
@@ -502,6 +96,19 @@ with st.expander("📝 配置参数", expanded=False):
             "基础代币地址", 
             help="Point代币的合约地址"
         )
+        
+        ws_url = st.text_input(
+            "WebSocket节点地址(可选)",
+            help="填写后订阅新区块和合约日志，余额快照和交易确认由区块推送，不再轮询RPC"
+        )
+        
+        rpc_calls_per_second = st.number_input(
+            "RPC调用上限(次/秒，0为不限)",
+            min_value=0.0,
+            value=0.0,
+            step=1.0,
+            help="按节点的限流额度设置，超出时自动排队；遇到429会退避重试"
+        )
     
     with col2:
         st.subheader("👤 账户配置")
@@ -527,6 +134,28 @@ with st.expander("📝 配置参数", expanded=False):
             help="LP提供者的私钥"
         )
 
+# 会话状态中只保存会话ID，操作器由进程内共享的会话管理器持有
+@st.cache_resource
+def get_session_manager():
+    """进程内共享的会话管理器，内存上限、空闲超时和溢出目录可由环境变量配置"""
+    return SessionManager(
+        history_limit=int(os.environ.get('SESSION_HISTORY_LIMIT', DEFAULT_HISTORY_LIMIT)),
+        idle_seconds=float(os.environ.get('SESSION_IDLE_SECONDS', DEFAULT_IDLE_SECONDS)),
+        spill_dir=os.environ.get('SESSION_SPILL_DIR') or None,
+    )
+
+
+session_manager = get_session_manager()
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
+operator = session_manager.get(session_id)
+if operator is None and st.session_state.get('session_opened'):
+    # 会话空闲超时已被回收，清除依赖旧操作器的页面状态
+    for key in ('session_opened', 'current_balances', 'settlement', 'settlement_result'):
+        st.session_state.pop(key, None)
+    st.warning("⌛ 会话空闲时间过长已被回收，请重新初始化合约连接")
+
 # 检查配置完整性
 config_complete = all([rpc_url, prediction_address, base_token_address, 
                       account_address, account_private_key, 
@@ -542,48 +171,133 @@ with col1:
         st.error("❌ 请填写所有配置参数！")
 
 with col2:
-    if 'operator' in st.session_state:
+    if operator is not None:
         if st.button("🔄 重新初始化", type="secondary", use_container_width=True):
-            # 清除现有的操作器和余额缓存
-            del st.session_state.operator
-            if 'current_balances' in st.session_state:
-                del st.session_state.current_balances
+            # 关闭会话的操作器并清除余额缓存
+            session_manager.close(session_id)
+            operator = None
+            for key in ('session_opened', 'current_balances', 'settlement', 'settlement_result'):
+                st.session_state.pop(key, None)
             st.rerun()
 
+
+def create_operator(config):
+    """创建并连接操作器，供相同配置的会话共用"""
+    created = ChainContractOperator(**config)
+    # 尝试初始化合约连接
+    if not created.init_contracts():
+        created.close()
+        raise RuntimeError("合约初始化失败！")
+    return created
+
+
 # 初始化合约操作器
-if config_complete and 'operator' not in st.session_state and 'init_button' in locals() and init_button:
+if config_complete and operator is None and 'init_button' in locals() and init_button:
     with st.spinner("正在初始化合约连接..."):
         try:
-            st.session_state.operator = ChainContractOperator(
+            operator = session_manager.open(session_id, dict(
                 rpc_url=rpc_url,
                 prediction_address=prediction_address,
                 base_token_address=base_token_address,
                 account_address=account_address,
                 account_private_key=account_private_key,
                 lp_provider_address=lp_provider_address,
-                lp_provider_private_key=lp_provider_private_key
-            )
-            
-            # 尝试初始化合约连接
-            if st.session_state.operator.init_contracts():
-                st.success("✅ 合约初始化成功！")
-            else:
-                st.error("❌ 合约初始化失败！")
-                del st.session_state.operator
-                st.stop()
-                
+                lp_provider_private_key=lp_provider_private_key,
+                rpc_calls_per_second=rpc_calls_per_second or None,
+                ws_url=ws_url or None
+            ), create_operator)
+            st.session_state.session_opened = True
+            st.success("✅ 合约初始化成功！")
         except Exception as e:
             st.error(f"❌ 初始化错误: {str(e)}")
-            if 'operator' in st.session_state:
-                del st.session_state.operator
             st.stop()
 
+# 只读池子监控：不需要账户私钥，只要填写RPC节点即可使用
+page_profiler.mark('pool_monitor')
+with st.expander("🛰️ 池子监控（只读）", expanded='pool_monitor' in st.session_state):
+    monitor_addresses = st.text_area(
+        "监控的池子地址（每行一个）",
+        value=prediction_address or "",
+        help="持续采样价格、储备、state和池子余额，不发送交易；数据保存在定长缓冲区中，可长期运行"
+    )
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        monitor_interval = st.number_input("采样间隔(秒)", min_value=1.0, value=5.0, step=1.0,
+                                           help="填写了WebSocket节点时改为每个区块采样一次")
+    with col2:
+        monitor_resolution = st.selectbox("时间粒度", [RAW_RESOLUTION] + [name for name, _, _ in ROLLUP_TIERS])
+    with col3:
+        monitor_field = st.selectbox("聚合取值", ['mean', 'min', 'max', 'last'],
+                                     disabled=monitor_resolution == RAW_RESOLUTION)
+    
+    pool_monitor = st.session_state.get('pool_monitor')
+    col1, col2 = st.columns(2)
+    with col1:
+        addresses = [line.strip() for line in monitor_addresses.splitlines() if line.strip()]
+        if st.button("▶️ 开始监控", use_container_width=True, disabled=not (rpc_url and addresses)):
+            from web3 import Web3
+            
+            from failover_provider import make_provider
+            
+            if pool_monitor is not None:
+                pool_monitor.stop()
+            try:
+                pool_monitor = PoolMonitor(Web3(make_provider(rpc_url)), addresses)
+                if ws_url:
+                    pool_monitor.start_subscription(ws_url)
+                else:
+                    pool_monitor.start(monitor_interval)
+                st.session_state.pool_monitor = pool_monitor
+            except Exception as e:
+                st.error(f"❌ 启动监控失败: {str(e)}")
+                pool_monitor = None
+    with col2:
+        if pool_monitor is not None and st.button("⏹️ 停止监控", use_container_width=True):
+            pool_monitor.stop()
+    
+    if pool_monitor is not None:
+        status = "运行中" if pool_monitor.running else "已停止"
+        st.caption(f"{status} · 已采样 {pool_monitor.samples} 次 · 缓冲区 {pool_monitor.nbytes / 1024:.0f} KB（固定）")
+        if pool_monitor.last_error:
+            st.warning(f"⚠️ 最近一次采样失败: {pool_monitor.last_error}")
+        
+        from plotly.subplots import make_subplots
+        
+        for address, pool in pool_monitor.pools.items():
+            monitor_df = pool_monitor.frame(address, monitor_resolution, monitor_field)
+            latest = pool_monitor.latest(address)
+            st.markdown(f"**{address}** · state: {int(latest['state']) if latest else '-'}")
+            if monitor_df.empty:
+                st.info("💡 暂无样本")
+                continue
+            
+            monitor_fig = make_subplots(rows=1, cols=3, subplot_titles=('池子余额', '选项价格', '选项储备'))
+            monitor_fig.add_trace(go.Scatter(
+                x=monitor_df['time'], y=monitor_df['pool_balance'], mode='lines',
+                name='池子余额 (USDC)', line=dict(color='blue', width=2)
+            ), row=1, col=1)
+            for i in range(pool.num_options):
+                color = PRICE_COLORS[i % len(PRICE_COLORS)]
+                monitor_fig.add_trace(go.Scatter(
+                    x=monitor_df['time'], y=monitor_df[f'o{i + 1}_price'], mode='lines',
+                    name=f'O{i + 1}价格', line=dict(color=color, width=2)
+                ), row=1, col=2)
+                monitor_fig.add_trace(go.Scatter(
+                    x=monitor_df['time'], y=monitor_df[f'o{i + 1}_reserve'], mode='lines',
+                    name=f'O{i + 1}储备', line=dict(color=color, width=2, dash='dot')
+                ), row=1, col=3)
+            monitor_fig.update_layout(height=350, showlegend=True, hovermode='x unified')
+            st.plotly_chart(monitor_fig, use_container_width=True)
+
 # 检查是否已初始化
-if 'operator' not in st.session_state:
+if operator is None:
     st.info("💡 请配置参数并点击'初始化合约连接'开始使用")
     st.stop()
 
-operator = st.session_state.operator
+session_summary = session_manager.summary()
+st.sidebar.caption(f"🧠 活动会话 {session_summary['sessions']} 个，共享连接 {session_summary['connections']} 个；"
+                   f"本会话历史 {operator.operation_history.in_memory} 条在内存，"
+                   f"{operator.operation_history.spilled} 条在磁盘")
 
 # 初始化时自动获取余额
 if 'current_balances' not in st.session_state:
@@ -596,18 +310,19 @@ if 'current_balances' not in st.session_state:
             operator.record_operation("初始化", 0, None, True, balances, prices)
             
             # 检查两个账户的point余额是否足够
-            min_required_balance = 10.0  # 设置最小需要的余额阈值
+            min_required_balance = 10 * 10 ** operator.base_decimals  # 设置最小需要的余额阈值
             
             if balances['user_balance'] < min_required_balance:
-                st.warning(f"⚠️ 交易账户point余额不足！当前余额: {balances['user_balance']} 先去tenderly领水领点point ")
+                st.warning(f"⚠️ 交易账户point余额不足！当前余额: {format_amount(balances['user_balance'], operator.base_decimals)} 先去tenderly领水领点point ")
             
             if balances['lp_provider_balance'] < min_required_balance:
-                st.warning(f"⚠️ LP提供者账户point余额不足！当前余额: {balances['lp_provider_balance ']} 先去tenderly领水领点point ")
+                st.warning(f"⚠️ LP提供者账户point余额不足！当前余额: {format_amount(balances['lp_provider_balance'], operator.base_decimals)} 先去tenderly领水领点point ")
             
             if balances['user_balance'] >= min_required_balance and balances['lp_provider_balance'] >= min_required_balance:
                 st.success("✅ 两个账户point余额充足，可以开始操作！")
 
 # 侧边栏配置
+page_profiler.mark('sidebar')
 st.sidebar.header("⚙️ 操作参数")
 
 # 显示当前余额
@@ -617,23 +332,38 @@ if st.sidebar.button("🔄 刷新余额"):
         if balances:
             st.session_state.current_balances = balances
 
+# 区块订阅模式下使用最新推送的快照
+subscription = operator.subscription
+pushed_block = None
+if subscription is not None:
+    pushed = subscription.latest()
+    if pushed is not None:
+        pushed_block, st.session_state.current_balances = pushed
+        st.sidebar.caption(f"📡 区块 {pushed_block} 推送 · 已收到 {subscription.heads} 个区块、{subscription.logs} 条日志")
+    elif subscription.last_error:
+        st.sidebar.warning(f"⚠️ 区块订阅异常: {subscription.last_error}")
+    follow_heads = st.sidebar.checkbox("📡 跟随新区块自动刷新", help="每个新区块到达后重跑页面")
+else:
+    follow_heads = False
+
 if 'current_balances' in st.session_state:
     balances = st.session_state.current_balances
     prices = operator.calculate_prices(balances)
     
-    st.sidebar.success(f"🏦 池子余额: {balances['pool_balance']} USDC")
-    st.sidebar.info(f"💰 交易账户余额: {balances['user_balance']} USDC")
+    base_decimals = operator.base_decimals
+    st.sidebar.success(f"🏦 池子余额: {format_amount(balances['pool_balance'], base_decimals)} USDC")
+    st.sidebar.info(f"💰 交易账户余额: {format_amount(balances['user_balance'], base_decimals)} USDC")
     
-    st.sidebar.info(f"🎯 交易账户O1代币余额: {balances['user_o1_balance']} O1")
-    st.sidebar.info(f"🎯 交易账户O2代币余额: {balances['user_o2_balance']} O2")
+    for i, option_balance in enumerate(balances['option_balances']):
+        st.sidebar.info(f"🎯 交易账户O{i + 1}代币余额: {format_amount(option_balance, operator.option_decimals[i])} O{i + 1}")
 
     
-    st.sidebar.success(f"🏪 LP提供者账户余额: {balances['lp_provider_balance']} USDC")
-    st.sidebar.success(f"🔗 LP提供者账户LP余额: {balances['user_lp_balance']}")
+    st.sidebar.success(f"🏪 LP提供者账户余额: {format_amount(balances['lp_provider_balance'], base_decimals)} USDC")
+    st.sidebar.success(f"🔗 LP提供者账户LP余额: {format_amount(balances['user_lp_balance'], operator.lp_decimals)}")
 
-    st.sidebar.info(f"👑 Owner余额: {balances['owner_balance']} USDC")
-    st.sidebar.metric("💰 O1价格", f"{prices['o1_price']} USDC")
-    st.sidebar.metric("💰 O2价格", f"{prices['o2_price']} USDC")
+    st.sidebar.info(f"👑 Owner余额: {format_amount(balances['owner_balance'], base_decimals)} USDC")
+    for i, option_price in enumerate(prices['option_prices']):
+        st.sidebar.metric(f"💰 O{i + 1}价格", f"{format_amount(option_price, PRICE_DECIMALS)} USDC")
     
     # 显示可用操作
     available_ops = operator.get_available_operations(balances)
@@ -647,14 +377,24 @@ num_operations = st.sidebar.slider("操作次数", min_value=1, max_value=1000,
 
 # 操作权重设置
 st.sidebar.subheader("操作权重")
-deposit_o1_weight = st.sidebar.slider("Deposit O1 权重", 0, 100, 30)
-deposit_o2_weight = st.sidebar.slider("Deposit O2 权重", 0, 100, 30)
-withdraw_o1_weight = st.sidebar.slider("Withdraw O1 权重", 0, 100, 25)
-withdraw_o2_weight = st.sidebar.slider("Withdraw O2 权重", 0, 100, 25)
-add_liquidity_weight = st.sidebar.slider("Add Liquidity 权重", 0, 100, 20)
-remove_liquidity_weight = st.sidebar.slider("Remove Liquidity 权重", 0, 100, 10)
+default_weights = {'deposit': 30, 'withdraw': 25, 'add_liquidity': 20, 'remove_liquidity': 10}
+operation_weights = {}
+for op_name in operator.operation_names():
+    kind, _ = parse_operation(op_name)
+    operation_weights[op_name] = st.sidebar.slider(f"{operation_label(op_name)} 权重", 0, 100, default_weights[kind])
+
+# 不变量检查：每记录一条历史检查一次，耗时超过预算时推迟
+if st.sidebar.checkbox("🛡️ 不变量检查", value=operator.invariants is not None,
+                       help="检查价格之和、基础代币守恒、往返不产生价值、手续费归owner和池子偿付能力，"
+                            "违规记录连同交易哈希保存；检查耗时控制在运行时间的5%以内"):
+    if operator.invariants is None:
+        operator.invariants = InvariantChecker()
+        operator.invariants.check(operator)
+else:
+    operator.invariants = None
 
 # 手动操作区域
+page_profiler.mark('manual_op')
 st.subheader("🎮 手动操作")
 col1, col2 = st.columns(2)
 
@@ -662,9 +402,11 @@ with col1:
     manual_amount = st.number_input("操作金额 (USDC)", value=10.0, min_value=0.0, format="%f")
     
 with col2:
-    manual_operation = st.selectbox("操作类型", ["deposit_o1", "deposit_o2", "withdraw_o1", "withdraw_o2", "add_liquidity", "remove_liquidity"])
+    manual_operation = st.selectbox("操作类型", operator.operation_names())
 
 if st.button("🚀 执行单次操作", type="primary"):
+    # 输入金额在此一次性换算为原始整数
+    manual_amount_wei = to_wei(manual_amount, operator.operation_decimals(manual_operation))
     with st.spinner(f"正在执行 {manual_operation}..."):
         # 获取操作前余额
         balances_before = operator.get_current_balances()
@@ -679,50 +421,30 @@ if st.button("🚀 执行单次操作", type="primary"):
             # 记录失败的操作 - 使用上一个状态的数据
             last_balances, last_prices = operator.get_last_state()
             if last_balances and last_prices:
-                operator.record_operation(manual_operation, manual_amount, None, False, last_balances, last_prices)
+                operator.record_operation(manual_operation, manual_amount_wei, None, False, last_balances, last_prices)
             else:
                 prices_before = operator.calculate_prices(balances_before)
-                operator.record_operation(manual_operation, manual_amount, None, False, balances_before, prices_before)
+                operator.record_operation(manual_operation, manual_amount_wei, None, False, balances_before, prices_before)
         else:
             # 执行操作
-            if manual_operation == 'deposit_o1':
-                tx_hash, success = operator.deposit_o1(manual_amount)
-            elif manual_operation == 'deposit_o2':
-                tx_hash, success = operator.deposit_o2(manual_amount)
-            elif manual_operation == 'withdraw_o1':
+            kind, option = parse_operation(manual_operation)
+            if kind == 'withdraw':
                 # 检查是否超过可卖数量
-                max_sellable = max(0, balances_before['user_o1_balance'] - 0.1) * 0.5
-                if manual_amount > max_sellable:
-                    st.error(f"❌ 超出最大可卖数量 {max_sellable}")
+                max_sellable = operator.max_sellable(option, balances_before)
+                if manual_amount_wei > max_sellable:
+                    st.error(f"❌ 超出最大可卖数量 {format_amount(max_sellable, operator.option_decimals[option])}")
                     success = False
                     # 记录失败的操作 - 使用上一个状态的数据
                     last_balances, last_prices = operator.get_last_state()
                     if last_balances and last_prices:
-                        operator.record_operation(manual_operation, manual_amount, None, False, last_balances, last_prices)
+                        operator.record_operation(manual_operation, manual_amount_wei, None, False, last_balances, last_prices)
                     else:
                         prices_before = operator.calculate_prices(balances_before)
-                        operator.record_operation(manual_operation, manual_amount, None, False, balances_before, prices_before)
+                        operator.record_operation(manual_operation, manual_amount_wei, None, False, balances_before, prices_before)
                 else:
-                    tx_hash, success = operator.withdraw_o1(manual_amount)
-            elif manual_operation == 'withdraw_o2':
-                # 检查是否超过可卖数量
-                max_sellable = max(0, balances_before['user_o2_balance'] - 0.1) * 0.5
-                if manual_amount > max_sellable:
-                    st.error(f"❌ 超出最大可卖数量 {max_sellable}")
-                    success = False
-                    # 记录失败的操作 - 使用上一个状态的数据
-                    last_balances, last_prices = operator.get_last_state()
-                    if last_balances and last_prices:
-                        operator.record_operation(manual_operation, manual_amount, None, False, last_balances, last_prices)
-                    else:
-                        prices_before = operator.calculate_prices(balances_before)
-                        operator.record_operation(manual_operation, manual_amount, None, False, balances_before, prices_before)
-                else:
-                    tx_hash, success = operator.withdraw_o2(manual_amount)
-            elif manual_operation == 'add_liquidity':
-                tx_hash, success = operator.add_liquidity(manual_amount)
-            elif manual_operation == 'remove_liquidity':
-                tx_hash, success = operator.remove_liquidity(manual_amount)
+                    tx_hash, success = operator.execute_operation(manual_operation, manual_amount_wei)
+            else:
+                tx_hash, success = operator.execute_operation(manual_operation, manual_amount_wei)
         
         # 等待交易确认
         if success and tx_hash:
@@ -736,7 +458,8 @@ if st.button("🚀 执行单次操作", type="primary"):
                 
                 # 记录操作
                 prices = operator.calculate_prices(balances_after)
-                operator.record_operation(manual_operation, manual_amount, tx_hash, True, balances_after, prices)
+                operator.record_operation(manual_operation, manual_amount_wei, tx_hash, True, balances_after, prices,
+                                          receipt_gas_used(receipt))
                 
                 # 更新余额显示
                 if balances_after:
@@ -745,126 +468,172 @@ if st.button("🚀 执行单次操作", type="primary"):
                 # 交易失败 - 使用上一个状态的数据
                 last_balances, last_prices = operator.get_last_state()
                 if last_balances and last_prices:
-                    operator.record_operation(manual_operation, manual_amount, tx_hash, False, last_balances, last_prices)
+                    operator.record_operation(manual_operation, manual_amount_wei, tx_hash, False, last_balances, last_prices,
+                                              receipt_gas_used(receipt))
                 else:
                     # 如果没有上一个状态，使用当前状态
                     prices_before = operator.calculate_prices(balances_before)
-                    operator.record_operation(manual_operation, manual_amount, tx_hash, False, balances_before, prices_before)
+                    operator.record_operation(manual_operation, manual_amount_wei, tx_hash, False, balances_before, prices_before,
+                                              receipt_gas_used(receipt))
 
 # 批量操作
+page_profiler.mark('batch')
 st.subheader("🔄 批量自动操作")
 
-if st.button("🚀 开始智能批量操作", type="secondary"):
-    if sum([deposit_o1_weight, deposit_o2_weight, withdraw_o1_weight, withdraw_o2_weight, add_liquidity_weight, remove_liquidity_weight]) == 0:
+# 断点续跑：定期保存检查点，中断后从检查点继续
+col1, col2, col3 = st.columns(3)
+with col1:
+    checkpoint_enabled = st.checkbox("💾 断点续跑", help="定期保存随机数状态、步数、待确认交易和操作历史，中断后可继续")
+with col2:
+    checkpoint_dir = st.text_input("检查点目录", value=DEFAULT_CHECKPOINT_DIR, disabled=not checkpoint_enabled)
+with col3:
+    checkpoint_every = st.number_input("每N步保存", min_value=1, max_value=100, value=10, disabled=not checkpoint_enabled)
+checkpoint = RunCheckpoint(checkpoint_dir, checkpoint_every) if checkpoint_enabled else None
+
+resume_button = False
+if checkpoint is not None and checkpoint.exists():
+    try:
+        saved = checkpoint.load()
+        pending_note = f"，待确认交易 {saved['pending']['tx_hash'][:10]}..." if saved['pending'] else ""
+        st.info(f"💾 发现未完成的运行：第 {saved['step']}/{saved['total_steps']} 步{pending_note}")
+        resume_button = st.button("⏯️ 继续上次运行", type="secondary")
+    except Exception as e:
+        st.warning(f"⚠️ 检查点无法读取: {str(e)}")
+
+start_button = st.button("🚀 开始智能批量操作", type="secondary")
+batch_range = None
+if resume_button:
+    with st.spinner("恢复检查点并核对待确认交易..."):
+        start_step = checkpoint.resume(operator, timeout=60)
+    batch_weights = checkpoint.operation_weights
+    batch_range = (start_step, checkpoint.total_steps)
+    st.success(f"✅ 已恢复 {len(operator.operation_history)} 条历史，从第 {start_step + 1} 步继续")
+elif start_button:
+    if sum(operation_weights.values()) == 0:
         st.error("❌ 请至少设置一个操作权重大于0")
     else:
+        batch_weights = operation_weights
+        batch_range = (0, num_operations)
+        if checkpoint is not None:
+            checkpoint.start(operator, num_operations, operation_weights)
+
+if batch_range is not None:
+    # 运行期间不被空闲回收
+    with session_manager.busy(session_id):
+        first_step, total_steps = batch_range
         # 创建进度条
-        progress_bar = st.progress(0)
+        progress_bar = st.progress(first_step / total_steps if total_steps else 0)
         status_text = st.empty()
-        
+    
         # 执行批量操作
-        for i in range(num_operations):
-            # 获取当前余额
-            current_balances = operator.get_current_balances()
-            if not current_balances:
+        for i in range(first_step, total_steps):
+            def show_status(operation, amount):
+                status_text.text(f'执行中: {operation} {format_amount(amount, operator.operation_decimals(operation))} ({i+1}/{total_steps})')
+        
+            def save_pending(operation, amount, tx_hash):
+                # 交易已发送、尚未确认时保存，中断后可按链上结果补记
+                checkpoint.save(operator, i, pending={'operation': operation, 'amount': amount, 'tx_hash': tx_hash})
+
+            # 快照、选择操作、执行、等待确认并记录（批量操作使用较短的超时时间）
+            step = operator.run_batch_step(batch_weights, timeout=60, on_selected=show_status,
+                                           on_sent=save_pending if checkpoint is not None else None)
+            if checkpoint is not None:
+                checkpoint.maybe_save(operator, i + 1)
+            if step['status'] == 'no_balances':
                 st.error("❌ 无法获取余额，停止操作")
                 break
-            
-            # 获取可用操作
-            available_ops = operator.get_available_operations(current_balances)
-            
-            if not available_ops:
+            if step['status'] == 'no_operations':
                 st.warning(f"⚠️ 第{i+1}次操作：没有可用操作，跳过")
                 continue
-            
-            # 根据权重和可用操作选择操作
-            operation_weights = {
-                'deposit_o1': deposit_o1_weight,
-                'deposit_o2': deposit_o2_weight,
-                'withdraw_o1': withdraw_o1_weight,
-                'withdraw_o2': withdraw_o2_weight,
-                'add_liquidity': add_liquidity_weight,
-                'remove_liquidity': remove_liquidity_weight
-            }
-            
-            # 只保留可用操作的权重
-            filtered_weights = {op: weight for op, weight in operation_weights.items() 
-                               if op in available_ops and weight > 0}
-            
-            if not filtered_weights:
+            if step['status'] == 'no_weighted':
                 st.warning(f"⚠️ 第{i+1}次操作：没有设置权重的可用操作，跳过")
                 continue
-            
-            # 选择操作
-            operations = list(filtered_weights.keys())
-            weights = list(filtered_weights.values())
-            operation = random.choices(operations, weights=weights)[0]
-            
-            # 智能确定操作金额
-            amount = operator.get_smart_operation_amount(operation, current_balances)
-            
-            status_text.text(f'执行中: {operation} {amount} USDC ({i+1}/{num_operations})')
-            
-            # 执行操作
-            tx_hash, success = None, False
-            try:
-                if operation == 'deposit_o1':
-                    tx_hash, success = operator.deposit_o1(amount)
-                elif operation == 'deposit_o2':
-                    tx_hash, success = operator.deposit_o2(amount)
-                elif operation == 'withdraw_o1':
-                    tx_hash, success = operator.withdraw_o1(amount)
-                elif operation == 'withdraw_o2':
-                    tx_hash, success = operator.withdraw_o2(amount)
-                elif operation == 'add_liquidity':
-                    tx_hash, success = operator.add_liquidity(amount)
-                elif operation == 'remove_liquidity':
-                    tx_hash, success = operator.remove_liquidity(amount)
-                
-                # 等待交易确认
-                if success and tx_hash:
-                    # 批量操作使用较短的超时时间
-                    tx_success, receipt = operator.wait_for_transaction(tx_hash, timeout=60)
-                    
-                    if tx_success:
-                        # 获取操作后余额
-                        balances_after = operator.get_current_balances()
-                        
-                        # 记录操作
-                        prices = operator.calculate_prices(balances_after)
-                        operator.record_operation(operation, amount, tx_hash, True, balances_after, prices)
-                    else:
-                        # 交易失败 - 使用上一个状态的数据
-                        last_balances, last_prices = operator.get_last_state()
-                        if last_balances and last_prices:
-                            operator.record_operation(operation, amount, tx_hash, False, last_balances, last_prices)
-                        else:
-                            prices_current = operator.calculate_prices(current_balances)
-                            operator.record_operation(operation, amount, tx_hash, False, current_balances, prices_current)
-                else:
-                    # 记录失败的操作 - 使用上一个状态的数据
-                    last_balances, last_prices = operator.get_last_state()
-                    if last_balances and last_prices:
-                        operator.record_operation(operation, amount, None, False, last_balances, last_prices)
-                    else:
-                        prices_current = operator.calculate_prices(current_balances)
-                        operator.record_operation(operation, amount, None, False, current_balances, prices_current)
-                    
-            except Exception as e:
-                st.error(f"操作 {i+1} 失败: {str(e)}")
-                # 记录失败的操作 - 使用上一个状态的数据
-                last_balances, last_prices = operator.get_last_state()
-                if last_balances and last_prices:
-                    operator.record_operation(operation, amount, None, False, last_balances, last_prices)
-                else:
-                    prices_current = operator.calculate_prices(current_balances)
-                    operator.record_operation(operation, amount, None, False, current_balances, prices_current)
-            
-            # 更新进度
-            progress_bar.progress((i + 1) / num_operations)
         
+            # 更新进度
+            progress_bar.progress((i + 1) / total_steps)
+        else:
+            # 全部步骤完成后删除检查点
+            if checkpoint is not None:
+                checkpoint.finish()
+    
         status_text.text("✅ 智能批量操作完成！")
 
+# 各阶段耗时
+page_profiler.mark('timing')
+with st.expander("⏱️ 阶段耗时与RPC调用", expanded=False):
+    timing = registry.summary()
+    if timing:
+        timing_df = pd.DataFrame.from_dict(timing, orient='index')
+        timing_df.index.name = '阶段'
+        for column in ('sum', 'mean', 'min', 'max', 'p50', 'p90', 'p99'):
+            timing_df[column] = (timing_df[column] * 1000).round(2)
+        st.caption("时间单位: 毫秒；rpc.* 为各JSON-RPC方法的耗时")
+        st.dataframe(timing_df, use_container_width=True)
+    else:
+        st.info("暂无计时数据，执行操作后显示")
+
+    rpc_stats = operator.rpc_accounting.summary()
+    if rpc_stats['by_method']:
+        st.markdown("**RPC调用统计**")
+        col1, col2 = st.columns(2)
+        with col1:
+            method_df = pd.DataFrame.from_dict(rpc_stats['by_method'], orient='index')
+            method_df.index.name = '方法'
+            st.dataframe(method_df, use_container_width=True)
+        with col2:
+            operation_df = pd.DataFrame.from_dict(rpc_stats['by_operation'], orient='index')
+            operation_df.index.name = '逻辑操作'
+            st.dataframe(operation_df, use_container_width=True)
+        st.caption(f"限速等待 {rpc_stats['throttled_seconds']:.2f}秒，遇到限流 {rpc_stats['rate_limited']} 次")
+
+    provider_summary = getattr(operator.web3.provider, 'summary', None) if hasattr(operator, 'web3') else None
+    if provider_summary is not None:
+        provider_stats = provider_summary()
+        st.markdown("**RPC节点健康度**")
+        endpoint_df = pd.DataFrame(provider_stats['endpoints']).set_index('url')
+        endpoint_df[['p50', 'p99']] = (endpoint_df[['p50', 'p99']] * 1000).round(2)
+        st.dataframe(endpoint_df, use_container_width=True)
+        st.caption(f"对冲请求 {provider_stats['hedged']} 次（其中对冲先返回 {provider_stats['hedge_wins']} 次），"
+                   f"故障转移 {provider_stats['failovers']} 次；延迟单位毫秒")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button(
+            label="📥 下载计时JSON",
+            data=registry.export_json(),
+            file_name=f"timing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json"
+        )
+    with col2:
+        metrics_port = st.number_input("Prometheus端口", min_value=1024, max_value=65535, value=9464)
+        if st.button("📡 启动 /metrics 端点"):
+            try:
+                registry.serve_prometheus(int(metrics_port))
+                st.success(f"✅ Prometheus端点已启动: http://localhost:{int(metrics_port)}/metrics")
+            except OSError as e:
+                st.error(f"❌ 启动失败: {str(e)}")
+    with col3:
+        if st.button("🗑️ 清空计时"):
+            registry.reset()
+            operator.rpc_accounting.reset()
+            st.rerun()
+
+# 不变量检查结果
+if operator.invariants is not None:
+    with st.expander("🛡️ 不变量检查", expanded=bool(operator.invariants.violations)):
+        invariant_summary = operator.invariants.summary()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("已检查记录", invariant_summary['checked'])
+        col2.metric("违规", sum(invariant_summary['violations'].values()))
+        col3.metric("检查耗时占比", f"{invariant_summary['overhead'] * 100:.2f}%")
+        st.caption(f"推迟 {invariant_summary['deferred']} 次；"
+                   + "，".join(f"{name} {count}" for name, count in invariant_summary['violations'].items()))
+        if operator.invariants.violations:
+            st.dataframe(pd.DataFrame(operator.invariants.violation_rows()), use_container_width=True)
+        if st.button("🗑️ 清空检查结果"):
+            operator.invariants.reset(len(operator.operation_history))
+            st.rerun()
+
 # 智能操作金额逻辑说明
 with st.expander("🧠 智能批量操作金额逻辑", expanded=False):
     st.markdown("""
@@ -906,20 +675,153 @@ with st.expander("🧠 智能批量操作金额逻辑", expanded=False):
     **💡 提示**: 系统会实时检查余额，只执行当前可用的操作类型。
     """)
 
+# 价格冲击与流动性深度
+page_profiler.mark('price_surface')
+with st.expander("📐 价格冲击与流动性深度", expanded=False):
+    col1, col2 = st.columns(2)
+    with col1:
+        surface_max_trade = st.number_input("最大交易规模 (USDC)", value=1000.0, min_value=1.0, format="%f")
+    with col2:
+        surface_lp_levels = st.text_input("LP水平 (相对当前流动性的倍数，逗号分隔)", value="0.5,1,2")
+    
+    if st.button("📐 计算价格曲面"):
+        try:
+            # 手续费率从合约 state() 读取
+            model = PoolModel.from_contract(operator.prediction_for_trade)
+            if 'surface_generator' not in st.session_state:
+                st.session_state.surface_generator = PriceSurfaceGenerator(model)
+            generator = st.session_state.surface_generator
+            generator.model = model
+            lp_levels = [float(x) for x in surface_lp_levels.split(',') if x.strip()]
+            scale = 10 ** operator.base_decimals
+            trade_sizes = np.linspace(surface_max_trade * scale / 100, surface_max_trade * scale, 100)
+            st.session_state.price_surface = generator.surface(trade_sizes, lp_levels=lp_levels)
+            st.session_state.price_surface_fee = model.fee_rate
+        except Exception as e:
+            st.error(f"❌ 计算价格曲面失败: {str(e)}")
+    
+    if 'price_surface' in st.session_state:
+        surface = st.session_state.price_surface
+        st.caption(f"合约手续费率: {st.session_state.get('price_surface_fee', 0.0):.4%}")
+        scale = 10 ** operator.base_decimals
+        sizes = surface['trade_sizes'] / scale
+        fig_surface = go.Figure()
+        for li, level in enumerate(surface['lp_levels']):
+            for option in range(surface['deposit_price'].shape[-1]):
+                fig_surface.add_trace(go.Scatter(
+                    x=sizes, y=surface['deposit_price'][0, li, :, option],
+                    mode='lines', name=f'Deposit O{option + 1} (LP×{level})'
+                ))
+                fig_surface.add_trace(go.Scatter(
+                    x=sizes, y=surface['withdraw_price'][0, li, :, option],
+                    mode='lines', line=dict(dash='dot'), name=f'Withdraw O{option + 1} (LP×{level})'
+                ))
+        fig_surface.update_layout(
+            title="交易规模 - 成交价格",
+            xaxis_title="交易规模 (USDC / 选项代币)",
+            yaxis_title="成交价格 (USDC)",
+            height=500
+        )
+        st.plotly_chart(fig_surface, use_container_width=True)
+        
+        depth = PriceSurfaceGenerator.liquidity_depth(surface, max_impact=0.01)[0] / scale
+        st.write("**1%价格冲击内的最大Deposit规模 (USDC):**")
+        st.dataframe(pd.DataFrame(
+            depth,
+            index=[f"LP×{level}" for level in surface['lp_levels']],
+            columns=[f"O{i + 1}" for i in range(depth.shape[-1])]
+        ), use_container_width=True)
+
+# 结算与领取
+page_profiler.mark('settlement')
+with st.expander("🏁 结算与领取（分叉节点）", expanded='settlement_result' in st.session_state):
+    st.caption("仅用于 anvil / hardhat / tenderly 分叉节点：发放Gas、冒充owner和预言机都依赖分叉节点的调试接口")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        holder_count = st.number_input("持有人数量", min_value=1, max_value=10000, value=200)
+        holder_seed = st.number_input("账户种子", min_value=0, value=0)
+    with col2:
+        holder_amount = st.number_input("每人转入的选项代币", value=1.0, min_value=0.000001, format="%f")
+        final_option = st.selectbox("最终结果", list(range(operator.num_options)),
+                                    format_func=lambda i: f"O{i + 1}")
+    with col3:
+        claim_batch_size = st.number_input("每批领取人数", min_value=1, max_value=5000, value=100)
+        claim_parts = st.number_input("每人拆成几笔领取", min_value=1, max_value=10, value=1)
+    oracle_key = st.text_input("预言机私钥（留空则冒充 oracle() 地址）", type="password")
+
+    # 重新初始化后操作器会变化，模拟器随之重建
+    if st.session_state.get('settlement') is None or st.session_state.settlement.operator is not operator:
+        st.session_state.settlement = SettlementSimulator(operator)
+    settlement = st.session_state.settlement
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("👥 生成并发放代币", use_container_width=True):
+            try:
+                with session_manager.busy(session_id):
+                    settlement.create_holders(int(holder_count), seed=int(holder_seed))
+                    funded = settlement.fund_holders(to_wei(holder_amount, int(operator.option_decimals[0])),
+                                                     seed=int(holder_seed))
+                st.success(f"✅ 已向 {funded['transfers']} 个持有人转入选项代币，失败 {funded['failed']} 笔，"
+                           f"耗时 {funded['seconds']:.2f}秒")
+            except Exception as e:
+                st.error(f"❌ 发放失败: {str(e)}")
+    with col2:
+        if st.button("⚖️ 结算市场", use_container_width=True):
+            try:
+                with session_manager.busy(session_id):
+                    result = settlement.settle(final_option, oracle_private_key=oracle_key or None)
+                st.success(f"✅ 结算完成: finalOption={result['after']['final_option']}，"
+                           f"status {result['before']['status']} → {result['after']['status']}，"
+                           f"settle Gas {result['settle_gas']}，回调 Gas {result['callback_gas']}")
+            except Exception as e:
+                st.error(f"❌ 结算失败: {str(e)}")
+    with col3:
+        if st.button("💸 开始领取", use_container_width=True, disabled=not settlement.holders):
+            try:
+                with session_manager.busy(session_id):
+                    st.session_state.settlement_result = settlement.claim_storm(
+                        batch_size=int(claim_batch_size), parts=int(claim_parts))
+            except Exception as e:
+                st.error(f"❌ 领取失败: {str(e)}")
+
+    if 'settlement_result' in st.session_state:
+        result = st.session_state.settlement_result
+        base_decimals = operator.base_decimals
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("领取吞吐量", f"{result['claims_per_second']:.1f} 笔/秒")
+        col2.metric("成功 / 失败", f"{result['succeeded']} / {result['failed']}")
+        col3.metric("平均Gas", f"{result['gas']['mean']:.0f}", help=f"p50 {result['gas']['p50']}，p95 {result['gas']['p95']}")
+        col4.metric("池子流出", f"{format_amount(result['pool_drain'], base_decimals)} USDC")
+        latency = result['latency']
+        st.caption(f"{result['holders']} 个持有人，耗时 {result['seconds']:.2f}秒；"
+                   f"确认延迟 p50 {latency['p50']:.2f}秒，p99 {latency['p99']:.2f}秒；"
+                   f"Claimed事件合计 {format_amount(result['claimed_total'], base_decimals)} USDC")
+        if result['batches']:
+            batch_df = pd.DataFrame(result['batches']).set_index('batch')
+            batch_df['pool_balance'] = batch_df['pool_balance'] / 10 ** base_decimals
+            batch_df['pool_drain'] = batch_df['pool_drain'] / 10 ** base_decimals
+            fig_drain = go.Figure(go.Scatter(x=batch_df.index, y=batch_df['pool_balance'], mode='lines+markers'))
+            fig_drain.update_layout(title="每批领取后的池子余额", xaxis_title="批次",
+                                    yaxis_title="池子余额 (USDC)", height=350)
+            st.plotly_chart(fig_drain, use_container_width=True)
+            st.dataframe(batch_df, use_container_width=True)
+
 # 显示操作历史和图表  
+page_profiler.mark('charts')
 if len(operator.operation_history) > 0:
     st.subheader("📈 操作历史和余额变化")
     
-    # 转换为DataFrame
-    df = pd.DataFrame(operator.operation_history)
-    df['operation_id'] = range(len(df))
+    # 转换为DataFrame，选项数组在此展开为按选项的列
+    df = operator.history_frame()
+    option_indices = range(operator.num_options)
     
     # 创建多子图
     from plotly.subplots import make_subplots
     
     fig = make_subplots(
         rows=2, cols=2,
-        subplot_titles=('池子余额变化', '账户余额变化', 'O1/O2价格变化', 'LP余额变化'),
+        subplot_titles=('池子余额变化', '账户余额变化', '选项价格变化', 'LP余额变化'),
         specs=[[{"secondary_y": False}, {"secondary_y": False}],
                [{"secondary_y": False}, {"secondary_y": False}]]
     )
@@ -962,24 +864,16 @@ if len(operator.operation_history) > 0:
         marker=dict(size=4)
     ), row=1, col=2)
     
-    # 第三个子图：O1/O2价格变化
-    fig.add_trace(go.Scatter(
-        x=df['operation_id'],
-        y=df['o1_price'],
-        mode='lines+markers',
-        name='O1价格 (USDC)',
-        line=dict(color='teal', width=2),
-        marker=dict(size=4)
-    ), row=2, col=1)
-    
-    fig.add_trace(go.Scatter(
-        x=df['operation_id'],
-        y=df['o2_price'],
-        mode='lines+markers',
-        name='O2价格 (USDC)',
-        line=dict(color='darkorange', width=2),
-        marker=dict(size=4)
-    ), row=2, col=1)
+    # 第三个子图：各选项价格变化
+    for i in option_indices:
+        fig.add_trace(go.Scatter(
+            x=df['operation_id'],
+            y=df[f'o{i + 1}_price'],
+            mode='lines+markers',
+            name=f'O{i + 1}价格 (USDC)',
+            line=dict(color=PRICE_COLORS[i % len(PRICE_COLORS)], width=2),
+            marker=dict(size=4)
+        ), row=2, col=1)
     
     # 第四个子图：LP余额变化
     fig.add_trace(go.Scatter(
@@ -1002,31 +896,50 @@ if len(operator.operation_history) > 0:
     # 显示图表
     st.plotly_chart(fig, use_container_width=True)
     
-    # 显示操作分布统计
-    st.subheader("📊 操作分布统计")
-    operation_counts = df['operation'].value_counts()
+    # LP代币按市价估值，拆分手续费收入、库存损益和流动性损益
+    lp_analytics = LPAnalytics.from_operator(operator)
+    if lp_analytics.has_data:
+        with st.expander("💹 LP收益分析", expanded=False):
+            lp_summary = lp_analytics.summary_rows(operator.base_decimals)
+            lp_df = lp_analytics.frame(operator.base_decimals, operator.lp_decimals)
+            st.dataframe(pd.DataFrame(lp_summary), use_container_width=True, hide_index=True)
+            fig_lp = make_subplots(rows=1, cols=2, subplot_titles=('每LP净值 (USDC)', 'PnL拆分 (USDC)'))
+            fig_lp.add_trace(go.Scatter(x=lp_df['operation_id'], y=lp_df['nav'], mode='lines', name='每LP净值'),
+                             row=1, col=1)
+            for row in lp_summary:
+                for key, label in (('pnl', 'PnL'), ('fee_income', '手续费收入'), ('inventory', '库存损益'),
+                                   ('liquidity', '流动性损益')):
+                    fig_lp.add_trace(go.Scatter(x=lp_df['operation_id'], y=lp_df[f"{row['LP']}_{key}"],
+                                                mode='lines', name=f"{row['LP']} {label}"), row=1, col=2)
+            fig_lp.update_layout(height=400, hovermode='x unified')
+            st.plotly_chart(fig_lp, use_container_width=True)
+            st.caption("PnL = 手续费收入 + 库存损益 + 流动性损益；无常损失 = 手续费收入 - PnL。"
+                       "手续费收入由前后价格反推的LMSR成本变化计算，不需要合约参数。")
     
-    # 过滤掉"初始化"操作来统计真实操作
-    real_operations = df[df['operation'] != '初始化']
+    # 显示操作分布统计，数据来自记录操作时维护的运行统计
+    st.subheader("📊 操作分布统计")
+    stats = operator.stats
     
-    if len(real_operations) > 0:
-        real_operation_counts = real_operations['operation'].value_counts()
+    if stats.total > 0:
+        operation_counts = {operation_label(op): count for op, count in stats.counts.items()}
         col1, col2 = st.columns(2)
         
         with col1:
             st.write("**操作次数统计:**")
-            for op, count in real_operation_counts.items():
-                percentage = (count / len(real_operations)) * 100
+            for op, count in operation_counts.items():
+                percentage = (count / stats.total) * 100
                 st.write(f"- {op}: {count}次 ({percentage:.1f}%)")
             
             # 显示总操作数
-            st.write(f"**总操作数:** {len(real_operations)}次")
+            st.write(f"**总操作数:** {stats.total}次")
+            if stats.gas_transactions > 0:
+                st.write(f"**Gas使用:** 共 {stats.gas_used:,}，平均 {stats.mean_gas:,.0f}/笔")
         
         with col2:
             # 创建操作分布饼图
             fig_pie = go.Figure(data=[go.Pie(
-                labels=real_operation_counts.index,
-                values=real_operation_counts.values,
+                labels=list(operation_counts.keys()),
+                values=list(operation_counts.values()),
                 hole=0.3
             )])
             fig_pie.update_layout(
@@ -1034,115 +947,98 @@ if len(operator.operation_history) > 0:
                 height=300
             )
             st.plotly_chart(fig_pie, use_container_width=True)
+        
+        with st.expander("📐 金额与余额区间统计"):
+            st.dataframe(pd.DataFrame(stats.operation_rows(operator)), use_container_width=True, hide_index=True)
+            st.dataframe(pd.DataFrame(stats.range_rows(operator)), use_container_width=True, hide_index=True)
     else:
         st.info("💡 尚未执行任何交易操作，当前仅显示初始状态数据。请执行一些操作后查看分布统计。")
     
     # 显示统计信息
     col1, col2, col3, col4, col5 = st.columns(5)
+    last_record = stats.last
     
     with col1:
-        if len(df) > 0:
+        if last_record is not None:
             st.metric(
                 "池子余额", 
-                f"{df['pool_balance'].iloc[-1]}"
+                format_amount(last_record['pool_balance'], operator.base_decimals)
             )
     
     with col2:
-        if len(df) > 0:
+        if last_record is not None:
             st.metric(
                 "交易账户", 
-                f"{df['user_balance'].iloc[-1]}"
+                format_amount(last_record['user_balance'], operator.base_decimals)
             )
     
     with col3:
-        if len(df) > 0:
+        if last_record is not None:
             st.metric(
                 "LP提供者", 
-                f"{df['lp_provider_balance'].iloc[-1]}"
+                format_amount(last_record['lp_provider_balance'], operator.base_decimals)
             )
     
     with col4:
-        if len(df) > 0:
+        if last_record is not None:
             st.metric(
                 "Owner余额", 
-                f"{df['owner_balance'].iloc[-1]}"
+                format_amount(last_record['owner_balance'], operator.base_decimals)
             )
     
     with col5:
-        # 计算成功率时排除初始化操作
-        real_operations = df[df['operation'] != '初始化']
-        if len(real_operations) > 0:
-            success_rate = (real_operations['success'].sum() / len(real_operations)) * 100
-            st.metric("操作成功率", f"{success_rate:.1f}%")
+        # 成功率不含初始化操作
+        if stats.total > 0:
+            st.metric("操作成功率", f"{stats.success_rate * 100:.1f}%")
         else:
             st.metric("操作成功率", "暂无数据")
     
     # 详细操作历史
     with st.expander("📝 查看详细操作历史"):
         display_df = df[['operation_id', 'operation', 'amount', 'success', 'tx_hash', 
-                        'pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance',
-                        'o1_price', 'o2_price', 'user_lp_balance']].copy()
+                        'pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance'] +
+                        [f'o{i + 1}_price' for i in option_indices] + ['user_lp_balance']].copy()
         display_df['tx_hash'] = display_df['tx_hash'].apply(lambda x: f"{x[:10]}..." if x else "失败")
         # 不进行任何四舍五入，保持原始精度
         st.dataframe(display_df, use_container_width=True)
         
         # 导出功能
+        page_profiler.mark('export')
         st.subheader("📤 数据导出")
         col1, col2 = st.columns(2)
         
         with col1:
-            # 导出操作历史CSV
-            export_df = df[['timestamp', 'operation_id', 'operation', 'amount', 'success', 'tx_hash', 
-                           'pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance',
-                           'user_o1_balance', 'user_o2_balance', 'user_lp_balance', 'o1_price', 'o2_price']].copy()
+            # 分块流式写出到临时文件，不在内存中拼接完整的导出内容
+            export_format = st.selectbox("导出格式", list(EXPORT_FORMATS.keys()), key="export_format")
+            extension, mime = EXPORT_FORMATS[export_format]
+            if st.button("📦 生成导出文件", use_container_width=True):
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                export_path = os.path.join(tempfile.gettempdir(), f"prediction_market_history_{timestamp}.{extension}")
+                try:
+                    rows = export_history(operator, export_format, export_path)
+                    st.session_state.export_file = (export_path, mime)
+                    st.success(f"✅ 已导出 {rows} 条记录到 {export_path}")
+                except ImportError:
+                    st.error("❌ Parquet / Arrow 导出需要安装 pyarrow")
             
-            csv_data = export_df.to_csv(index=False, encoding='utf-8-sig')
-            st.download_button(
-                label="📊 导出操作历史 (CSV)",
-                data=csv_data,
-                file_name=f"prediction_market_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
+            export_file = st.session_state.get('export_file')
+            if export_file and os.path.exists(export_file[0]):
+                export_path, export_mime = export_file
+                with open(export_path, 'rb') as export_handle:
+                    st.download_button(
+                        label=f"📊 下载操作历史 ({os.path.basename(export_path)})",
+                        data=export_handle,
+                        file_name=os.path.basename(export_path),
+                        mime=export_mime,
+                        use_container_width=True
+                    )
         
         with col2:
-            # 导出统计摘要
-            if len(real_operations) > 0:
-                summary_data = {
-                    "统计项目": [
-                        "总操作次数", "成功次数", "失败次数", "成功率(%)",
-                        "Deposit O1次数", "Deposit O2次数", "Withdraw O1次数", "Withdraw O2次数",
-                        "Add Liquidity次数", "Remove Liquidity次数",
-                        "最终池子余额", "最终交易账户余额", "最终LP提供者余额", "最终Owner余额",
-                        "最终O1价格", "最终O2价格", "最终LP余额"
-                    ],
-                    "数值": [
-                        len(real_operations),
-                        real_operations['success'].sum(),
-                        len(real_operations) - real_operations['success'].sum(),
-                        f"{(real_operations['success'].sum() / len(real_operations)) * 100:.2f}",
-                        len(real_operations[real_operations['operation'] == 'deposit_o1']),
-                        len(real_operations[real_operations['operation'] == 'deposit_o2']),
-                        len(real_operations[real_operations['operation'] == 'withdraw_o1']),
-                        len(real_operations[real_operations['operation'] == 'withdraw_o2']),
-                        len(real_operations[real_operations['operation'] == 'add_liquidity']),
-                        len(real_operations[real_operations['operation'] == 'remove_liquidity']),
-                        f"{df['pool_balance'].iloc[-1]:.6f}",
-                        f"{df['user_balance'].iloc[-1]:.6f}",
-                        f"{df['lp_provider_balance'].iloc[-1]:.6f}",
-                        f"{df['owner_balance'].iloc[-1]:.6f}",
-                        f"{df['o1_price'].iloc[-1]:.6f}",
-                        f"{df['o2_price'].iloc[-1]:.6f}",
-                        f"{df['user_lp_balance'].iloc[-1]:.6f}"
-                    ]
-                }
-                
-                summary_df = pd.DataFrame(summary_data)
-                summary_csv = summary_df.to_csv(index=False, encoding='utf-8-sig')
-                
+            # 导出统计摘要，数据来自记录操作时维护的增量统计
+            if operator.stats.total > 0:
                 st.download_button(
                     label="📈 导出统计摘要 (CSV)",
-                    data=summary_csv,
+                    data=summary_csv(operator),
                     file_name=f"prediction_market_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
                     mime="text/csv",
                     use_container_width=True
@@ -1160,10 +1056,8 @@ with st.expander("ℹ️ 使用说明"):
     - 每次操作都会等待链上确认（超时120秒）
     
     ### 操作说明：
-    - **Deposit O1**: 用户向合约存入 BaseToken 换取 O1 代币 (option_out=0)
-    - **Deposit O2**: 用户向合约存入 BaseToken 换取 O2 代币 (option_out=1)  
-    - **Withdraw O1**: 用户卖出 O1 代币换取 BaseToken (option_in=0)
-    - **Withdraw O2**: 用户卖出 O2 代币换取 BaseToken (option_in=1)
+    - **Deposit Ok**: 用户向合约存入 BaseToken 换取第k个选项代币 (option_out=k-1)
+    - **Withdraw Ok**: 用户卖出第k个选项代币换取 BaseToken (option_in=k-1)
     - **Add Liquidity**: 用户向合约添加流动性获得LP代币
     - **Remove Liquidity**: 用户移除流动性，销毁LP代币换取BaseToken
     
@@ -1176,6 +1070,7 @@ with st.expander("ℹ️ 使用说明"):
     ### 合约参数说明：
     - **Option 0 (O1)**: 第一个预测选项代币，索引为 0
     - **Option 1 (O2)**: 第二个预测选项代币，索引为 1
+    - 多选项市场依次为 O3、O4 …，选项数量从合约的 `options()` 读取
     - **BaseToken**: 基础代币 (USDC)，用于购买选项代币和添加流动性
     - **Owner**: 合约所有者地址，追踪其BaseToken余额变化
     
@@ -1196,9 +1091,49 @@ with st.expander("ℹ️ 使用说明"):
     **第三个图 - 价格变化:**
     - 🟦 **青色线**：O1 代币实时价格
     - 🟠 **橙色线**：O2 代币实时价格
+    - 更多选项依次使用其他颜色
     
     **第四个图 - LP余额变化:**
     - 🟪 **紫罗兰线**：LP提供者账户的 LP 代币余额
     
     - 显示每次真实交易后的链上状态和实时价格变化
-    """) 
\ No newline at end of file
+    """) 
+
+page_profiler.end_run()
+
+# 页面性能分析结果
+if page_profiler.enabled:
+    with st.expander("🔬 页面性能分析", expanded=False):
+        section_stats = page_profiler.summary()
+        if section_stats:
+            section_df = pd.DataFrame.from_dict(section_stats, orient='index').round(2)
+            section_df.index.name = '区块'
+            st.caption(f"最近 {len(page_profiler.runs)} 次重跑；时间单位毫秒，内存单位KB")
+            st.dataframe(section_df, use_container_width=True)
+        else:
+            st.info("暂无数据，页面重跑后显示")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button(
+                label="📥 下载 cProfile (.prof)",
+                data=page_profiler.dump_pstats(),
+                file_name=f"page_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof",
+                mime="application/octet-stream"
+            )
+        with col2:
+            st.download_button(
+                label="📥 下载 speedscope",
+                data=page_profiler.speedscope(),
+                file_name=f"page_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.speedscope.json",
+                mime="application/json"
+            )
+        with col3:
+            if st.button("🗑️ 清空分析数据"):
+                page_profiler.reset()
+                st.rerun()
+
+# 跟随新区块：等待下一个区块的快照推送后重跑页面
+if follow_heads and subscription is not None:
+    if subscription.wait_for_block(pushed_block, timeout=30) is not None:
+        st.rerun()
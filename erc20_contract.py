@@ -5,13 +5,20 @@
 ERC20合约封装类
 """
 
-from web3 import Web3
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
+
+import fast_abi
+from abi_cache import ERC20_ABI, checksum_address, get_contract
+from instrumentation import registry
+
+if TYPE_CHECKING:
+    from web3 import Web3
 
 class ERC20Contract:
     """封装ERC20合约的调用方法"""
     
-    def __init__(self, web3: Web3, token_address: str, private_key: str, account_address: str):
+    def __init__(self, web3: "Web3", token_address: str, private_key: str, account_address: str,
+                 nonce_manager=None):
         """
         初始化ERC20合约实例
         
@@ -20,87 +27,25 @@ class ERC20Contract:
             token_address: ERC20代币合约地址
             private_key: 私钥
             account_address: 账户地址
+            nonce_manager: 可选的NonceManager，多个实例共用账户时用于分配nonce
         """
         self.web3 = web3
         self.token_address = token_address
         self.private_key = private_key
         self.account_address = account_address
+        self.nonce_manager = nonce_manager
+        self._decimals = None
         
-        # ERC20 ABI定义
-        self.erc20_abi = [
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "name",
-                "outputs": [{"name": "", "type": "string"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "symbol",
-                "outputs": [{"name": "", "type": "string"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "decimals",
-                "outputs": [{"name": "", "type": "uint8"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [{"name": "_owner", "type": "address"}],
-                "name": "balanceOf",
-                "outputs": [{"name": "balance", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": False,
-                "inputs": [
-                    {"name": "_spender", "type": "address"},
-                    {"name": "_value", "type": "uint256"}
-                ],
-                "name": "approve",
-                "outputs": [{"name": "", "type": "bool"}],
-                "payable": False,
-                "stateMutability": "nonpayable",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [
-                    {"name": "_owner", "type": "address"},
-                    {"name": "_spender", "type": "address"}
-                ],
-                "name": "allowance",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "totalSupply",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            }
-        ]
-        
-        # 创建合约实例
-        self.contract = self.web3.eth.contract(address=Web3.to_checksum_address(token_address), abi=self.erc20_abi)
+        # ABI只解析一次，合约对象在第一次使用时创建并在实例间共享
+        self.erc20_abi = ERC20_ABI
+        self._contract = None
+    
+    @property
+    def contract(self):
+        """ERC20合约对象"""
+        if self._contract is None:
+            self._contract = get_contract(self.web3, 'erc20', self.token_address)
+        return self._contract
     
     def _get_contract(self):
         """获取ERC20合约实例"""
@@ -120,26 +65,36 @@ class ERC20Contract:
             交易哈希
         """
         try:
+            if self.nonce_manager is not None:
+                nonce = self.nonce_manager.next_nonce(self.account_address)
+            else:
+                nonce = self.web3.eth.get_transaction_count(self.account_address)
+            
             # 构建交易
-            transaction = transaction_func(*args).build_transaction({
-                'from': self.account_address,
-                'nonce': self.web3.eth.get_transaction_count(self.account_address),
-                'gasPrice': self.web3.eth.gas_price,
-                'gas': gas_limit or 10000000,
-                **kwargs
-            })
+            with registry.stage('build_transaction'):
+                transaction = transaction_func(*args).build_transaction({
+                    'from': self.account_address,
+                    'nonce': nonce,
+                    'gasPrice': self.web3.eth.gas_price,
+                    'gas': gas_limit or 10000000,
+                    **kwargs
+                })
             
             # 签名交易
-            signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key=self.private_key)
+            with registry.stage('signing'):
+                signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key=self.private_key)
             
             # 发送交易
-            tx_hash = self.web3.eth.send_raw_transaction(signed_txn.raw_transaction)
+            with registry.stage('send'):
+                tx_hash = self.web3.eth.send_raw_transaction(signed_txn.raw_transaction)
             
             print(f"交易已发送，哈希: {tx_hash.hex()}")
             return tx_hash.hex()
             
         except Exception as e:
             print(f"发送交易失败: {str(e)}")
+            if self.nonce_manager is not None:
+                self.nonce_manager.reset(self.account_address)
             raise
     
     # ========== ERC20 合约方法 ==========
@@ -157,8 +112,10 @@ class ERC20Contract:
         if account_address is None:
             account_address = self.account_address
             
-        contract = self._get_contract()
-        balance = contract.functions.balanceOf(Web3.to_checksum_address(account_address)).call()
+        balance = fast_abi.decode_uint(self.web3.eth.call({
+            'to': checksum_address(self.token_address),
+            'data': '0x' + fast_abi.balance_of_data(account_address).hex(),
+        }))
         print(f"账户 {account_address} 的代币余额: {balance}")
         return balance
     
@@ -177,7 +134,7 @@ class ERC20Contract:
         contract = self._get_contract()
         return self._send_transaction(
             contract.functions.approve, 
-            Web3.to_checksum_address(spender), 
+            checksum_address(spender), 
             amount,
             gas_limit=gas_limit
         )
@@ -205,14 +162,15 @@ class ERC20Contract:
     
     def get_decimals(self) -> int:
         """
-        获取代币小数位数
+        获取代币小数位数，首次查询后缓存
         
         Returns:
             小数位数
         """
-        contract = self._get_contract()
-        decimals = contract.functions.decimals().call()
-        return decimals
+        if self._decimals is None:
+            contract = self._get_contract()
+            self._decimals = contract.functions.decimals().call()
+        return self._decimals
     
     def get_symbol(self) -> str:
         """
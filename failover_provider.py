@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多节点故障转移Provider
+
+把多个指向同一条链的HTTP节点组合成一个web3 Provider：
+- 每个节点记录延迟直方图和连续失败次数，按健康分排序，失败的节点按指数退避暂停使用
+- 请求异常或被限流（429 / -32005）时自动转到下一个节点；JSON-RPC层面的正常错误
+  （例如 execution reverted）直接返回，不做故障转移
+- 只读请求（含全部为只读方法的批量请求）在首选节点超过其p95延迟仍未返回时，
+  向第二个节点发送一份相同请求，先返回的结果生效
+- eth_sendRawTransaction 按顺序故障转移，不做对冲；换节点重发时若节点报告交易已存在，
+  按原始交易的哈希确认，保证重复发送是幂等的
+"""
+
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional, Sequence
+
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+
+from instrumentation import Histogram
+from rpc_accounting import RATE_LIMIT_CODES
+
+# 可以对冲的只读方法
+READ_METHODS = frozenset([
+    'eth_call', 'eth_getBalance', 'eth_blockNumber', 'eth_chainId', 'eth_gasPrice',
+    'eth_getTransactionCount', 'eth_getTransactionReceipt', 'eth_getTransactionByHash',
+    'eth_getBlockByNumber', 'eth_getBlockByHash', 'eth_getLogs', 'eth_getCode',
+    'eth_estimateGas', 'eth_feeHistory', 'eth_maxPriorityFeePerGas', 'net_version',
+    'web3_clientVersion',
+])
+
+# 节点报告交易已在交易池或已上链时的错误信息片段
+KNOWN_TRANSACTION_ERRORS = ('already known', 'known transaction', 'already imported',
+                            'nonce too low', 'transaction already exists')
+
+# 对冲前至少需要的延迟样本数，样本不足时不对冲
+MIN_HEDGE_SAMPLES = 20
+
+# 连续失败后暂停使用的最长时间（秒）
+MAX_COOLDOWN = 60.0
+
+
+class EndpointUnavailable(Exception):
+    """节点请求异常或被限流"""
+
+    def __init__(self, message: str, rate_limited: bool = False):
+        super().__init__(message)
+        # 全部节点都被限流时由 RpcAccounting 退避重试
+        self.rate_limited = rate_limited
+
+
+class Endpoint:
+    """单个节点及其健康状态"""
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.provider = Web3.HTTPProvider(url, request_kwargs={'timeout': timeout})
+        self.latency = Histogram()
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, seconds: float):
+        with self._lock:
+            self.latency.record(seconds)
+            self.requests += 1
+            self.consecutive_failures = 0
+            self.cooldown_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.cooldown_until = time.monotonic() + min(2.0 ** self.consecutive_failures, MAX_COOLDOWN)
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def score(self) -> float:
+        """健康分，越小越好：p50延迟乘以失败惩罚"""
+        with self._lock:
+            p50 = self.latency.percentile(50) if self.latency.count else 0.0
+            return (p50 + 0.001) * (1 + self.consecutive_failures)
+
+    def hedge_delay(self, quantile: float) -> Optional[float]:
+        """对冲等待时间（秒），样本不足时返回None表示不对冲"""
+        with self._lock:
+            if self.latency.count < MIN_HEDGE_SAMPLES:
+                return None
+            return self.latency.percentile(quantile)
+
+    def summary(self) -> dict:
+        with self._lock:
+            latency = self.latency.to_dict()
+        return {
+            'url': self.url,
+            'requests': self.requests,
+            'failures': self.failures,
+            'available': self.available,
+            'p50': latency['p50'],
+            'p99': latency['p99'],
+        }
+
+
+def _rate_limited(response) -> bool:
+    responses = response if isinstance(response, list) else [response]
+    for item in responses:
+        error = item.get('error') if isinstance(item, dict) else None
+        if isinstance(error, dict) and error.get('code') in RATE_LIMIT_CODES:
+            return True
+    return False
+
+
+class FailoverProvider(JSONBaseProvider):
+    """按健康分选择节点、自动故障转移并对冲只读请求的Provider"""
+
+    def __init__(self, urls: Sequence[str], timeout: float = 10.0,
+                 hedge: bool = True, hedge_quantile: float = 95.0):
+        """
+        Args:
+            urls: 节点地址列表（需指向同一条链）
+            timeout: 单个节点的请求超时（秒）
+            hedge: 是否对冲只读请求
+            hedge_quantile: 触发对冲的延迟分位数
+        """
+        super().__init__()
+        if not urls:
+            raise ValueError("至少需要一个RPC节点")
+        self.endpoints = [Endpoint(url, timeout) for url in urls]
+        self.hedge = hedge and len(self.endpoints) > 1
+        self.hedge_quantile = hedge_quantile
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.endpoints),
+                                            thread_name_prefix='rpc-hedge')
+
+    def __str__(self) -> str:
+        return f"FailoverProvider({', '.join(endpoint.url for endpoint in self.endpoints)})"
+
+    def candidates(self) -> List[Endpoint]:
+        """按健康分排序的节点，暂停中的节点排在最后"""
+        return sorted(self.endpoints, key=lambda endpoint: (not endpoint.available, endpoint.score()))
+
+    def _attempt(self, endpoint: Endpoint, request: Callable[[Any], Any]):
+        start = time.perf_counter()
+        try:
+            response = request(endpoint.provider)
+        except Exception as e:
+            endpoint.record_failure()
+            raise EndpointUnavailable(f"{endpoint.url}: {str(e)}") from e
+        if _rate_limited(response):
+            endpoint.record_failure()
+            raise EndpointUnavailable(f"{endpoint.url}: 被限流", rate_limited=True)
+        endpoint.record_success(time.perf_counter() - start)
+        return response
+
+    def _failover(self, request: Callable[[Any], Any]):
+        """按顺序尝试各节点，返回第一个成功的响应"""
+        error = None
+        for index, endpoint in enumerate(self.candidates()):
+            if index:
+                self.failovers += 1
+            try:
+                return self._attempt(endpoint, request)
+            except EndpointUnavailable as e:
+                error = e
+        raise error
+
+    def _hedged(self, request: Callable[[Any], Any]):
+        """首选节点超过p95仍未返回时向下一个节点发送相同请求，先成功的结果生效"""
+        candidates = self.candidates()
+        primary = candidates[0]
+        delay = primary.hedge_delay(self.hedge_quantile) if self.hedge else None
+        if delay is None:
+            # 延迟样本不足，直接在当前线程按顺序故障转移
+            return self._failover(request)
+        candidates.pop(0)
+        # future -> 是否为对冲请求
+        pending = {self._executor.submit(self._attempt, primary, request): False}
+        done, _ = wait(pending, timeout=delay)
+        if not done and candidates:
+            self.hedged += 1
+            pending[self._executor.submit(self._attempt, candidates.pop(0), request)] = True
+        error = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                is_hedge = pending.pop(future)
+                try:
+                    response = future.result()
+                except EndpointUnavailable as e:
+                    error = e
+                    continue
+                if is_hedge:
+                    self.hedge_wins += 1
+                return response
+            if not pending and candidates:
+                # 已发出的请求都失败，转到下一个节点
+                self.failovers += 1
+                pending[self._executor.submit(self._attempt, candidates.pop(0), request)] = False
+        raise error
+
+    def _send_raw_transaction(self, method: str, params) -> dict:
+        """按顺序故障转移发送原始交易，节点报告交易已存在时按交易哈希确认"""
+        from eth_utils import keccak
+
+        raw = params[0]
+        tx_hash = '0x' + keccak(hexstr=raw if isinstance(raw, str) else '0x' + bytes(raw).hex()).hex()
+        attempted = False
+        error = None
+        for endpoint in self.candidates():
+            if attempted:
+                self.failovers += 1
+            try:
+                response = self._attempt(endpoint, lambda provider: provider.make_request(method, params))
+            except EndpointUnavailable as e:
+                # 请求可能已送达节点，之后换节点重发时需要按哈希确认
+                attempted = True
+                error = e
+                continue
+            rpc_error = response.get('error') if isinstance(response, dict) else None
+            message = str(rpc_error.get('message', '')).lower() if isinstance(rpc_error, dict) else ''
+            if attempted and any(text in message for text in KNOWN_TRANSACTION_ERRORS):
+                if self._transaction_known(endpoint, tx_hash):
+                    return {'jsonrpc': '2.0', 'id': response.get('id'), 'result': tx_hash}
+            return response
+        raise error
+
+    def _transaction_known(self, endpoint: Endpoint, tx_hash: str) -> bool:
+        try:
+            response = endpoint.provider.make_request('eth_getTransactionByHash', [tx_hash])
+        except Exception:
+            return False
+        return bool(response.get('result'))
+
+    # ========== Provider 接口 ==========
+
+    def make_request(self, method, params):
+        if method == 'eth_sendRawTransaction':
+            return self._send_raw_transaction(method, params)
+
+        def request(provider):
+            return provider.make_request(method, params)
+
+        return self._hedged(request) if method in READ_METHODS else self._failover(request)
+
+    def make_batch_request(self, requests):
+        requests = list(requests)
+
+        def request(provider):
+            return provider.make_batch_request(requests)
+
+        if all(method in READ_METHODS for method, _ in requests):
+            return self._hedged(request)
+        return self._failover(request)
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(endpoint.provider.is_connected() for endpoint in self.endpoints)
+
+    def summary(self) -> dict:
+        """各节点的请求数、失败数、延迟，以及对冲和故障转移次数"""
+        return {
+            'endpoints': [endpoint.summary() for endpoint in self.endpoints],
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'failovers': self.failovers,
+        }
+
+
+def make_provider(rpc_url: str, **kwargs):
+    """
+    根据节点地址创建Provider，多个地址用逗号或换行分隔时使用 FailoverProvider
+
+    Args:
+        rpc_url: 节点地址
+        **kwargs: 传给 FailoverProvider 的参数
+
+    Returns:
+        web3 Provider
+    """
+    urls = [url.strip() for url in rpc_url.replace('\n', ',').split(',') if url.strip()]
+    if len(urls) == 1:
+        return Web3.HTTPProvider(urls[0])
+    return FailoverProvider(urls, **kwargs)
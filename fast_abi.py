@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+热点函数的ABI快速编解码
+
+快照和交易只用到少数几个函数，且参数和返回值都是定长的 uint256 / int256 /
+address。这里直接用预先计算好的函数选择器拼接调用数据、按32字节字解析返回值，
+跳过 web3 合约函数对象的查找、参数规范化和通用ABI编解码。
+选择器与 abi.py 中ABI的一致性可以用 verify_selectors() 检查。
+"""
+
+from typing import Callable, Dict, Optional
+
+# 函数签名 -> 4字节选择器（keccak256(签名)的前4字节）
+SELECTORS: Dict[str, bytes] = {
+    'balanceOf(address)': bytes.fromhex('70a08231'),
+    'price(uint256)': bytes.fromhex('26a49e37'),
+    'reserves(uint256)': bytes.fromhex('8334278d'),
+    'state()': bytes.fromhex('c19d93fb'),
+    'getAmountOut(uint256,uint256)': bytes.fromhex('7cabb7cf'),
+    'getAmountsOut(int256[])': bytes.fromhex('767652be'),
+    'deposit(uint256,uint256,uint256,uint256)': bytes.fromhex('2505c3d9'),
+    'withdraw(uint256,uint256,uint256,uint256)': bytes.fromhex('674fb1b4'),
+    'swap(uint256,uint256,uint256,uint256,uint256)': bytes.fromhex('c45c5c30'),
+    'addLiquidity(uint256,address,uint256)': bytes.fromhex('9aa5d462'),
+    'removeLiquidity(uint256,uint256)': bytes.fromhex('9d7de6b3'),
+    'transfer(address,uint256)': bytes.fromhex('a9059cbb'),
+    'status()': bytes.fromhex('200d2ed2'),
+    'finalOption()': bytes.fromhex('099e8c86'),
+    'assertionId()': bytes.fromhex('0d80da74'),
+    'assertTime()': bytes.fromhex('0a41e8c5'),
+    'oracle()': bytes.fromhex('7dc0d1d0'),
+    'settle(uint256)': bytes.fromhex('8df82800'),
+    'assertionResolvedCallback(bytes32,bool)': bytes.fromhex('f1b156b2'),
+    'claim(uint256)': bytes.fromhex('379607f5'),
+    'claimAll()': bytes.fromhex('d1058e59'),
+    'totalSupply()': bytes.fromhex('18160ddd'),
+}
+
+BALANCE_OF = SELECTORS['balanceOf(address)']
+PRICE = SELECTORS['price(uint256)']
+RESERVES = SELECTORS['reserves(uint256)']
+STATE = SELECTORS['state()']
+GET_AMOUNT_OUT = SELECTORS['getAmountOut(uint256,uint256)']
+GET_AMOUNTS_OUT = SELECTORS['getAmountsOut(int256[])']
+DEPOSIT = SELECTORS['deposit(uint256,uint256,uint256,uint256)']
+WITHDRAW = SELECTORS['withdraw(uint256,uint256,uint256,uint256)']
+SWAP = SELECTORS['swap(uint256,uint256,uint256,uint256,uint256)']
+ADD_LIQUIDITY = SELECTORS['addLiquidity(uint256,address,uint256)']
+REMOVE_LIQUIDITY = SELECTORS['removeLiquidity(uint256,uint256)']
+TRANSFER = SELECTORS['transfer(address,uint256)']
+STATUS = SELECTORS['status()']
+FINAL_OPTION = SELECTORS['finalOption()']
+ASSERTION_ID = SELECTORS['assertionId()']
+ASSERT_TIME = SELECTORS['assertTime()']
+ORACLE = SELECTORS['oracle()']
+SETTLE = SELECTORS['settle(uint256)']
+ASSERTION_RESOLVED_CALLBACK = SELECTORS['assertionResolvedCallback(bytes32,bool)']
+CLAIM = SELECTORS['claim(uint256)']
+CLAIM_ALL = SELECTORS['claimAll()']
+TOTAL_SUPPLY = SELECTORS['totalSupply()']
+
+_UINT256_LIMIT = 1 << 256
+_INT256_MIN = -(1 << 255)
+_INT256_LIMIT = 1 << 255
+_ADDRESS_PADDING = bytes(12)
+
+
+# ========== 编码 ==========
+
+def encode_uint(value: int) -> bytes:
+    """uint256 编码为32字节"""
+    value = int(value)
+    if not 0 <= value < _UINT256_LIMIT:
+        raise ValueError(f"uint256超出范围: {value}")
+    return value.to_bytes(32, 'big')
+
+
+def encode_int(value: int) -> bytes:
+    """int256 编码为32字节（二进制补码）"""
+    value = int(value)
+    if not _INT256_MIN <= value < _INT256_LIMIT:
+        raise ValueError(f"int256超出范围: {value}")
+    return value.to_bytes(32, 'big', signed=True)
+
+
+def encode_address(address: str) -> bytes:
+    """地址编码为32字节（左侧补0）"""
+    raw = bytes.fromhex(address[2:] if address[:2] in ('0x', '0X') else address)
+    if len(raw) != 20:
+        raise ValueError(f"无效地址: {address}")
+    return _ADDRESS_PADDING + raw
+
+
+def balance_of_data(owner: str) -> bytes:
+    return BALANCE_OF + encode_address(owner)
+
+
+def price_data(option: int) -> bytes:
+    return PRICE + encode_uint(option)
+
+
+def reserves_data(option: int) -> bytes:
+    return RESERVES + encode_uint(option)
+
+
+def state_data() -> bytes:
+    return STATE
+
+
+def total_supply_data() -> bytes:
+    return TOTAL_SUPPLY
+
+
+def get_amount_out_data(option_out: int, delta: int) -> bytes:
+    return GET_AMOUNT_OUT + encode_uint(option_out) + encode_uint(delta)
+
+
+def get_amounts_out_data(x) -> bytes:
+    """getAmountsOut(int256[])：动态数组参数为 偏移 + 长度 + 各元素"""
+    return (GET_AMOUNTS_OUT + encode_uint(32) + encode_uint(len(x)) +
+            b''.join(encode_int(value) for value in x))
+
+
+def deposit_data(option_out: int, delta: int, min_receive: int, deadline: int) -> bytes:
+    return DEPOSIT + encode_uint(option_out) + encode_uint(delta) + encode_uint(min_receive) + encode_uint(deadline)
+
+
+def withdraw_data(option_in: int, delta: int, min_receive: int, deadline: int) -> bytes:
+    return WITHDRAW + encode_uint(option_in) + encode_uint(delta) + encode_uint(min_receive) + encode_uint(deadline)
+
+
+def swap_data(option_out: int, option_in: int, delta: int, min_receive: int, deadline: int) -> bytes:
+    return (SWAP + encode_uint(option_out) + encode_uint(option_in) + encode_uint(delta) +
+            encode_uint(min_receive) + encode_uint(deadline))
+
+
+def add_liquidity_data(liquidity: int, to: str, min_receive: int = 0) -> bytes:
+    return ADD_LIQUIDITY + encode_uint(liquidity) + encode_address(to) + encode_uint(min_receive)
+
+
+def remove_liquidity_data(liquidity: int, min_receive: int = 0) -> bytes:
+    return REMOVE_LIQUIDITY + encode_uint(liquidity) + encode_uint(min_receive)
+
+
+def transfer_data(to: str, amount: int) -> bytes:
+    return TRANSFER + encode_address(to) + encode_uint(amount)
+
+
+def settle_data(option: int) -> bytes:
+    return SETTLE + encode_uint(option)
+
+
+def assertion_resolved_callback_data(assertion_id: bytes, asserted_truthfully: bool = True) -> bytes:
+    if len(assertion_id) != 32:
+        raise ValueError(f"assertionId 需要32字节: 0x{bytes(assertion_id).hex()}")
+    return ASSERTION_RESOLVED_CALLBACK + bytes(assertion_id) + encode_uint(int(asserted_truthfully))
+
+
+def claim_data(amount: int) -> bytes:
+    return CLAIM + encode_uint(amount)
+
+
+def claim_all_data() -> bytes:
+    return CLAIM_ALL
+
+
+# ========== 解码 ==========
+
+def _as_bytes(data) -> bytes:
+    if isinstance(data, str):
+        return bytes.fromhex(data[2:] if data[:2] in ('0x', '0X') else data)
+    return bytes(data)
+
+
+def decode_uint(data) -> int:
+    """解析返回值的第一个字为 uint256"""
+    data = _as_bytes(data)
+    if len(data) < 32:
+        raise ValueError(f"返回数据长度不足32字节: 0x{data.hex()}")
+    return int.from_bytes(data[:32], 'big')
+
+
+def decode_int(data) -> int:
+    """解析返回值的第一个字为 int256"""
+    data = _as_bytes(data)
+    if len(data) < 32:
+        raise ValueError(f"返回数据长度不足32字节: 0x{data.hex()}")
+    return int.from_bytes(data[:32], 'big', signed=True)
+
+
+def decode_bytes32(data) -> bytes:
+    """解析返回值的第一个字为 bytes32"""
+    data = _as_bytes(data)
+    if len(data) < 32:
+        raise ValueError(f"返回数据长度不足32字节: 0x{data.hex()}")
+    return data[:32]
+
+
+def decode_address(data) -> str:
+    """解析返回值的第一个字为地址（小写0x字符串）"""
+    return '0x' + decode_bytes32(data)[12:].hex()
+
+
+class RawCall:
+    """预先编码好的只读调用，可单独执行，也可加入 web3 批量请求"""
+
+    __slots__ = ('web3', 'to', 'data', 'decoder')
+
+    def __init__(self, web3, to: str, data: bytes, decoder: Callable[[bytes], int] = decode_uint):
+        """
+        Args:
+            web3: Web3实例
+            to: 合约地址（校验和格式）
+            data: 调用数据
+            decoder: 返回值解码函数
+        """
+        self.web3 = web3
+        self.to = to
+        self.data = data
+        self.decoder = decoder
+
+    def params(self) -> dict:
+        """eth_call 的交易参数"""
+        return {'to': self.to, 'data': '0x' + self.data.hex()}
+
+    def call(self, block_identifier='latest') -> int:
+        """执行 eth_call 并解码"""
+        return self.decoder(self.web3.eth.call(self.params(), block_identifier))
+
+    def decode(self, raw) -> int:
+        """解码批量请求返回的原始数据"""
+        return self.decoder(raw)
+
+
+def verify_selectors() -> Optional[str]:
+    """
+    检查硬编码的选择器是否与 Prediction / ERC20 ABI 的计算结果一致
+
+    Returns:
+        不一致时返回错误描述，一致时返回None
+    """
+    from abi_cache import function_table
+
+    computed = {function.signature: function.selector
+                for abi_name in ('prediction', 'erc20')
+                for functions in function_table(abi_name).values()
+                for function in functions}
+    for signature, selector in SELECTORS.items():
+        expected = computed.get(signature)
+        if expected != selector:
+            found = f"0x{expected.hex()}" if expected else "缺失"
+            return f"{signature}: 硬编码 0x{selector.hex()}，ABI计算 {found}"
+    return None
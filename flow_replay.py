@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+历史交易流导入与回放
+
+FlowImporter 从已部署的Prediction合约拉取 Deposited / Withdrawn / Swapped /
+LiquidityAdded / LiquidityRemoved 事件，压缩保存为NumPy结构化数组；
+FlowReplayer 按原始顺序把这些事件回放到分叉链或离线 PoolModel 上，
+支持时间压缩以及多个独立市场并行回放。
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import fast_abi
+from abi_cache import checksum_address, get_contract
+from prediction_contract import DEFAULT_DEADLINE
+
+# 事件类型编码
+DEPOSITED = 0
+WITHDRAWN = 1
+SWAPPED = 2
+LIQUIDITY_ADDED = 3
+LIQUIDITY_REMOVED = 4
+
+EVENT_KINDS = {
+    'Deposited': DEPOSITED,
+    'Withdrawn': WITHDRAWN,
+    'Swapped': SWAPPED,
+    'LiquidityAdded': LIQUIDITY_ADDED,
+    'LiquidityRemoved': LIQUIDITY_REMOVED,
+}
+
+FLOW_DTYPE = np.dtype([
+    ('block', np.int64),
+    ('log_index', np.int32),
+    ('timestamp', np.int64),
+    ('kind', np.int8),
+    ('user', np.int32),        # 地址表中的索引
+    ('option_in', np.int16),   # 不适用时为-1
+    ('option_out', np.int16),  # 不适用时为-1
+    ('amount_in', np.int64),
+    ('amount_out', np.int64),
+])
+
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+def _to_int64(value: int) -> Optional[int]:
+    """金额转换为int64，超出范围时返回None"""
+    value = int(value)
+    if abs(value) > _INT64_MAX:
+        return None
+    return value
+
+
+class FlowImporter:
+    """从链上拉取并压缩保存Prediction合约的历史交易流"""
+
+    def __init__(self, web3, prediction_address: str, chunk_size: int = 2000):
+        """
+        初始化导入器
+
+        Args:
+            web3: Web3实例
+            prediction_address: Prediction合约地址
+            chunk_size: 每次 eth_getLogs 查询的区块数
+        """
+        from web3 import Web3
+
+        self.web3 = web3
+        self.prediction_address = checksum_address(prediction_address)
+        self.chunk_size = chunk_size
+        self.contract = get_contract(web3, 'prediction', self.prediction_address)
+        # topic0 -> 事件名
+        self.topics = {}
+        for entry in self.contract.abi:
+            if entry.get('type') == 'event' and entry['name'] in EVENT_KINDS:
+                signature = f"{entry['name']}({','.join(i['type'] for i in entry['inputs'])})"
+                self.topics[Web3.keccak(text=signature).hex().lower().removeprefix('0x')] = entry['name']
+        self._timestamps: Dict[int, int] = {}
+
+    def _get_logs(self, from_block: int, to_block: int) -> List[dict]:
+        """分段拉取日志，结果过多被节点拒绝时自动二分区间"""
+        try:
+            return self.web3.eth.get_logs({
+                'address': self.prediction_address,
+                'fromBlock': from_block,
+                'toBlock': to_block,
+                'topics': [['0x' + t for t in self.topics]],
+            })
+        except Exception:
+            if to_block <= from_block:
+                raise
+            mid = (from_block + to_block) // 2
+            return self._get_logs(from_block, mid) + self._get_logs(mid + 1, to_block)
+
+    def _block_timestamp(self, block: int) -> int:
+        if block not in self._timestamps:
+            self._timestamps[block] = int(self.web3.eth.get_block(block)['timestamp'])
+        return self._timestamps[block]
+
+    def fetch(self, from_block: int, to_block: Optional[int] = None,
+              with_timestamps: bool = True) -> "FlowRecord":
+        """
+        拉取区块区间内的交易流
+
+        Args:
+            from_block: 起始区块
+            to_block: 结束区块，默认最新区块
+            with_timestamps: 是否查询区块时间戳（时间压缩回放需要）
+
+        Returns:
+            FlowRecord
+        """
+        if to_block is None:
+            to_block = self.web3.eth.block_number
+
+        rows = []
+        users: Dict[str, int] = {}
+        # 金额超出int64范围的事件（例如18位小数代币的大额交易）无法压缩保存，跳过并计数
+        skipped = 0
+        for start in range(from_block, to_block + 1, self.chunk_size):
+            end = min(start + self.chunk_size - 1, to_block)
+            for log in self._get_logs(start, end):
+                topic0 = log['topics'][0]
+                topic0 = (topic0.hex() if isinstance(topic0, (bytes, bytearray)) else topic0).lower()
+                name = self.topics.get(topic0.removeprefix('0x'))
+                if name is None:
+                    continue
+                args = getattr(self.contract.events, name)().process_log(log)['args']
+                user = users.setdefault(args['user'], len(users))
+                option_in, option_out = -1, -1
+                if name == 'Deposited':
+                    option_out = args['optionOut']
+                    amount_in, amount_out = args['amountIn'], args['amountOut']
+                elif name == 'Withdrawn':
+                    option_in = args['optionIn']
+                    amount_in, amount_out = args['amountIn'], args['amountOut']
+                elif name == 'Swapped':
+                    option_in, option_out = args['optionIn'], args['optionOut']
+                    amount_in, amount_out = args['amountIn'], args['amountOut']
+                elif name == 'LiquidityAdded':
+                    amount_in, amount_out = args['amount'], args['lpAmount']
+                else:
+                    amount_in, amount_out = args['lpAmount'], args['amount']
+                amount_in, amount_out = _to_int64(amount_in), _to_int64(amount_out)
+                if amount_in is None or amount_out is None:
+                    skipped += 1
+                    continue
+                block = int(log['blockNumber'])
+                rows.append((
+                    block,
+                    int(log['logIndex']),
+                    self._block_timestamp(block) if with_timestamps else 0,
+                    EVENT_KINDS[name],
+                    user,
+                    option_in,
+                    option_out,
+                    amount_in,
+                    amount_out,
+                ))
+            print(f"已拉取区块 {start}-{end}，累计事件 {len(rows)}")
+        if skipped:
+            print(f"⚠️ 跳过 {skipped} 个金额超出int64范围的事件，回放结果与原始交易流可能不一致")
+
+        events = np.array(rows, dtype=FLOW_DTYPE)
+        events.sort(order=['block', 'log_index'])
+        return FlowRecord(events, list(users), self.prediction_address)
+
+
+class FlowRecord:
+    """压缩保存的历史交易流"""
+
+    def __init__(self, events: np.ndarray, users: List[str], market: str = ""):
+        self.events = events
+        self.users = users
+        self.market = market
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def save(self, path: str):
+        """保存为压缩的 .npz 文件"""
+        np.savez_compressed(path, events=self.events, users=np.array(self.users),
+                            market=np.array(self.market))
+
+    @classmethod
+    def load(cls, path: str) -> "FlowRecord":
+        """从 .npz 文件加载"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['events'], [str(u) for u in data['users']], str(data['market']))
+
+
+class ModelReplayTarget:
+    """把事件回放到离线 PoolModel"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def apply(self, event) -> Optional[int]:
+        kind = event['kind']
+        if kind == DEPOSITED:
+            return self.model.deposit(int(event['option_out']), int(event['amount_in']))
+        if kind == WITHDRAWN:
+            return self.model.withdraw(int(event['option_in']), int(event['amount_in']))
+        if kind == SWAPPED:
+            return self.model.swap(int(event['option_out']), int(event['option_in']), int(event['amount_in']))
+        if kind == LIQUIDITY_ADDED:
+            return self.model.add_liquidity(int(event['amount_in']))
+        if kind == LIQUIDITY_REMOVED:
+            return self.model.remove_liquidity(int(event['amount_in']))
+        return None
+
+
+class ContractReplayTarget:
+    """把事件回放到分叉链上的合约
+
+    分叉链上无法以原始用户身份签名，所有交易流统一由配置的交易账户发送，
+    流动性事件由LP提供者账户发送。传入 SigningPipeline 时，后续 lookahead
+    个事件的交易会提前构建并在后台签名。
+    """
+
+    def __init__(self, trader, lp_provider, wait: bool = True, timeout: int = 120,
+                 pipeline=None, lookahead: int = 32):
+        """
+        Args:
+            trader: 交易账户的 PredictionContract
+            lp_provider: LP提供者账户的 PredictionContract
+            wait: 是否等待每笔交易确认
+            timeout: 等待确认的超时时间（秒）
+            pipeline: 可选的 SigningPipeline
+            lookahead: 使用 pipeline 时提前签名的事件数
+        """
+        self.trader = trader
+        self.lp_provider = lp_provider
+        self.wait = wait
+        self.timeout = timeout
+        self.pipeline = pipeline
+        self.lookahead = lookahead if pipeline is not None else 0
+        self._prepared = deque()
+
+    def _calldata(self, event):
+        """事件对应的 (发送账户, 调用数据)，未知事件返回None"""
+        kind = event['kind']
+        amount = int(event['amount_in'])
+        if kind == DEPOSITED:
+            return self.trader, fast_abi.deposit_data(int(event['option_out']), amount, 0, DEFAULT_DEADLINE)
+        if kind == WITHDRAWN:
+            return self.trader, fast_abi.withdraw_data(int(event['option_in']), amount, 0, DEFAULT_DEADLINE)
+        if kind == SWAPPED:
+            return self.trader, fast_abi.swap_data(int(event['option_out']), int(event['option_in']),
+                                                   amount, 0, DEFAULT_DEADLINE)
+        if kind == LIQUIDITY_ADDED:
+            return self.lp_provider, fast_abi.add_liquidity_data(amount, self.lp_provider.account_address, 0)
+        if kind == LIQUIDITY_REMOVED:
+            return self.lp_provider, fast_abi.remove_liquidity_data(amount, 0)
+        return None
+
+    def prepare(self, event):
+        """提前构建并签名事件对应的交易"""
+        planned = self._calldata(event)
+        self._prepared.append(planned is not None)
+        if planned is not None:
+            self.pipeline.submit(*planned)
+
+    def apply(self, event) -> Optional[int]:
+        """发送事件对应的交易，等待确认时交易回滚抛出 RuntimeError
+
+        Returns:
+            交易消耗的Gas；不等待确认或事件未知时返回None
+        """
+        if self.pipeline is not None:
+            if not self._prepared.popleft():
+                return None
+            tx_hash = self.pipeline.send_next()
+        else:
+            kind = event['kind']
+            amount = int(event['amount_in'])
+            if kind == DEPOSITED:
+                tx_hash = self.trader.deposit(int(event['option_out']), amount, 0)
+            elif kind == WITHDRAWN:
+                tx_hash = self.trader.withdraw(int(event['option_in']), amount, 0)
+            elif kind == SWAPPED:
+                tx_hash = self.trader.swap(int(event['option_out']), int(event['option_in']), amount, 0)
+            elif kind == LIQUIDITY_ADDED:
+                tx_hash = self.lp_provider.add_liquidity(amount)
+            elif kind == LIQUIDITY_REMOVED:
+                tx_hash = self.lp_provider.remove_liquidity(amount)
+            else:
+                return None
+        if not self.wait:
+            return None
+        receipt = self.trader.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.timeout)
+        if receipt.status != 1:
+            raise RuntimeError(f"交易回滚: {tx_hash}")
+        return receipt.gasUsed
+
+
+class FlowReplayer:
+    """按原始顺序回放交易流"""
+
+    def __init__(self, record: FlowRecord, target, compression: Optional[float] = None):
+        """
+        Args:
+            record: 要回放的 FlowRecord
+            target: ModelReplayTarget 或 ContractReplayTarget
+            compression: 时间压缩倍数，例如3600表示1小时压缩为1秒；None表示不等待
+        """
+        self.record = record
+        self.target = target
+        self.compression = compression
+
+    def run(self, limit: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        执行回放
+
+        Args:
+            limit: 最多回放的事件数
+
+        Returns:
+            包含原始输出、回放输出、成功标记和耗时的字典
+        """
+        events = self.record.events if limit is None else self.record.events[:limit]
+        replayed = np.full(len(events), np.nan)
+        success = np.zeros(len(events), dtype=bool)
+        started = time.perf_counter()
+        first_ts = int(events['timestamp'][0]) if len(events) else 0
+
+        # 支持预签名的目标提前准备后续事件的交易
+        lookahead = getattr(self.target, 'lookahead', 0)
+        for j in range(min(lookahead, len(events))):
+            self.target.prepare(events[j])
+
+        for i, event in enumerate(events):
+            if lookahead and i + lookahead < len(events):
+                self.target.prepare(events[i + lookahead])
+            if self.compression:
+                due = (int(event['timestamp']) - first_ts) / self.compression
+                wait = due - (time.perf_counter() - started)
+                if wait > 0:
+                    time.sleep(wait)
+            try:
+                result = self.target.apply(event)
+                replayed[i] = np.nan if result is None else float(result)
+                success[i] = True
+            except Exception as e:
+                print(f"回放第{i + 1}个事件失败: {str(e)}")
+
+        return {
+            'kind': events['kind'],
+            'original_out': events['amount_out'],
+            'replayed_out': replayed,
+            'success': success,
+            'elapsed': time.perf_counter() - started,
+        }
+
+
+def replay_markets(replayers: List[FlowReplayer], max_workers: int = 8,
+                   limit: Optional[int] = None) -> List[Dict[str, np.ndarray]]:
+    """
+    并行回放多个相互独立的市场
+
+    Args:
+        replayers: 每个市场一个 FlowReplayer
+        max_workers: 并发线程数
+        limit: 每个市场最多回放的事件数
+
+    Returns:
+        与 replayers 顺序一致的回放结果列表
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda r: r.run(limit), replayers))
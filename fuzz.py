@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Prediction池子的性质测试（模糊测试）
+
+生成对抗性的操作序列：极端金额、粉尘金额、零金额、超过余额的金额、来回swap、
+买入后全部卖出的往返、在流动性变化前后夹击等。每个序列在全新的离线模型上执行，
+每一步之后由 InvariantChecker 检查不变量，同时检查余额非负和执行过程中的异常。
+
+失败的序列会被缩减为最小复现：先按块删除步骤，再把金额逐步简化，
+只要仍以同一项检查失败就保留缩减结果。用例生成、执行和缩减都在进程池中并行。
+缩减后的序列可以在分叉节点上重放（evm_snapshot / evm_revert），确认链上是否同样失败。
+
+用法:
+    python fuzz.py --cases 2000 --length 40 --workers 8
+    python fuzz.py --cases 500 --fork-url http://127.0.0.1:8545 --prediction 0x... ...
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from invariants import InvariantChecker
+from operation_stats import INIT_OPERATION, OperationStats
+
+KINDS = ('deposit', 'withdraw', 'swap', 'add_liquidity', 'remove_liquidity')
+
+# 金额策略：相对执行时的可用余额解析，缩减和重放时仍然有意义
+#   zero      0
+#   dust      value 个最小单位
+#   fraction  可用余额 × value
+#   all       全部可用余额
+#   over      可用余额 + value
+#   huge      2 ** value
+STRATEGIES = ('zero', 'dust', 'fraction', 'all', 'over', 'huge')
+
+# 金额策略的简化顺序，缩减时向后替换
+SIMPLER = {
+    'huge': ('over',),
+    'over': ('all',),
+    'all': ('fraction',),
+    'fraction': ('dust',),
+    'dust': ('zero',),
+}
+
+# 缩减时最多执行的用例数
+MAX_SHRINK_RUNS = 2000
+
+
+class Step:
+    """操作序列中的一步"""
+
+    __slots__ = ('kind', 'option', 'option_in', 'strategy', 'value')
+
+    def __init__(self, kind: str, option: int = 0, option_in: int = 0, strategy: str = 'fraction', value=0.5):
+        self.kind = kind
+        self.option = option
+        self.option_in = option_in
+        self.strategy = strategy
+        self.value = value
+
+    @property
+    def name(self) -> str:
+        """记录到操作历史中的名称"""
+        if self.kind in ('deposit', 'withdraw'):
+            return f'{self.kind}_o{self.option + 1}'
+        if self.kind == 'swap':
+            return f'swap_o{self.option_in + 1}_o{self.option + 1}'
+        return self.kind
+
+    def source_balance(self, balances: dict) -> int:
+        """该操作花费的余额"""
+        if self.kind == 'deposit':
+            return int(balances['user_balance'])
+        if self.kind == 'withdraw':
+            return int(balances['option_balances'][self.option])
+        if self.kind == 'swap':
+            return int(balances['option_balances'][self.option_in])
+        if self.kind == 'add_liquidity':
+            return int(balances['lp_provider_balance'])
+        return int(balances['user_lp_balance'])
+
+    def resolve(self, balances: dict) -> int:
+        """按执行时的余额计算金额（原始整数）"""
+        available = self.source_balance(balances)
+        if self.strategy == 'zero':
+            return 0
+        if self.strategy == 'dust':
+            return int(self.value)
+        if self.strategy == 'fraction':
+            return int(available * float(self.value))
+        if self.strategy == 'all':
+            return available
+        if self.strategy == 'over':
+            return available + int(self.value)
+        return 2 ** int(self.value)
+
+    def replace(self, **changes) -> "Step":
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return Step(**fields)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Step":
+        return cls(**data)
+
+    def __repr__(self) -> str:
+        amount = self.strategy if self.strategy in ('zero', 'all') else f'{self.strategy}({self.value})'
+        return f'{self.name}[{amount}]'
+
+
+# ========== 用例生成 ==========
+
+def _random_amount(rng: random.Random) -> Tuple[str, Any]:
+    strategy = rng.choices(STRATEGIES, weights=(1, 3, 8, 3, 1, 1))[0]
+    if strategy == 'dust':
+        return strategy, rng.choice((1, 2, 3, 7, 10, 99, 1000))
+    if strategy == 'fraction':
+        # 偏向极小和极大的比例
+        return strategy, rng.choice((1e-9, 1e-6, 1e-3, 0.01, 0.1, 0.5, 0.9, 0.999, 0.999999, rng.random()))
+    if strategy == 'over':
+        return strategy, rng.choice((1, 2, 10 ** 6))
+    if strategy == 'huge':
+        return strategy, rng.choice((62, 63, 64, 127, 128, 255))
+    return strategy, 0
+
+
+def _random_step(rng: random.Random, num_options: int) -> Step:
+    kind = rng.choice(KINDS)
+    option = rng.randrange(num_options)
+    option_in = rng.choice([i for i in range(num_options) if i != option] or [option])
+    strategy, value = _random_amount(rng)
+    return Step(kind, option, option_in, strategy, value)
+
+
+def _pattern(rng: random.Random, num_options: int) -> List[Step]:
+    """对抗性的操作组合"""
+    a = rng.randrange(num_options)
+    b = rng.choice([i for i in range(num_options) if i != a] or [a])
+    pattern = rng.choice(('alternating_swaps', 'round_trip', 'lp_sandwich', 'dust_storm'))
+    if pattern == 'alternating_swaps':
+        steps = [Step('deposit', a, a, *_random_amount(rng))]
+        for i in range(rng.randint(2, 8)):
+            out, sold = (b, a) if i % 2 == 0 else (a, b)
+            steps.append(Step('swap', out, sold, 'all', 0))
+        return steps
+    if pattern == 'round_trip':
+        return [Step('deposit', a, a, *_random_amount(rng)), Step('withdraw', a, a, 'all', 0)]
+    if pattern == 'lp_sandwich':
+        return [Step('deposit', a, a, *_random_amount(rng)),
+                Step('add_liquidity', a, a, *_random_amount(rng)),
+                Step('withdraw', a, a, 'all', 0),
+                Step('remove_liquidity', a, a, 'all', 0)]
+    return [Step(rng.choice(('deposit', 'withdraw')), a, a, 'dust', rng.choice((1, 2, 3)))
+            for _ in range(rng.randint(5, 20))]
+
+
+def generate_case(rng: random.Random, num_options: int, length: int) -> List[Step]:
+    """
+    生成一个操作序列：随机操作中穿插对抗性组合
+
+    Args:
+        rng: 随机数生成器
+        num_options: 选项数量
+        length: 序列的大致长度
+
+    Returns:
+        Step 列表
+    """
+    steps: List[Step] = []
+    while len(steps) < length:
+        if rng.random() < 0.3:
+            steps.extend(_pattern(rng, num_options))
+        else:
+            steps.append(_random_step(rng, num_options))
+    return steps[:length]
+
+
+# ========== 执行与检查 ==========
+
+def execute_step(operator, step: Step, amount: int):
+    """在操作器上执行一步，返回 (tx_hash, success)"""
+    if step.kind == 'swap':
+        return operator.swap(step.option, step.option_in, amount)
+    if step.kind == 'deposit':
+        return operator.deposit(step.option, amount)
+    if step.kind == 'withdraw':
+        return operator.withdraw(step.option, amount)
+    if step.kind == 'add_liquidity':
+        return operator.add_liquidity(amount)
+    return operator.remove_liquidity(amount)
+
+
+def _negative_fields(operator, balances: dict) -> List[str]:
+    fields = [key for key in ('pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance',
+                              'user_lp_balance') if int(balances[key]) < 0]
+    fields += [f'o{i + 1}持仓' for i, value in enumerate(balances['option_balances']) if value < 0]
+    model = getattr(operator, 'model', None)
+    if model is not None:
+        fields += [f'o{i + 1}储备' for i, value in enumerate(model.reserves) if value < 0]
+        if model.lp_supply < 0:
+            fields.append('LP供应量')
+    return fields
+
+
+def evaluate(operator, steps: List[Step], timeout: int = 60) -> Optional[Dict[str, Any]]:
+    """
+    在操作器上执行序列，每步之后检查
+
+    Args:
+        operator: 全新的操作器（离线或分叉节点）
+        steps: 操作序列
+        timeout: 链上交易的确认超时（秒）
+
+    Returns:
+        第一个失败 {'check', 'step', 'detail', 'tx_hash'}，全部通过时返回None
+    """
+    # 每步都检查，不推迟
+    operator.invariants = InvariantChecker(max_overhead=1.0)
+    balances = operator.get_current_balances()
+    operator.record_operation(INIT_OPERATION, 0, None, True, balances, operator.calculate_prices(balances))
+
+    with np.errstate(all='ignore'):
+        for index, step in enumerate(steps):
+            amount = step.resolve(balances)
+            tx_hash = None
+            try:
+                tx_hash, success = execute_step(operator, step, amount)
+                if success and tx_hash:
+                    success, _ = operator.wait_for_transaction(tx_hash, timeout=timeout)
+                balances = operator.get_current_balances()
+            except Exception as e:
+                return {'check': 'exception', 'step': index, 'detail': f'{type(e).__name__}: {e}',
+                        'tx_hash': tx_hash}
+            if balances is None:
+                return {'check': 'exception', 'step': index, 'detail': '读取余额失败', 'tx_hash': tx_hash}
+
+            operator.record_operation(step.name, amount, tx_hash, bool(success), balances,
+                                      operator.calculate_prices(balances))
+            negative = _negative_fields(operator, balances)
+            if negative:
+                return {'check': 'negative', 'step': index, 'detail': f"出现负值: {', '.join(negative)}",
+                        'tx_hash': tx_hash}
+            if operator.invariants.violations:
+                violation = operator.invariants.violations[0]
+                return {'check': violation['check'], 'step': index, 'detail': violation['detail'],
+                        'tx_hash': violation['tx_hash']}
+    return None
+
+
+# ========== 离线模型 ==========
+
+def build_offline(config: Dict[str, Any]):
+    """按配置创建全新的离线操作器"""
+    from benchmark import build_offline_operator
+
+    operator = build_offline_operator(config['num_options'], config['factor'],
+                                      config['liquidity'], config['balance'])
+    operator.model.fee_rate = config['fee_rate']
+    return operator
+
+
+def case_rng(seed: int, index: int) -> random.Random:
+    """第 index 个用例的随机数生成器，同一种子下可以单独复现"""
+    return random.Random(f'{seed}:{index}')
+
+
+def run_cases(config: Dict[str, Any], seed: int, indices: List[int]) -> List[Dict[str, Any]]:
+    """
+    生成并执行一组用例（在工作进程中执行）
+
+    Returns:
+        失败用例列表 {'index', 'steps', 'failure'}
+    """
+    failures = []
+    for index in indices:
+        steps = generate_case(case_rng(seed, index), config['num_options'], config['length'])
+        failure = evaluate(build_offline(config), steps)
+        if failure is not None:
+            failures.append({'index': index, 'steps': [step.to_dict() for step in steps], 'failure': failure})
+    return failures
+
+
+def _fails_same(config: Dict[str, Any], steps: List[Step], check: str) -> Optional[Dict[str, Any]]:
+    failure = evaluate(build_offline(config), steps)
+    return failure if failure is not None and failure['check'] == check else None
+
+
+def shrink(config: Dict[str, Any], steps: List[Step], failure: Dict[str, Any],
+           max_runs: int = MAX_SHRINK_RUNS) -> Tuple[List[Step], Dict[str, Any]]:
+    """
+    把失败序列缩减为仍以同一项检查失败的最小序列
+
+    Args:
+        config: 离线模型配置
+        steps: 失败的序列
+        failure: evaluate 返回的失败信息
+        max_runs: 最多执行的用例数
+
+    Returns:
+        (缩减后的序列, 缩减后的失败信息)
+    """
+    check = failure['check']
+    runs = 0
+    # 失败步之后的操作不影响结果
+    steps = steps[:failure['step'] + 1]
+
+    # 按块删除，块大小从一半逐步减到1
+    chunk = max(len(steps) // 2, 1)
+    while chunk >= 1 and runs < max_runs:
+        removed = False
+        start = 0
+        while start < len(steps) and runs < max_runs:
+            candidate = steps[:start] + steps[start + chunk:]
+            runs += 1
+            result = _fails_same(config, candidate, check) if candidate else None
+            if result is not None:
+                steps, failure = candidate[:result['step'] + 1], result
+                removed = True
+            else:
+                start += chunk
+        if not removed:
+            chunk //= 2
+
+    # 逐步简化金额和选项
+    changed = True
+    while changed and runs < max_runs:
+        changed = False
+        for i, step in enumerate(steps):
+            candidates = [step.replace(strategy=simpler, value=_simplest_value(simpler))
+                          for simpler in SIMPLER.get(step.strategy, ())]
+            if step.strategy in ('dust', 'over', 'fraction', 'huge') and step.value != _simplest_value(step.strategy):
+                candidates.append(step.replace(value=_simplest_value(step.strategy)))
+            if step.option != 0 or step.option_in != min(1, config['num_options'] - 1):
+                candidates.append(step.replace(option=0, option_in=min(1, config['num_options'] - 1)))
+            for simpler_step in candidates:
+                if runs >= max_runs:
+                    break
+                candidate = steps[:i] + [simpler_step] + steps[i + 1:]
+                runs += 1
+                result = _fails_same(config, candidate, check)
+                if result is not None:
+                    steps, failure = candidate[:result['step'] + 1], result
+                    changed = True
+                    break
+            if changed:
+                break
+    return steps, failure
+
+
+def _simplest_value(strategy: str):
+    return {'dust': 1, 'over': 1, 'fraction': 0.5, 'huge': 62}.get(strategy, 0)
+
+
+def shrink_job(config: Dict[str, Any], case: Dict[str, Any]) -> Dict[str, Any]:
+    """缩减一个失败用例（在工作进程中执行）"""
+    steps = [Step.from_dict(data) for data in case['steps']]
+    shrunk, failure = shrink(config, steps, case['failure'])
+    return {
+        'index': case['index'],
+        'check': failure['check'],
+        'detail': failure['detail'],
+        'original_length': len(steps),
+        'steps': [step.to_dict() for step in shrunk],
+        'repro': ' → '.join(repr(step) for step in shrunk),
+    }
+
+
+def fuzz_offline(config: Dict[str, Any], cases: int, seed: int = 0, workers: Optional[int] = None,
+                 batch: int = 50, shrink_per_check: int = 3) -> Dict[str, Any]:
+    """
+    在离线模型上并行生成和执行用例，并缩减失败用例
+
+    Args:
+        config: 离线模型配置（num_options / factor / liquidity / balance / fee_rate / length）
+        cases: 用例数
+        seed: 随机种子
+        workers: 工作进程数，默认为CPU核数
+        batch: 每个任务包含的用例数
+        shrink_per_check: 每项检查最多缩减的失败用例数
+
+    Returns:
+        {'cases', 'failed', 'by_check', 'reproductions'}
+    """
+    failures: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_cases, config, seed, list(range(start, min(start + batch, cases))))
+                   for start in range(0, cases, batch)]
+        for future in as_completed(futures):
+            failures.extend(future.result())
+        failures.sort(key=lambda case: case['index'])
+
+        by_check: Dict[str, int] = {}
+        selected = []
+        for case in failures:
+            check = case['failure']['check']
+            by_check[check] = by_check.get(check, 0) + 1
+            if by_check[check] <= shrink_per_check:
+                selected.append(case)
+        reproductions = list(executor.map(shrink_job, [config] * len(selected), selected))
+
+    # 相同的最小复现只保留一个
+    unique = {}
+    for reproduction in sorted(reproductions, key=lambda item: len(item['steps'])):
+        unique.setdefault((reproduction['check'], reproduction['repro']), reproduction)
+    return {
+        'cases': cases,
+        'failed': len(failures),
+        'by_check': by_check,
+        'reproductions': list(unique.values()),
+    }
+
+
+# ========== 分叉节点重放 ==========
+
+def replay_on_fork(operator, steps: List[Step], timeout: int = 60) -> Optional[Dict[str, Any]]:
+    """
+    在分叉节点上重放序列，结束后回滚链状态
+
+    Args:
+        operator: 连接分叉节点的 ChainContractOperator
+        steps: 操作序列
+        timeout: 交易确认超时（秒）
+
+    Returns:
+        链上的失败信息，全部通过时返回None
+    """
+    from settlement import ForkControl
+
+    fork = ForkControl(operator.web3)
+    snapshot_id = fork.snapshot()
+    # 重放使用单独的历史和统计，结束后恢复
+    history, stats, invariants = operator.operation_history, operator.stats, operator.invariants
+    operator.operation_history, operator.stats = [], OperationStats()
+    try:
+        return evaluate(operator, steps, timeout=timeout)
+    finally:
+        operator.operation_history, operator.stats, operator.invariants = history, stats, invariants
+        fork.revert(snapshot_id)
+
+
+# ========== 命令行 ==========
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Prediction池子的模糊测试")
+    parser.add_argument('--cases', type=int, default=1000, help="用例数")
+    parser.add_argument('--length', type=int, default=40, help="每个用例的操作数")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认为CPU核数")
+    parser.add_argument('--output', help="结果JSON文件路径，默认输出到标准输出")
+
+    offline = parser.add_argument_group('offline')
+    offline.add_argument('--num-options', type=int, default=2, help="选项数量")
+    offline.add_argument('--factor', type=float, default=1e9, help="流动性因子（原始单位）")
+    offline.add_argument('--liquidity', type=int, default=10 ** 12, help="池子初始流动性（原始整数）")
+    offline.add_argument('--balance', type=int, default=10 ** 11, help="账户初始余额（原始整数）")
+    offline.add_argument('--fee-rate', type=float, default=0.0, help="手续费率，例如0.003")
+
+    chain = parser.add_argument_group('fork（在分叉节点上重放缩减后的用例）')
+    chain.add_argument('--fork-url', default=os.environ.get('FORK_URL'), help="本地分叉节点地址")
+    chain.add_argument('--prediction', default=os.environ.get('PREDICTION_ADDRESS'))
+    chain.add_argument('--base-token', default=os.environ.get('BASE_TOKEN_ADDRESS'))
+    chain.add_argument('--account', default=os.environ.get('ACCOUNT_ADDRESS'))
+    chain.add_argument('--account-key', default=os.environ.get('ACCOUNT_PRIVATE_KEY'))
+    chain.add_argument('--lp', default=os.environ.get('LP_PROVIDER_ADDRESS'))
+    chain.add_argument('--lp-key', default=os.environ.get('LP_PROVIDER_PRIVATE_KEY'))
+    chain.add_argument('--rpc-budget', type=float, default=0, help="每秒RPC调用上限，0为不限")
+    chain.add_argument('--timeout', type=int, default=60, help="等待交易确认的超时时间（秒）")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    config = {
+        'num_options': args.num_options,
+        'factor': args.factor,
+        'liquidity': args.liquidity,
+        'balance': args.balance,
+        'fee_rate': args.fee_rate,
+        'length': args.length,
+    }
+
+    print(f"离线模型: {args.cases} 个用例，每个 {args.length} 步...", file=sys.stderr)
+    report = fuzz_offline(config, args.cases, args.seed, args.workers)
+    report.update(seed=args.seed, config=config)
+    print(f"失败 {report['failed']} 个: {report['by_check']}，最小复现 {len(report['reproductions'])} 个",
+          file=sys.stderr)
+
+    if args.fork_url and report['reproductions']:
+        from benchmark import build_chain_operator
+
+        operator = build_chain_operator(args, args.fork_url)
+        for reproduction in report['reproductions']:
+            steps = [Step.from_dict(data) for data in reproduction['steps']]
+            reproduction['fork'] = replay_on_fork(operator, steps, timeout=args.timeout)
+            status = '复现' if reproduction['fork'] else '未复现'
+            print(f"分叉节点{status}: {reproduction['repro']}", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
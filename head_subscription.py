@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+基于WebSocket订阅的区块推送
+
+订阅 newHeads 和 Prediction 合约日志，每个新区块到达时在同一条WebSocket
+连接上按该区块读取一次快照并推送给操作器，等待中的交易收据也由订阅驱动：
+合约日志中出现该交易或新区块到达时才查询一次收据，不再按固定间隔轮询。
+
+订阅在后台线程的事件循环中运行，回调里不能调用 streamlit；页面通过
+latest() / wait_for_block() 读取推送结果。需要 web3 的 WebSocketProvider
+（v7，v6 为 WebsocketProviderV2）。
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# 断线后重连的最长等待时间（秒）
+MAX_RECONNECT_DELAY = 30.0
+
+
+def _websocket_provider(ws_url: str):
+    try:
+        from web3 import WebSocketProvider
+    except ImportError:
+        from web3.providers import WebsocketProviderV2 as WebSocketProvider
+    return WebSocketProvider(ws_url)
+
+
+def _hex(value) -> str:
+    """交易哈希和订阅ID统一为小写0x字符串"""
+    text = value.lower() if isinstance(value, str) else bytes(value).hex()
+    return text if text.startswith('0x') else '0x' + text
+
+
+def _block_number(value) -> int:
+    """区块号可能已格式化为int，也可能是原始十六进制字符串"""
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+class HeadSubscription:
+    """订阅新区块和合约日志，推送快照并解析交易收据"""
+
+    def __init__(self, ws_url: str, contract_address: Union[str, List[str]],
+                 snapshot_calls: Callable[[], List], build_snapshot: Callable[[List[int]], dict]):
+        """
+        Args:
+            ws_url: WebSocket节点地址
+            contract_address: 订阅日志的合约地址，可以是地址列表
+            snapshot_calls: 返回快照所需 RawCall 列表的函数
+            build_snapshot: 把按调用顺序排列的结果转换为余额字典的函数
+        """
+        self.ws_url = ws_url
+        self.contract_address = contract_address
+        self.snapshot_calls = snapshot_calls
+        self.build_snapshot = build_snapshot
+
+        self.block_number: Optional[int] = None
+        self.snapshot: Optional[dict] = None
+        self.heads = 0
+        self.logs = 0
+        self.last_error: Optional[str] = None
+
+        self._condition = threading.Condition()
+        self._pending: Dict[str, Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._current_w3 = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ========== 生命周期 ==========
+
+    def start(self):
+        """在后台线程中启动订阅"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='head-subscription', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """停止订阅，等待中的收据以异常结束"""
+        self._stopped.set()
+        loop, task = self._loop, self._task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for future in list(self._pending.values()):
+            if not future.done():
+                future.set_exception(RuntimeError("区块订阅已停止"))
+        self._pending.clear()
+        with self._condition:
+            self._condition.notify_all()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._task = loop.create_task(self._supervise())
+        try:
+            loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    async def _supervise(self):
+        """断线后按指数退避重连"""
+        delay = 1.0
+        while not self._stopped.is_set():
+            try:
+                await self._listen()
+                delay = 1.0
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"区块订阅中断，{delay:.0f}秒后重连: {str(e)}")
+            if self._stopped.is_set():
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    async def _listen(self):
+        from web3 import AsyncWeb3
+
+        provider = _websocket_provider(self.ws_url)
+        if hasattr(AsyncWeb3, 'persistent_websocket'):
+            connection = AsyncWeb3.persistent_websocket(provider)
+        else:
+            connection = AsyncWeb3(provider)
+
+        async with connection as w3:
+            socket = getattr(w3, 'socket', None) or w3.ws
+            head_id = _hex(await w3.eth.subscribe('newHeads'))
+            log_id = _hex(await w3.eth.subscribe('logs', {'address': self.contract_address}))
+            self.last_error = None
+            self._current_w3 = w3
+
+            # 订阅前可能已经出块，先按最新区块读一次快照并检查已登记的收据
+            await self._on_head(w3, await w3.eth.block_number)
+
+            try:
+                async for message in socket.process_subscriptions():
+                    if self._stopped.is_set():
+                        break
+                    subscription = _hex(message['subscription'])
+                    result = message['result']
+                    if subscription == head_id:
+                        await self._on_head(w3, _block_number(result['number']))
+                    elif subscription == log_id:
+                        await self._on_log(w3, result)
+            finally:
+                self._current_w3 = None
+
+    # ========== 事件处理 ==========
+
+    async def _on_head(self, w3, block_number: int):
+        self.heads += 1
+        calls = self.snapshot_calls()
+        try:
+            raw = await asyncio.gather(*[w3.eth.call(call.params(), block_number) for call in calls])
+            snapshot = self.build_snapshot([call.decode(value) for call, value in zip(calls, raw)])
+        except Exception as e:
+            # 单个区块读取失败不影响订阅，等下一个区块
+            self.last_error = str(e)
+            print(f"区块 {block_number} 快照失败: {str(e)}")
+        else:
+            with self._condition:
+                self.block_number = block_number
+                self.snapshot = snapshot
+                self._condition.notify_all()
+        # 每个区块对仍未确认的交易各查询一次收据
+        for tx_hash in list(self._pending):
+            await self._resolve(w3, tx_hash)
+
+    async def _on_log(self, w3, log):
+        self.logs += 1
+        tx_hash = _hex(log['transactionHash'])
+        if tx_hash in self._pending:
+            await self._resolve(w3, tx_hash)
+
+    async def _resolve(self, w3, tx_hash: str):
+        future = self._pending.get(tx_hash)
+        if future is None or future.done():
+            self._pending.pop(tx_hash, None)
+            return
+        try:
+            receipt = await w3.eth.get_transaction_receipt(tx_hash)
+        except Exception:
+            # 交易尚未打包
+            return
+        if receipt is not None:
+            self._pending.pop(tx_hash, None)
+            future.set_result(receipt)
+
+    # ========== 线程安全的读取接口 ==========
+
+    def latest(self) -> Optional[Tuple[int, dict]]:
+        """最新推送的 (区块号, 快照)，尚未收到区块时返回None"""
+        with self._condition:
+            if self.snapshot is None:
+                return None
+            return self.block_number, self.snapshot
+
+    def snapshot_at(self, min_block: Optional[int] = None, timeout: float = 30.0) -> Optional[dict]:
+        """
+        等待不早于 min_block 的快照
+
+        Args:
+            min_block: 最小区块号，None表示任意已推送的快照
+            timeout: 超时时间（秒）
+
+        Returns:
+            快照字典，超时或订阅未运行时返回None
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.snapshot is None or (min_block is not None and self.block_number < min_block):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.running:
+                    return None
+                self._condition.wait(remaining)
+            return self.snapshot
+
+    def wait_for_block(self, after: Optional[int], timeout: float = 30.0) -> Optional[int]:
+        """
+        等待比 after 更新的区块
+
+        Returns:
+            新区块号，超时返回None
+        """
+        snapshot = self.snapshot_at(None if after is None else after + 1, timeout)
+        return self.block_number if snapshot is not None else None
+
+    def wait_receipt(self, tx_hash: str, timeout: float = 120.0):
+        """
+        等待交易收据，由日志和新区块事件驱动
+
+        Args:
+            tx_hash: 交易哈希
+            timeout: 超时时间（秒）
+
+        Returns:
+            交易收据
+
+        Raises:
+            TimeoutError: 超时未确认
+            RuntimeError: 订阅未运行
+        """
+        loop = self._loop
+        if not self.running or loop is None:
+            raise RuntimeError("区块订阅未运行")
+        key = _hex(tx_hash)
+        future = Future()
+
+        def register():
+            self._pending[key] = future
+            # 交易可能在登记前已经打包，先查一次
+            loop.create_task(self._resolve_now(key))
+
+        loop.call_soon_threadsafe(register)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            loop.call_soon_threadsafe(self._pending.pop, key, None)
+            raise TimeoutError(f"交易 {key} 在 {timeout} 秒内未确认")
+
+    async def _resolve_now(self, tx_hash: str):
+        w3 = self._current_w3
+        if w3 is not None:
+            await self._resolve(w3, tx_hash)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+操作历史的流式导出
+
+按固定行数分块把操作历史转换为DataFrame并逐块写出，支持CSV、Parquet和
+Arrow IPC，内存占用只与块大小有关，与历史总长度无关。Parquet 和 Arrow
+需要安装 pyarrow。
+"""
+
+import csv
+import io
+from typing import BinaryIO, Iterator, List, Union
+
+Target = Union[str, BinaryIO]
+
+DEFAULT_CHUNK_SIZE = 5000
+
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Arrow IPC': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+
+def export_columns(operator) -> List[str]:
+    """导出的列顺序"""
+    options = range(operator.num_options)
+    return (['timestamp', 'operation_id', 'operation', 'amount', 'success', 'tx_hash',
+             'pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance'] +
+            [f'user_o{i + 1}_balance' for i in options] + ['user_lp_balance', 'lp_supply'] +
+            [f'o{i + 1}_price' for i in options])
+
+
+def iter_history_frames(operator, chunk_size: int = DEFAULT_CHUNK_SIZE, scaled: bool = True) -> Iterator:
+    """
+    分块生成操作历史的DataFrame
+
+    Args:
+        operator: ChainContractOperator
+        chunk_size: 每块的行数
+        scaled: 是否换算为显示单位
+
+    Returns:
+        DataFrame迭代器，列顺序与 export_columns 一致
+    """
+    columns = export_columns(operator)
+    total = len(operator.operation_history)
+    for start in range(0, total, chunk_size):
+        yield operator.history_frame(scaled=scaled, start=start, stop=min(start + chunk_size, total))[columns]
+
+
+def _open(target: Target, mode: str):
+    if isinstance(target, str):
+        return open(target, mode), True
+    return target, False
+
+
+def write_csv(operator, target: Target, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    流式写出CSV（UTF-8 BOM，便于Excel打开）
+
+    Args:
+        operator: ChainContractOperator
+        target: 文件路径或二进制文件对象
+        chunk_size: 每块的行数
+
+    Returns:
+        写出的行数
+    """
+    handle, owned = _open(target, 'wb')
+    try:
+        text = io.TextIOWrapper(handle, encoding='utf-8-sig', newline='', write_through=True)
+        writer = csv.writer(text, lineterminator='\n')
+        writer.writerow(export_columns(operator))
+        rows = 0
+        for frame in iter_history_frames(operator, chunk_size):
+            frame.to_csv(text, header=False, index=False)
+            rows += len(frame)
+        text.flush()
+        text.detach()
+        return rows
+    finally:
+        if owned:
+            handle.close()
+
+
+def _arrow_tables(operator, chunk_size: int):
+    import pyarrow as pa
+
+    schema = None
+    for frame in iter_history_frames(operator, chunk_size):
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        schema = table.schema
+        yield table
+
+
+def write_parquet(operator, target: Target, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    流式写出Parquet，每块一个row group
+
+    Args:
+        operator: ChainContractOperator
+        target: 文件路径或二进制文件对象
+        chunk_size: 每块的行数
+
+    Returns:
+        写出的行数
+    """
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for table in _arrow_tables(operator, chunk_size):
+            if writer is None:
+                writer = pq.ParquetWriter(target, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def write_arrow(operator, target: Target, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    流式写出Arrow IPC文件，每块一个record batch
+
+    Args:
+        operator: ChainContractOperator
+        target: 文件路径或二进制文件对象
+        chunk_size: 每块的行数
+
+    Returns:
+        写出的行数
+    """
+    import pyarrow as pa
+
+    writer = None
+    rows = 0
+    try:
+        for table in _arrow_tables(operator, chunk_size):
+            if writer is None:
+                writer = pa.ipc.new_file(target, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+WRITERS = {
+    'CSV': write_csv,
+    'Parquet': write_parquet,
+    'Arrow IPC': write_arrow,
+}
+
+
+def export_history(operator, fmt: str, target: Target, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    按格式名称导出操作历史
+
+    Args:
+        operator: ChainContractOperator
+        fmt: EXPORT_FORMATS 中的格式名称
+        target: 文件路径或二进制文件对象
+        chunk_size: 每块的行数
+
+    Returns:
+        写出的行数
+    """
+    return WRITERS[fmt](operator, target, chunk_size)
+
+
+def summary_csv(operator) -> bytes:
+    """由增量统计生成摘要CSV，不扫描操作历史"""
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator='\n')
+    writer.writerow(["统计项目", "数值"])
+    writer.writerows(operator.stats.summary_rows(operator))
+    return text.getvalue().encode('utf-8-sig')
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+热路径计时
+
+为批量操作的每个阶段（快照、选择操作、构建交易、签名、发送、等待回执、
+操作后快照）以及每个JSON-RPC方法记录耗时，保存在内存中的HDR风格直方图里，
+可以导出为JSON，或通过Prometheus文本格式的HTTP端点暴露。
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# 每个2的幂区间内的线性子桶数量，64个子桶约对应1.5%的相对误差
+SUB_BUCKET_BITS = 6
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+
+
+class Histogram:
+    """对数-线性分桶的直方图，数值以微秒整数记录，内存占用与数值范围的对数成正比"""
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _bucket(value: int) -> int:
+        if value < 2 * SUB_BUCKET_COUNT:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS - 1
+        return shift * SUB_BUCKET_COUNT + (value >> shift)
+
+    @staticmethod
+    def _bucket_value(bucket: int) -> int:
+        """桶的下界"""
+        if bucket < 2 * SUB_BUCKET_COUNT:
+            return bucket
+        shift = bucket // SUB_BUCKET_COUNT - 1
+        return (bucket - shift * SUB_BUCKET_COUNT) << shift
+
+    def record(self, seconds: float):
+        """记录一次耗时（秒）"""
+        value = max(int(seconds * 1e6), 0)
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        """
+        分位数
+
+        Args:
+            p: 0-100之间的百分位
+
+        Returns:
+            耗时（秒）
+        """
+        if self.count == 0:
+            return 0.0
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return min(self._bucket_value(bucket), self.max) / 1e6
+        return self.max / 1e6
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': self.total / 1e6,
+            'mean': self.total / self.count / 1e6 if self.count else 0.0,
+            'min': (self.min or 0) / 1e6,
+            'max': (self.max or 0) / 1e6,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+
+class Instrumentation:
+    """按阶段名称汇总耗时直方图"""
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def record(self, name: str, seconds: float):
+        """记录某个阶段的一次耗时"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        """计时上下文，例如 with registry.stage('snapshot'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def reset(self):
+        """清空全部直方图"""
+        with self._lock:
+            self.histograms.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """各阶段的统计摘要"""
+        with self._lock:
+            return {name: h.to_dict() for name, h in sorted(self.histograms.items())}
+
+    def export_json(self) -> str:
+        """导出为JSON字符串"""
+        return json.dumps(self.summary(), ensure_ascii=False, indent=2)
+
+    def prometheus_text(self) -> str:
+        """导出为Prometheus文本格式（summary类型）"""
+        lines = [
+            '# HELP simulator_stage_seconds Time spent per simulator stage',
+            '# TYPE simulator_stage_seconds summary',
+        ]
+        for name, stats in self.summary().items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            for quantile, key in (('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99')):
+                lines.append(f'simulator_stage_seconds{{stage="{label}",quantile="{quantile}"}} {stats[key]}')
+            lines.append(f'simulator_stage_seconds_sum{{stage="{label}"}} {stats["sum"]}')
+            lines.append(f'simulator_stage_seconds_count{{stage="{label}"}} {stats["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve_prometheus(self, port: int = 9464, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+        """
+        在后台线程启动 /metrics 端点，重复调用时返回已启动的服务
+
+        Args:
+            port: 监听端口
+            host: 监听地址
+
+        Returns:
+            HTTP服务实例
+        """
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+
+def install_rpc_timing(web3, instrumentation: Instrumentation):
+    """
+    在Web3实例上注册中间件，按JSON-RPC方法记录耗时（阶段名为 rpc.<method>）
+
+    Args:
+        web3: Web3实例
+        instrumentation: 记录耗时的 Instrumentation
+    """
+    try:
+        from web3.middleware import Web3Middleware
+    except ImportError:
+        # web3 v6 的函数式中间件
+        def rpc_timing_middleware(make_request, w3):
+            def middleware(method, params):
+                with instrumentation.stage(f'rpc.{method}'):
+                    return make_request(method, params)
+            return middleware
+
+        web3.middleware_onion.add(rpc_timing_middleware, name='rpc_timing')
+        return
+
+    class RpcTimingMiddleware(Web3Middleware):
+        def wrap_make_request(self, make_request):
+            def middleware(method, params):
+                with instrumentation.stage(f'rpc.{method}'):
+                    return make_request(method, params)
+            return middleware
+
+    web3.middleware_onion.add(RpcTimingMiddleware, name='rpc_timing')
+
+
+# 进程内共享的默认注册表
+registry = Instrumentation()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+模拟过程中的不变量检查
+
+操作器每记录一条历史就调用一次 maybe_check()，检查器对上次检查之后新增的
+记录整体做向量化检查，发现问题时连同该记录的交易哈希一起保存：
+- 价格之和：各选项价格之和应接近1
+- 基础代币守恒：池子、交易账户、LP提供者和owner的基础代币总量在每一步保持不变
+- 往返不产生价值：交易账户的选项持仓回到之前的某个状态时，基础代币余额不应多于当时
+  （中间有流动性变化时重新计算）
+- 手续费归owner：owner余额不减少，手续费率大于0时成功的deposit应使owner余额增加
+- 池子偿付能力：池子余额不低于按当前价格计价的未偿选项（LP权益非负），
+  池子有余额时LP供应量不为0。储备和LP供应量取自快照记录，不额外读取链上状态
+
+按已有检查的耗时估算下一次检查的耗时，加上后会超过运行时间的 max_overhead 时推迟到
+下一次调用，推迟期间的记录不会漏检，下次一并检查。
+"""
+
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from chain_operator import BASE_BALANCE_KEYS, PRICE_DECIMALS, int_array, parse_operation
+from operation_stats import INIT_OPERATION
+
+# 检查名称 -> 显示名称
+CHECK_LABELS = {
+    'price_sum': '价格之和',
+    'conservation': '基础代币守恒',
+    'round_trip': '往返不产生价值',
+    'owner_fee': '手续费归owner',
+    'solvency': '池子偿付能力',
+}
+
+# 价格之和允许的相对偏差
+DEFAULT_PRICE_TOLERANCE = 1e-3
+
+# 最多保留的违规记录数
+MAX_VIOLATIONS = 1000
+
+# 往返检查最多记住的持仓状态数，超出时丢弃最久没有出现的状态
+MAX_POSITIONS = 100000
+
+
+class InvariantChecker:
+    """对操作历史增量执行不变量检查"""
+
+    def __init__(self, max_overhead: float = 0.05, price_tolerance: float = DEFAULT_PRICE_TOLERANCE,
+                 balance_tolerance: int = 0):
+        """
+        Args:
+            max_overhead: 检查耗时占运行时间的上限
+            price_tolerance: 价格之和允许的相对偏差
+            balance_tolerance: 余额类检查允许的偏差（原始整数），链上有其他账户交易时可适当放宽
+        """
+        self.max_overhead = max_overhead
+        self.price_tolerance = price_tolerance
+        self.balance_tolerance = int(balance_tolerance)
+
+        self.violations: deque = deque(maxlen=MAX_VIOLATIONS)
+        self.counts: Counter = Counter()
+        self.checked = 0
+        self.deferred = 0
+        self.seconds = 0.0
+        self.started = time.perf_counter()
+
+        self._offset = 0
+        self._positions: OrderedDict = OrderedDict()
+        # 历次检查的 [次数, Σ记录数, Σ记录数², Σ耗时, Σ记录数×耗时]，按 耗时 = a + b × 记录数 拟合
+        self._cost_sums = [0.0] * 5
+        # 最近检查的实际耗时超出估算的部分，每次检查减半
+        self._slack = 0.0
+        self._fee: Optional[int] = None
+
+    def reset(self, start: int = 0):
+        """
+        清空结果
+
+        Args:
+            start: 从第几条历史记录开始重新检查，传入历史长度时只检查之后的新记录
+        """
+        self.__init__(self.max_overhead, self.price_tolerance, self.balance_tolerance)
+        self._offset = start
+
+    @property
+    def overhead(self) -> float:
+        """检查耗时占运行时间的比例"""
+        elapsed = time.perf_counter() - self.started
+        return self.seconds / elapsed if elapsed > 0 else 0.0
+
+    # ========== 调度 ==========
+
+    def projected_cost(self, rows: int) -> float:
+        """
+        估算检查 rows 条新记录的耗时（秒）
+
+        向量化检查有固定开销加每条记录的开销，用历次检查的耗时做最小二乘拟合；
+        历次检查的记录数都相同时按平均耗时估算。
+        """
+        count, total_rows, total_squares, total_seconds, total_products = self._cost_sums
+        cost = 0.0
+        if count:
+            variance = count * total_squares - total_rows ** 2
+            per_row = max((count * total_products - total_rows * total_seconds) / variance, 0.0) if variance > 0 else 0.0
+            fixed = max((total_seconds - per_row * total_rows) / count, 0.0)
+            cost = fixed + per_row * rows
+        return cost
+
+    def maybe_check(self, operator) -> int:
+        """
+        检查新增的记录；预计检查后耗时占比会超过 max_overhead 时推迟
+
+        Args:
+            operator: ChainContractOperator 或 OfflineContractOperator
+
+        Returns:
+            本次发现的违规数
+        """
+        if self._offset >= len(operator.operation_history):
+            return 0
+        if self.checked:
+            now = time.perf_counter()
+            projected = self.projected_cost(len(operator.operation_history) - self._offset)
+            elapsed = now - self.started + projected
+            # 再留出一次最小检查和估算误差的余量，运行结束时强制执行的最后一次检查也不会超出
+            reserve = self.projected_cost(0) + self._slack
+            if elapsed > 0 and (self.seconds + projected + reserve) / elapsed > self.max_overhead:
+                self.deferred += 1
+                return 0
+        return self.check(operator)
+
+    def check(self, operator) -> int:
+        """立即检查新增的记录，返回本次发现的违规数"""
+        start = time.perf_counter()
+        before = sum(self.counts.values())
+        history = operator.operation_history
+        projected = self.projected_cost(len(history) - self._offset)
+        # 带上前一条记录用于计算差分
+        first = max(self._offset - 1, 0)
+        rows = history[first:]
+        if rows:
+            self._check_rows(operator, rows, first)
+            count = len(history) - self._offset
+            seconds = time.perf_counter() - start
+            for i, value in enumerate((1, count, count * count, seconds, count * seconds)):
+                self._cost_sums[i] += value
+            self.checked += count
+            self._offset = len(history)
+        seconds = time.perf_counter() - start
+        self.seconds += seconds
+        self._slack = max(self._slack / 2, seconds - projected)
+        return sum(self.counts.values()) - before
+
+    def _record(self, check: str, index: int, record: dict, detail: str):
+        self.counts[check] += 1
+        self.violations.append({
+            'row': int(index),
+            'timestamp': record['timestamp'],
+            'operation': record['operation'],
+            'tx_hash': record['tx_hash'],
+            'check': check,
+            'detail': detail,
+        })
+
+    # ========== 历史记录检查 ==========
+
+    def _check_rows(self, operator, rows: List[dict], first: int):
+        # 18位小数的基础代币余额可能超出int64，int_array 会退回object数组保持精确
+        base = int_array([record[key] for record in rows for key in BASE_BALANCE_KEYS]).reshape(len(rows), -1)
+        prices = np.vstack([record['option_prices'] for record in rows]).astype(np.int64)
+        operations = [record['operation'] for record in rows]
+        success = np.array([record['success'] for record in rows], dtype=bool)
+        # 第一行是上次已检查的记录时只用于差分
+        skip = 1 if first < self._offset else 0
+
+        self._check_price_sum(rows, prices, first, skip)
+        self._check_solvency(rows, prices, base[:, 0], first, skip)
+
+        owner_distinct = self._owner_distinct(operator)
+        accounts = base if owner_distinct else base[:, :3]
+        if len(rows) > 1:
+            delta_total = np.diff(accounts.sum(axis=1))
+            delta_owner = np.diff(base[:, 3])
+            is_init = np.array([operation == INIT_OPERATION for operation in operations[1:]], dtype=bool)
+
+            # 基础代币守恒
+            for i in np.flatnonzero((np.abs(delta_total) > self.balance_tolerance) & ~is_init):
+                self._record('conservation', first + i + 1, rows[i + 1],
+                             f"各账户的基础代币合计变化 {int(delta_total[i])}")
+
+            # 手续费归owner
+            if owner_distinct:
+                for i in np.flatnonzero((delta_owner < -self.balance_tolerance) & ~is_init):
+                    self._record('owner_fee', first + i + 1, rows[i + 1],
+                                 f"owner余额减少 {int(-delta_owner[i])}")
+                fee_rate = self._fee_rate(operator)
+                if fee_rate > 0:
+                    deposits = np.array([parse_operation(operation)[0] == 'deposit'
+                                         for operation in operations[1:]], dtype=bool)
+                    # 手续费向下取整为0的小额交易不要求owner余额增加
+                    amounts = np.array([int(record['amount'] or 0) for record in rows[1:]], dtype=np.float64)
+                    charged = amounts * fee_rate >= 1e6
+                    for i in np.flatnonzero(deposits & charged & success[1:] & (delta_owner <= 0)):
+                        self._record('owner_fee', first + i + 1, rows[i + 1], "交易成功但owner没有收到手续费")
+
+        self._check_round_trip(rows, operations, success, first, skip)
+
+    def _check_price_sum(self, rows: List[dict], prices: np.ndarray, first: int, skip: int):
+        scale = 10 ** PRICE_DECIMALS
+        totals = prices[skip:].sum(axis=1)
+        # 每个价格向下取整最多差1，全0表示快照失败，不检查
+        tolerance = self.price_tolerance * scale + prices.shape[1]
+        for i in np.flatnonzero((totals != 0) & (np.abs(totals - scale) > tolerance)):
+            self._record('price_sum', first + skip + i, rows[skip + i],
+                         f"价格之和 {totals[i] / scale:.6f}")
+
+    def _check_solvency(self, rows: List[dict], prices: np.ndarray, pool_balance: np.ndarray,
+                        first: int, skip: int):
+        # 较早的检查点中的记录没有 reserves / lp_supply，跳过
+        index = np.array([i for i in range(skip, len(rows)) if 'reserves' in rows[i] and 'lp_supply' in rows[i]],
+                         dtype=np.int64)
+        if len(index) == 0:
+            return
+        reserves = np.vstack([np.asarray(rows[i]['reserves'], dtype=np.float64) for i in index])
+        liabilities = np.ceil(np.einsum('ij,ij->i', prices[index] / 10 ** PRICE_DECIMALS, reserves))
+        balance = pool_balance[index]
+        equity = balance.astype(np.float64) - liabilities
+        for i in np.flatnonzero(equity < -self.balance_tolerance):
+            self._record('solvency', first + index[i], rows[index[i]],
+                         f"池子余额 {int(balance[i])} 低于未偿选项价值 {int(liabilities[i])}")
+        lp_supply = int_array([rows[i]['lp_supply'] for i in index])
+        for i in np.flatnonzero((balance > 0) & (lp_supply == 0)):
+            self._record('solvency', first + index[i], rows[index[i]], "池子有余额但LP供应量为0")
+
+    def _check_round_trip(self, rows: List[dict], operations: List[str], success: np.ndarray,
+                          first: int, skip: int):
+        for i in range(skip, len(rows)):
+            record = rows[i]
+            if operations[i] in ('add_liquidity', 'remove_liquidity') and success[i]:
+                # 流动性深度变化后价格路径不同，之前的持仓状态不再可比
+                self._positions.clear()
+            key = tuple(int(value) for value in record['option_balances'])
+            user_balance = int(record['user_balance'])
+            previous = self._positions.get(key)
+            if previous is not None and user_balance > previous + self.balance_tolerance:
+                self._record('round_trip', first + i, record,
+                             f"持仓回到之前的状态，基础代币多出 {user_balance - previous}")
+            self._positions[key] = user_balance
+            self._positions.move_to_end(key)
+            if len(self._positions) > MAX_POSITIONS:
+                self._positions.popitem(last=False)
+
+    # ========== 链上状态检查 ==========
+
+    @staticmethod
+    def _owner_distinct(operator) -> bool:
+        """owner 与交易账户或LP提供者是同一地址时，owner余额不单独计入"""
+        owner = getattr(operator, 'owner', None)
+        if owner is None:
+            return True
+        return owner.lower() not in (operator.ACCOUNT_ADDRESS.lower(), operator.LP_PROVIDER_ADDRESS.lower())
+
+    def _fee_rate(self, operator) -> int:
+        """手续费率，只读取一次；离线模型返回按1e6换算的费率"""
+        if self._fee is None:
+            model = getattr(operator, 'model', None)
+            if model is not None:
+                self._fee = int(round(model.fee_rate * 1e6))
+            else:
+                try:
+                    # state() 只返回 fee
+                    self._fee = int(operator.prediction_for_trade.get_state())
+                except Exception:
+                    self._fee = 0
+        return self._fee
+
+    # ========== 结果 ==========
+
+    def summary(self) -> Dict[str, Any]:
+        """检查次数、耗时占比和各项违规数"""
+        return {
+            'checked': self.checked,
+            'deferred': self.deferred,
+            'overhead': self.overhead,
+            'violations': {CHECK_LABELS[name]: self.counts.get(name, 0) for name in CHECK_LABELS},
+        }
+
+    def violation_rows(self) -> List[dict]:
+        """违规记录，最新的在前"""
+        return [dict(violation, check=CHECK_LABELS[violation['check']]) for violation in reversed(self.violations)]
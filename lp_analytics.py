@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LP收益与无常损失分析
+
+每条操作历史都带有池子余额、价格、储备和LP供应量，据此逐步给LP代币按市价估值：
+    LP权益 = 池子余额 - Σ 价格 × 储备
+    每LP净值 = LP权益 / LP供应量
+
+交易前后LP供应量不变，相邻两步之间每LP净值的变化拆分为两部分：
+- 手续费收入：池子收到的基础代币减去不含手续费的LMSR成本变化 ΔC = C(q') - C(q)，
+  C(q) = b·ln Σ w_i·exp(q_i/b)。流动性因子 b 和权重 w 不需要从合约读取：两次流动性变化之间
+  两者不变，由 ln(p_i/p_0) = ln(w_i/w_0) + (q_i - q_0)/b，对这一段中价格都不太小的记录做线性拟合
+  即可得到，b 与LP供应量同比缩放。价格按定点小数向下取整，接近0的价格相对误差很大，不参与拟合；
+  成本只用精确的储备计算，不受价格取整影响。这一段无法拟合时按交易前后的价格逐行估算，
+  再不行用交易前后平均价格计价的新增储备近似。取整等原因使池子多收的部分同样计入这一项
+- 库存损益：储备按价格变化重新估值，即池子持有的选项头寸随价格移动产生的损益
+
+每个LP按上一步的持有量分摊每步的收入和损益。添加/移除流动性时支付或收回的基础代币与
+得到或交出的LP代币市值之差计入"流动性损益"（包括其他LP添加/移除流动性对每LP净值的影响）。
+净投入为添加流动性支付减去移除流动性收回的基础代币，于是
+    PnL = 当前市值 - 净投入 = 手续费收入 + 库存损益 + 流动性损益
+无常损失为相对于一直持有投入的基础代币、不计手续费收入时的损失，即 手续费收入 - PnL。
+计算全部在 numpy 数组上向量化完成，支持多个LP。
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from chain_operator import PRICE_DECIMALS
+
+# 默认LP的显示名称
+DEFAULT_LP_NAME = 'LP提供者'
+
+# 价格对数变化小于该值时，用平均价格近似成本变化
+MIN_LOG_PRICE_MOVE = 1e-3
+
+# 参与拟合 b 和权重的记录中各选项价格的下限，按 PRICE_DECIMALS 取整后相对误差不超过 1e-3
+MIN_FIT_PRICE = 1e-3
+
+# 按 PRICE_DECIMALS 取整造成的价格差，流动性变化前后的价格差不超过它时视为价格不变
+MAX_PRICE_ROUNDING = 2.0 / 10 ** PRICE_DECIMALS
+
+
+def estimate_factor(prices_before: np.ndarray, prices_after: np.ndarray, reserve_changes: np.ndarray) -> np.ndarray:
+    """
+    由交易前后的价格和储备变化估计每行的流动性因子 b，逐行向量化
+
+    ln(p_i'/p_i) = Δq_i/b - ln(Z'/Z)，对各选项做线性拟合，斜率为 1/b
+
+    Returns:
+        流动性因子数组，价格变化太小或有价格为0、拟合不稳定的行为NaN
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.log(prices_after / prices_before)
+        x = reserve_changes
+        x_centered = x - x.mean(axis=1, keepdims=True)
+        slope = (x_centered * y).sum(axis=1) / (x_centered ** 2).sum(axis=1)
+        factor = 1.0 / slope
+    stable = (np.isfinite(y).all(axis=1) & (slope > 0) & np.isfinite(factor) &
+              (np.abs(y).max(axis=1, initial=0.0) >= MIN_LOG_PRICE_MOVE))
+    return np.where(stable, factor, np.nan)
+
+
+def fit_lmsr(prices: np.ndarray, reserves: np.ndarray, factor: Optional[float] = None):
+    """
+    由同一段（b 和权重不变）的价格和储备拟合流动性因子和对数权重
+
+    ln(p_i/p_0) = ln(w_i/w_0) + (q_i - q_0)/b，各选项共用斜率 1/b、各自截距，
+    只用各选项价格都不小于 MIN_FIT_PRICE 的记录
+
+    Args:
+        prices: 价格，形状 (步数, 选项数)，为0到1的小数
+        reserves: 储备，形状 (步数, 选项数)
+        factor: 已知的流动性因子，None时一并拟合
+
+    Returns:
+        (b, 相对选项0的对数权重数组)，记录不足以拟合时为 (None, None)
+    """
+    accurate = (prices >= MIN_FIT_PRICE).all(axis=1)
+    if not accurate.any() or prices.shape[1] < 2:
+        return None, None
+    with np.errstate(divide='ignore'):
+        log_prices = np.log(prices[accurate])
+    y = log_prices[:, 1:] - log_prices[:, :1]
+    x = (reserves[accurate][:, 1:] - reserves[accurate][:, :1]).astype(np.float64)
+    if factor is None:
+        x_centered = x - x.mean(axis=0)
+        spread = (x_centered ** 2).sum()
+        if spread <= 0:
+            return None, None
+        slope = (x_centered * (y - y.mean(axis=0))).sum() / spread
+        if slope <= 0:
+            return None, None
+        factor = 1.0 / slope
+    log_weights = np.concatenate(([0.0], (y - x / factor).mean(axis=0)))
+    return float(factor), log_weights
+
+
+def _log_sum_exp(values: np.ndarray) -> np.ndarray:
+    shift = np.max(values, axis=1, keepdims=True)
+    shift = np.where(np.isfinite(shift), shift, 0.0)
+    return np.log(np.exp(values - shift).sum(axis=1)) + shift[:, 0]
+
+
+def lmsr_cost_change(prices_before: np.ndarray, prices_after: np.ndarray, reserve_changes: np.ndarray,
+                     factor: np.ndarray) -> np.ndarray:
+    """
+    LMSR成本变化，逐行向量化
+
+    ΔC = b·ln Σ p_i·exp(Δq_i/b) = -b·ln Σ p_i'·exp(-Δq_i/b)。价格按定点小数向下取整，
+    指数项放大的是取整误差，每行选最大指数较小的一边计算：买入时用交易后价格，卖出时用交易前价格。
+    取整为0的价格丢掉了该选项的全部权重，这一边有价格为0时改用另一边，两边都有时该行为NaN
+
+    Args:
+        prices_before: 交易前价格，形状 (步数, 选项数)
+        prices_after: 交易后价格
+        reserve_changes: 储备变化
+        factor: 每行的流动性因子
+
+    Returns:
+        成本变化数组，无法计算的行为NaN
+    """
+    factor = np.asarray(factor, dtype=np.float64)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        scaled = reserve_changes / factor
+        before = factor[:, 0] * _log_sum_exp(np.log(prices_before) + scaled)
+        after = -factor[:, 0] * _log_sum_exp(np.log(prices_after) - scaled)
+        use_before = scaled.max(axis=1, initial=0.0) <= (-scaled).max(axis=1, initial=0.0)
+    before_valid = (prices_before > 0).all(axis=1)
+    after_valid = (prices_after > 0).all(axis=1)
+    use_before = np.where(before_valid & after_valid, use_before, before_valid)
+    cost = np.where(use_before, before, after)
+    cost = np.where(before_valid | after_valid, cost, np.nan)
+    return np.where(np.isfinite(cost), cost, np.nan)
+
+
+def _last_valid(values: np.ndarray) -> np.ndarray:
+    """把NaN替换为之前最近的有效值，开头的NaN保持不变"""
+    index = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+
+class LPAnalytics:
+    """按操作历史计算LP代币市值、收益拆分和各LP的PnL"""
+
+    def __init__(self, pool_balance, prices, reserves, lp_supply, operations: Optional[List[str]] = None):
+        """
+        Args:
+            pool_balance: 每步的池子基础代币余额（原始整数）
+            prices: 每步各选项价格，形状 (步数, 选项数)，按 PRICE_DECIMALS 定点
+            reserves: 每步各选项储备，形状 (步数, 选项数)
+            lp_supply: 每步的LP供应量
+            operations: 每步的操作名称
+        """
+        self.pool_balance = np.asarray(pool_balance, dtype=np.float64)
+        self.prices = np.asarray(prices, dtype=np.float64) / 10 ** PRICE_DECIMALS
+        self.reserves = np.asarray(reserves, dtype=np.float64)
+        self.lp_supply = np.asarray(lp_supply, dtype=np.float64)
+        self.operations = list(operations) if operations is not None else [''] * len(self.pool_balance)
+        self.positions: Dict[str, Dict[str, np.ndarray]] = {}
+
+        self.equity = self.pool_balance - np.einsum('ij,ij->i', self.prices, self.reserves)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            nav = np.where(self.lp_supply > 0, self.equity / self.lp_supply, np.nan)
+        self.nav = nav
+        self._decompose()
+
+    @classmethod
+    def from_operator(cls, operator) -> "LPAnalytics":
+        """
+        从操作器的操作历史创建，默认LP为操作器的LP提供者
+
+        Args:
+            operator: ChainContractOperator 或 OfflineContractOperator
+
+        Returns:
+            LPAnalytics
+        """
+        history = operator.operation_history
+        n = operator.num_options
+        empty = np.zeros(n, dtype=np.int64)
+        analytics = cls(
+            [record['pool_balance'] for record in history],
+            np.vstack([record['option_prices'] for record in history]) if history else np.zeros((0, n)),
+            # 较早的检查点中没有储备和LP供应量，这些步不估值
+            np.vstack([record.get('reserves', empty) for record in history]) if history else np.zeros((0, n)),
+            [record.get('lp_supply', 0) for record in history],
+            [record['operation'] for record in history],
+        )
+        analytics.add_position(DEFAULT_LP_NAME,
+                               [record['user_lp_balance'] for record in history],
+                               base_balances=[record['lp_provider_balance'] for record in history])
+        return analytics
+
+    def __len__(self) -> int:
+        return len(self.pool_balance)
+
+    @property
+    def has_data(self) -> bool:
+        """是否有可以估值的步"""
+        return bool(np.isfinite(self.nav).any())
+
+    # ========== 每LP净值拆分 ==========
+
+    def _decompose(self):
+        """逐步拆分每LP净值的变化: 手续费收入 + 库存损益 + 其他 = 净值变化"""
+        steps = len(self)
+        self.fee_income = np.zeros(steps)
+        self.inventory = np.zeros(steps)
+        self.other = np.zeros(steps)
+        # 流动性因子与LP供应量之比，无法估计时为None
+        self.factor_per_lp: Optional[float] = None
+        if steps < 2:
+            return
+
+        supply = self.lp_supply
+        valid = np.isfinite(self.nav[1:]) & np.isfinite(self.nav[:-1])
+        # LP供应量不变的步是交易，变化的步是添加/移除流动性
+        trade = valid & (supply[1:] == supply[:-1])
+        reserve_changes = np.diff(self.reserves, axis=0)
+        middle_prices = (self.prices[:-1] + self.prices[1:]) / 2
+        cost = np.einsum('ij,ij->i', middle_prices, reserve_changes)
+
+        # 两次流动性变化之间为一段，段内 b 和权重不变
+        segment = np.concatenate(([0], np.cumsum(supply[1:] != supply[:-1])))
+        bounds = np.flatnonzero(np.diff(segment)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [steps]))
+        fits = [fit_lmsr(self.prices[start:end], self.reserves[start:end]) for start, end in zip(starts, ends)]
+        # 流动性因子与LP供应量同比缩放，各段拟合结果的中位数用于无法单独拟合的段
+        ratios = np.array([factor / supply[start] for (factor, _), start in zip(fits, starts)
+                           if factor is not None and supply[start] > 0])
+        if not len(ratios):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratios = estimate_factor(self.prices[:-1], self.prices[1:], reserve_changes)[trade] / supply[1:][trade]
+            ratios = ratios[np.isfinite(ratios)]
+        self.factor_per_lp = float(np.median(ratios)) if len(ratios) else None
+
+        if self.factor_per_lp is not None:
+            exact = lmsr_cost_change(self.prices[:-1], self.prices[1:], reserve_changes,
+                                     self.factor_per_lp * supply[1:])
+            cost = np.where(np.isnan(exact), cost, exact)
+            previous = None
+            for start, end in zip(starts, ends):
+                if supply[start] <= 0:
+                    previous = None
+                    continue
+                # 单独一段的记录少、储备变化范围小，斜率不如各段的中位数可靠，b 统一按中位数
+                factor, log_weights = fit_lmsr(self.prices[start:end], self.reserves[start:end],
+                                               self.factor_per_lp * supply[start])
+                if log_weights is None and previous is not None and start > 0 and \
+                        np.abs(self.prices[start] - self.prices[start - 1]).max() <= MAX_PRICE_ROUNDING:
+                    # 这一段的价格都太接近0或1时，流动性变化前后价格不变，由上一段末尾的状态推出权重
+                    previous_factor, previous_weights = previous
+                    factor = self.factor_per_lp * supply[start]
+                    log_weights = (previous_weights + self.reserves[start - 1] / previous_factor
+                                   - self.reserves[start] / factor)
+                    log_weights = log_weights - log_weights[0]
+                if log_weights is None:
+                    previous = None
+                    continue
+                previous = (factor, log_weights)
+                if end - start < 2:
+                    continue
+                with np.errstate(over='ignore'):
+                    level = factor * _log_sum_exp(log_weights + self.reserves[start:end] / factor)
+                # 段内相邻两步的成本差，第 start 步与上一段之间的变化不属于段内
+                cost[start:end - 1] = np.diff(level)
+        # 两项之和恰好等于LP权益的变化
+        fee = np.diff(self.pool_balance) - cost
+        revaluation = np.diff(self.equity) - fee
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.fee_income[1:] = np.where(trade, fee / supply[1:], 0.0)
+            self.inventory[1:] = np.where(trade, revaluation / supply[1:], 0.0)
+            self.other[1:] = np.where(valid & ~trade, np.diff(self.nav), 0.0)
+
+    # ========== 各LP头寸 ==========
+
+    def add_position(self, name: str, lp_balances, flows=None, base_balances=None):
+        """
+        添加一个LP的头寸，多LP运行时每个LP调用一次
+
+        Args:
+            name: LP名称
+            lp_balances: 每步持有的LP代币数量
+            flows: 每步投入的基础代币（添加流动性为正，移除为负），与 base_balances 二选一
+            base_balances: 每步该LP账户的基础代币余额，LP代币数量变化的步按余额变化推算投入
+        """
+        lp_balances = np.asarray(lp_balances, dtype=np.float64)
+        if flows is None:
+            flows = np.zeros(len(lp_balances))
+            if base_balances is not None and len(lp_balances) > 1:
+                base_balances = np.asarray(base_balances, dtype=np.float64)
+                changed = np.diff(lp_balances) != 0
+                flows[1:] = np.where(changed, -np.diff(base_balances), 0.0)
+        flows = np.asarray(flows, dtype=np.float64)
+
+        nav = _last_valid(self.nav)
+        held = np.concatenate(([0.0], lp_balances[:-1]))
+        value = np.nan_to_num(lp_balances * nav)
+        # 第一步已持有的LP代币按当时的市值视为投入
+        contributed = np.cumsum(flows)
+        if len(value):
+            contributed += value[0]
+        fee_pnl = np.cumsum(held * self.fee_income)
+        pnl = value - contributed
+        # 换取的LP代币按成交后净值计价与实际收付的差额，加上其他LP的流动性变化对净值的影响
+        traded = np.concatenate(([0.0], np.diff(lp_balances))) * np.nan_to_num(nav)
+        traded[0] = 0.0
+        liquidity = np.cumsum(held * self.other + traded - np.concatenate(([0.0], flows[1:])))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            previous_nav = np.concatenate(([np.nan], self.nav[:-1]))
+            step_return = np.where((held > 0) & (previous_nav > 0),
+                                   (self.fee_income + self.inventory + self.other) / previous_nav, 0.0)
+        step_return = np.nan_to_num(step_return)
+
+        self.positions[name] = {
+            'lp_balance': lp_balances,
+            'value': value,
+            'contributed': contributed,
+            'pnl': pnl,
+            'fee_income': fee_pnl,
+            'inventory': np.cumsum(held * self.inventory),
+            'liquidity': liquidity,
+            # 相对于持有投入的基础代币、不计手续费收入时的损失
+            'impermanent_loss': fee_pnl - pnl,
+            'return': np.cumprod(1.0 + step_return) - 1.0,
+        }
+
+    # ========== 结果 ==========
+
+    def summary_rows(self, base_decimals: int = 6) -> List[dict]:
+        """
+        每个LP一行的汇总
+
+        Args:
+            base_decimals: 基础代币小数位数
+
+        Returns:
+            行列表，金额为显示单位
+        """
+        scale = 10.0 ** base_decimals
+        rows = []
+        for name, position in self.positions.items():
+            if not len(position['value']):
+                continue
+            contributed = position['contributed']
+            peak = float(np.max(contributed)) if len(contributed) else 0.0
+            rows.append({
+                'LP': name,
+                '当前市值': position['value'][-1] / scale,
+                '净投入': contributed[-1] / scale,
+                'PnL': position['pnl'][-1] / scale,
+                '手续费收入': position['fee_income'][-1] / scale,
+                '库存损益': position['inventory'][-1] / scale,
+                '流动性损益': position['liquidity'][-1] / scale,
+                '无常损失': position['impermanent_loss'][-1] / scale,
+                '资金收益率': position['pnl'][-1] / peak if peak > 0 else 0.0,
+                '时间加权收益率': position['return'][-1],
+            })
+        return rows
+
+    def frame(self, base_decimals: int = 6, lp_decimals: int = 6):
+        """
+        逐步的估值和收益序列
+
+        Args:
+            base_decimals: 基础代币小数位数
+            lp_decimals: LP代币小数位数
+
+        Returns:
+            DataFrame，每LP净值以"基础代币/LP代币"为单位，各LP列名以LP名称为前缀
+        """
+        import pandas as pd
+
+        scale = 10.0 ** base_decimals
+        df = pd.DataFrame({
+            'operation_id': np.arange(len(self)),
+            'operation': self.operations,
+            'lp_equity': self.equity / scale,
+            'nav': self.nav * 10.0 ** (lp_decimals - base_decimals),
+            'fee_income_per_lp': np.cumsum(self.fee_income) * 10.0 ** (lp_decimals - base_decimals),
+            'inventory_per_lp': np.cumsum(self.inventory) * 10.0 ** (lp_decimals - base_decimals),
+        })
+        for name, position in self.positions.items():
+            for key in ('value', 'pnl', 'fee_income', 'inventory', 'liquidity', 'impermanent_loss'):
+                df[f'{name}_{key}'] = position[key] / scale
+            df[f'{name}_return'] = position['return']
+        return df
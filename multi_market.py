@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+多市场编排器
+
+在一次运行中同时驱动多个Prediction市场：所有市场共用RPC连接池、
+nonce管理器和合约封装缓存，每个市场支持任意数量的选项（通过 options() 获取），
+不同市场的操作在线程池中并发调度，同一市场内的操作按顺序执行。
+"""
+
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+from erc20_contract import ERC20Contract
+from nonce_manager import NonceManager
+from prediction_contract import PredictionContract
+
+# 与 init_contracts 中的授权阈值保持一致
+APPROVE_THRESHOLD = 100000000000000000000000000000000000000
+APPROVE_AMOUNT = 1000000000000000000000000000000000000000
+
+DEFAULT_WEIGHTS = {
+    'deposit': 60,
+    'withdraw': 50,
+    'add_liquidity': 20,
+    'remove_liquidity': 10,
+}
+
+
+class RpcPool:
+    """共享的RPC连接池，每个节点一个Web3实例，轮询分配"""
+
+    def __init__(self, rpc_urls: Sequence[str]):
+        """
+        Args:
+            rpc_urls: RPC节点地址列表（需指向同一条链）
+        """
+        from web3 import Web3
+
+        if not rpc_urls:
+            raise ValueError("至少需要一个RPC节点")
+        self.clients = [Web3(Web3.HTTPProvider(url)) for url in rpc_urls]
+        self._cycle = itertools.cycle(self.clients)
+        self._lock = threading.Lock()
+        # nonce统一从第一个节点读取，避免不同节点间的pending视图不一致
+        self.nonce_manager = NonceManager(self.clients[0])
+
+    def next(self):
+        """取下一个Web3实例"""
+        with self._lock:
+            return next(self._cycle)
+
+
+class Market:
+    """单个Prediction市场及其相关合约封装"""
+
+    def __init__(self, address: str, trader: PredictionContract, lp_provider: PredictionContract,
+                 base_token: ERC20Contract, lp_token: ERC20Contract, option_tokens: List[ERC20Contract]):
+        self.address = address
+        self.trader = trader
+        self.lp_provider = lp_provider
+        self.base_token = base_token
+        self.lp_token = lp_token
+        self.option_tokens = option_tokens
+        self.lock = threading.Lock()
+
+    @property
+    def num_options(self) -> int:
+        return len(self.option_tokens)
+
+
+class MarketOrchestrator:
+    """同时驱动多个Prediction市场的编排器"""
+
+    def __init__(self, rpc_urls: Sequence[str], account_address: str, account_private_key: str,
+                 lp_provider_address: str, lp_provider_private_key: str, max_workers: int = 16):
+        """
+        初始化编排器
+
+        Args:
+            rpc_urls: RPC节点地址列表
+            account_address: 交易账户地址
+            account_private_key: 交易账户私钥
+            lp_provider_address: LP提供者地址
+            lp_provider_private_key: LP提供者私钥
+            max_workers: 并发执行的市场数
+        """
+        self.rpc_pool = RpcPool(rpc_urls)
+        self.account_address = account_address
+        self.account_private_key = account_private_key
+        self.lp_provider_address = lp_provider_address
+        self.lp_provider_private_key = lp_provider_private_key
+        self.max_workers = max_workers
+        self.markets: Dict[str, Market] = {}
+        # (代币地址, 账户地址) -> ERC20Contract，多个市场共用同一个基础代币
+        self._erc20_cache: Dict[tuple, ERC20Contract] = {}
+        self._cache_lock = threading.Lock()
+
+    def _erc20(self, token_address: str, account_address: str, private_key: str) -> ERC20Contract:
+        key = (token_address.lower(), account_address.lower())
+        with self._cache_lock:
+            if key not in self._erc20_cache:
+                self._erc20_cache[key] = ERC20Contract(
+                    web3=self.rpc_pool.next(),
+                    token_address=token_address,
+                    private_key=private_key,
+                    account_address=account_address,
+                    nonce_manager=self.rpc_pool.nonce_manager
+                )
+            return self._erc20_cache[key]
+
+    def _ensure_allowance(self, token: ERC20Contract, spender: str):
+        allowance = token.get_allowance(token.account_address, spender)
+        if allowance < APPROVE_THRESHOLD:
+            tx_hash = token.approve(spender, APPROVE_AMOUNT)
+            receipt = token.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            if receipt.status != 1:
+                raise RuntimeError(f"approve失败: {tx_hash}")
+
+    def add_market(self, prediction_address: str) -> Market:
+        """
+        添加一个市场，读取其全部选项并完成基础代币授权
+
+        Args:
+            prediction_address: Prediction合约地址
+
+        Returns:
+            Market
+        """
+        nonce_manager = self.rpc_pool.nonce_manager
+        trader = PredictionContract(
+            web3=self.rpc_pool.next(),
+            prediction_address=prediction_address,
+            private_key=self.account_private_key,
+            account_address=self.account_address,
+            nonce_manager=nonce_manager
+        )
+        lp_provider = PredictionContract(
+            web3=self.rpc_pool.next(),
+            prediction_address=prediction_address,
+            private_key=self.lp_provider_private_key,
+            account_address=self.lp_provider_address,
+            nonce_manager=nonce_manager
+        )
+        base_token_address = trader.get_base_token()
+        base_token = self._erc20(base_token_address, self.account_address, self.account_private_key)
+        base_token_for_lp = self._erc20(base_token_address, self.lp_provider_address,
+                                        self.lp_provider_private_key)
+        self._ensure_allowance(base_token, prediction_address)
+        self._ensure_allowance(base_token_for_lp, prediction_address)
+
+        option_tokens = [self._erc20(option, self.account_address, self.account_private_key)
+                         for option in trader.get_options()]
+        lp_token = self._erc20(prediction_address, self.lp_provider_address, self.lp_provider_private_key)
+
+        market = Market(prediction_address, trader, lp_provider, base_token, lp_token, option_tokens)
+        self.markets[prediction_address] = market
+        print(f"已添加市场 {prediction_address}，选项数: {market.num_options}")
+        return market
+
+    def snapshot(self, market: Market) -> Dict[str, object]:
+        """读取市场当前的账户余额和价格（原始单位）"""
+        return {
+            'user_balance': market.base_token.get_balance_of(self.account_address),
+            'lp_provider_balance': market.base_token.get_balance_of(self.lp_provider_address),
+            'user_lp_balance': market.lp_token.get_balance_of(self.lp_provider_address),
+            'option_balances': [token.get_balance_of(self.account_address) for token in market.option_tokens],
+            'option_prices': [market.trader.get_price(i) for i in range(market.num_options)],
+        }
+
+    def plan_operation(self, market: Market, balances: Dict[str, object], rng: random.Random,
+                       weights: Dict[str, int]) -> Optional[tuple]:
+        """
+        根据余额和权重选择一次操作
+
+        Returns:
+            (操作类型, 选项索引, 金额)，没有可用操作时返回None
+        """
+        candidates = []
+        if balances['user_balance'] > 10 ** 6:
+            candidates += [('deposit', i) for i in range(market.num_options)]
+        candidates += [('withdraw', i) for i, b in enumerate(balances['option_balances']) if b > 10 ** 5]
+        if balances['lp_provider_balance'] > 10 ** 6:
+            candidates.append(('add_liquidity', -1))
+        if balances['user_lp_balance'] > 10 ** 5:
+            candidates.append(('remove_liquidity', -1))
+        candidates = [c for c in candidates if weights.get(c[0], 0) > 0]
+        if not candidates:
+            return None
+
+        operation, option = rng.choices(candidates, weights=[weights[c[0]] for c in candidates])[0]
+        if operation == 'deposit':
+            amount = int(balances['user_balance'] * rng.uniform(0.05, 0.2))
+        elif operation == 'withdraw':
+            amount = int(balances['option_balances'][option] * rng.uniform(0.1, 0.5))
+        elif operation == 'add_liquidity':
+            amount = int(balances['lp_provider_balance'] * rng.uniform(0.05, 0.15))
+        else:
+            amount = int(balances['user_lp_balance'] * rng.uniform(0.1, 0.5))
+        return operation, option, amount
+
+    def execute(self, market: Market, operation: str, option: int, amount: int, timeout: int = 60) -> Dict[str, object]:
+        """执行一次操作并等待确认"""
+        started = time.perf_counter()
+        result = {'market': market.address, 'operation': operation, 'option': option,
+                  'amount': amount, 'tx_hash': None, 'success': False, 'gas_used': 0}
+        try:
+            if operation == 'deposit':
+                tx_hash = market.trader.deposit(option, amount, 0)
+            elif operation == 'withdraw':
+                tx_hash = market.trader.withdraw(option, amount, 0)
+            elif operation == 'add_liquidity':
+                tx_hash = market.lp_provider.add_liquidity(amount, self.lp_provider_address)
+            else:
+                tx_hash = market.lp_provider.remove_liquidity(amount)
+            result['tx_hash'] = tx_hash
+            receipt = market.trader.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+            result['success'] = receipt.status == 1
+            result['gas_used'] = receipt.gasUsed
+        except Exception as e:
+            print(f"市场 {market.address} 执行 {operation} 失败: {str(e)}")
+        result['latency'] = time.perf_counter() - started
+        return result
+
+    def _run_market(self, market: Market, num_operations: int, weights: Dict[str, int],
+                    seed: Optional[int]) -> List[Dict[str, object]]:
+        rng = random.Random(seed)
+        results = []
+        with market.lock:
+            for _ in range(num_operations):
+                plan = self.plan_operation(market, self.snapshot(market), rng, weights)
+                if plan is None:
+                    continue
+                results.append(self.execute(market, *plan))
+        return results
+
+    def run(self, operations_per_market: int, weights: Optional[Dict[str, int]] = None,
+            seed: Optional[int] = None) -> Dict[str, object]:
+        """
+        并发驱动所有市场
+
+        Args:
+            operations_per_market: 每个市场执行的操作次数
+            weights: 操作类型权重，默认 DEFAULT_WEIGHTS
+            seed: 随机种子，每个市场使用 seed + 序号
+
+        Returns:
+            汇总结果，包含每笔操作的明细和整体吞吐量
+        """
+        weights = weights or DEFAULT_WEIGHTS
+        markets = list(self.markets.values())
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._run_market, market, operations_per_market, weights,
+                                       None if seed is None else seed + i)
+                       for i, market in enumerate(markets)]
+            per_market = [f.result() for f in futures]
+        elapsed = time.perf_counter() - started
+
+        results = [r for market_results in per_market for r in market_results]
+        succeeded = sum(1 for r in results if r['success'])
+        return {
+            'results': results,
+            'markets': len(markets),
+            'operations': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'gas_used': sum(r['gas_used'] for r in results),
+            'elapsed': elapsed,
+            'ops_per_second': len(results) / elapsed if elapsed > 0 else 0.0,
+        }
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+线程安全的nonce管理器
+
+多个合约封装对象（多个市场、多个线程）共用同一个账户发送交易时，
+各自调用 get_transaction_count 会拿到相同的nonce。NonceManager 在本地
+为每个账户递增分配nonce，只在首次使用或出错重置时访问链上。
+"""
+
+import threading
+from typing import Dict
+
+
+class NonceManager:
+    """按账户在本地分配nonce"""
+
+    def __init__(self, web3):
+        """
+        Args:
+            web3: Web3实例，用于读取链上的pending nonce
+        """
+        self.web3 = web3
+        self._nonces: Dict[str, int] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, address: str) -> threading.Lock:
+        with self._guard:
+            if address not in self._locks:
+                self._locks[address] = threading.Lock()
+            return self._locks[address]
+
+    def next_nonce(self, address: str) -> int:
+        """
+        分配下一个nonce
+
+        Args:
+            address: 账户地址
+
+        Returns:
+            可用于下一笔交易的nonce
+        """
+        key = address.lower()
+        with self._lock_for(key):
+            if key not in self._nonces:
+                self._nonces[key] = self.web3.eth.get_transaction_count(address, 'pending')
+            nonce = self._nonces[key]
+            self._nonces[key] = nonce + 1
+            return nonce
+
+    def prime(self, address: str, nonce: int):
+        """
+        直接设置账户的下一个nonce，用于已知nonce的新账户，省去一次链上查询
+
+        Args:
+            address: 账户地址
+            nonce: 下一笔交易的nonce
+        """
+        key = address.lower()
+        with self._lock_for(key):
+            self._nonces[key] = nonce
+
+    def reset(self, address: str):
+        """交易发送失败后重置，下次分配时重新从链上读取"""
+        key = address.lower()
+        with self._lock_for(key):
+            self._nonces.pop(key, None)
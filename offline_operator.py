@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+离线合约操作器
+
+与 ChainContractOperator 接口一致，但余额和价格来自本地 PoolModel，
+不发送任何RPC请求。用于基准测试和没有测试链时的快速模拟。
+"""
+
+import random
+
+import numpy as np
+
+from chain_operator import ChainContractOperator, PRICE_DECIMALS
+from operation_stats import OperationStats
+from pool_model import PoolModel
+from rpc_accounting import RpcAccounting
+
+
+class OfflineContractOperator(ChainContractOperator):
+    """基于离线池子模型的操作器，交易立即生效"""
+
+    def __init__(self, model: PoolModel, user_balance: int, lp_provider_balance: int,
+                 base_decimals: int = 6, lp_decimals: int = 6, option_decimals: int = 6,
+                 owner_balance: int = 0):
+        """
+        Args:
+            model: 池子模型，操作会直接修改它的状态
+            user_balance: 交易账户的初始基础代币余额（原始整数）
+            lp_provider_balance: LP提供者的初始基础代币余额（原始整数）
+            base_decimals: 基础代币小数位数
+            lp_decimals: LP代币小数位数
+            option_decimals: 选项代币小数位数
+            owner_balance: 合约owner的基础代币余额（原始整数）
+        """
+        self.model = model
+        self.num_options = model.num_options
+        self.base_decimals = base_decimals
+        self.lp_decimals = lp_decimals
+        self.option_decimals = np.full(self.num_options, option_decimals, dtype=np.int64)
+        self.operation_history = []
+        self.stats = OperationStats()
+        self.invariants = None
+        self.rpc_accounting = RpcAccounting()
+        self.subscription = None
+        self.rng = random.Random()
+
+        self.user_balance = int(user_balance)
+        self.lp_provider_balance = int(lp_provider_balance)
+        self.owner_balance = int(owner_balance)
+        self.lp_balance = 0
+        self.option_balances = np.zeros(self.num_options, dtype=np.int64)
+        self._tx_count = 0
+
+    def init_contracts(self):
+        """离线模式无需连接"""
+        return True
+
+    def get_current_balances(self):
+        """从模型状态生成与链上快照相同结构的余额字典"""
+        with self.rpc_accounting.operation('snapshot'):
+            prices = np.floor(self.model.prices() * 10 ** PRICE_DECIMALS).astype(np.int64)
+            return {
+                'pool_balance': self.model.pool_balance,
+                'user_balance': self.user_balance,
+                'lp_provider_balance': self.lp_provider_balance,
+                'owner_balance': self.owner_balance,
+                'user_lp_balance': self.lp_balance,
+                'lp_supply': self.model.lp_supply,
+                'option_balances': self.option_balances.copy(),
+                'option_prices': prices,
+                'reserves': self.model.reserves.copy(),
+            }
+
+    def _next_tx_hash(self):
+        self._tx_count += 1
+        return f"0x{self._tx_count:064x}"
+
+    def deposit(self, option, amount_wei):
+        """向指定选项存入BaseToken，金额为原始整数"""
+        amount_wei = int(amount_wei)
+        if amount_wei > self.user_balance:
+            return None, False
+        pool_before = self.model.pool_balance
+        self.option_balances[option] += self.model.deposit(option, amount_wei)
+        self.user_balance -= amount_wei
+        # 模型从投入金额中扣除的手续费归owner
+        self.owner_balance += amount_wei - (self.model.pool_balance - pool_before)
+        return self._next_tx_hash(), True
+
+    def withdraw(self, option, amount_wei):
+        """从指定选项提取到BaseToken，金额为原始整数"""
+        amount_wei = int(amount_wei)
+        if amount_wei > self.option_balances[option]:
+            return None, False
+        self.user_balance += self.model.withdraw(option, amount_wei)
+        self.option_balances[option] -= amount_wei
+        return self._next_tx_hash(), True
+
+    def swap(self, option_out, option_in, amount_wei):
+        """卖出 option_in 选项代币换取 option_out，金额为原始整数"""
+        amount_wei = int(amount_wei)
+        if amount_wei > self.option_balances[option_in]:
+            return None, False
+        amount_out = self.model.swap(option_out, option_in, amount_wei)
+        self.option_balances[option_in] -= amount_wei
+        self.option_balances[option_out] += amount_out
+        return self._next_tx_hash(), True
+
+    def add_liquidity(self, amount_wei):
+        """添加流动性，金额为原始整数"""
+        amount_wei = int(amount_wei)
+        if amount_wei > self.lp_provider_balance:
+            return None, False
+        self.lp_balance += self.model.add_liquidity(amount_wei)
+        self.lp_provider_balance -= amount_wei
+        return self._next_tx_hash(), True
+
+    def remove_liquidity(self, amount_wei):
+        """移除流动性，金额为原始整数"""
+        amount_wei = int(amount_wei)
+        if amount_wei > self.lp_balance:
+            return None, False
+        self.lp_provider_balance += self.model.remove_liquidity(amount_wei)
+        self.lp_balance -= amount_wei
+        return self._next_tx_hash(), True
+
+    def wait_for_transaction(self, tx_hash, timeout=120):
+        """离线交易在执行时已生效"""
+        return True, None
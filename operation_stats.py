@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+操作统计的增量汇总
+
+record_operation 每记录一条就更新一次，统计面板和摘要导出直接读取汇总结果，
+不再在每次页面重跑时扫描整个操作历史。每次更新的开销与历史长度无关。
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 初始化快照的操作名称，不计入操作统计
+INIT_OPERATION = '初始化'
+
+
+# 记录中的标量余额字段
+BALANCE_KEYS = ['pool_balance', 'user_balance', 'lp_provider_balance', 'owner_balance', 'user_lp_balance']
+
+
+class RunningMoments:
+    """Welford算法累计均值和方差"""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        """样本方差，少于2个样本时为0"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class RunningRange:
+    """累计最小值、最大值和最新值，支持按选项的数组"""
+
+    __slots__ = ('min', 'max', 'last')
+
+    def __init__(self):
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, value):
+        if self.last is None:
+            self.min = self.max = value
+        elif isinstance(value, np.ndarray):
+            if value.shape == self.min.shape:
+                self.min = np.minimum(self.min, value)
+                self.max = np.maximum(self.max, value)
+            else:
+                # 选项数量变化（重新连接到其他市场）时重新开始
+                self.min = self.max = value
+        else:
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+        self.last = value
+
+
+class OperationStats:
+    """
+    操作历史的运行汇总
+
+    按操作名称累计次数、成功数和金额的均值/方差，累计Gas使用量，
+    并跟踪各余额和价格的最小值、最大值和最新值。
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.succeeded = 0
+        self.counts: Dict[str, int] = {}
+        self.success_counts: Dict[str, int] = {}
+        self.amounts: Dict[str, RunningMoments] = {}
+        self.gas_used = 0
+        self.gas_transactions = 0
+        self.balances: Dict[str, RunningRange] = {key: RunningRange() for key in BALANCE_KEYS}
+        self.option_balances = RunningRange()
+        self.option_prices = RunningRange()
+        self.last: Optional[dict] = None
+
+    @property
+    def failed(self) -> int:
+        return self.total - self.succeeded
+
+    @property
+    def success_rate(self) -> float:
+        """成功率（0-1），没有操作时为0"""
+        return self.succeeded / self.total if self.total else 0.0
+
+    @property
+    def mean_gas(self) -> float:
+        """已确认交易的平均Gas使用量"""
+        return self.gas_used / self.gas_transactions if self.gas_transactions else 0.0
+
+    def update(self, record: dict, gas_used: Optional[int] = None):
+        """
+        计入一条操作记录
+
+        Args:
+            record: record_operation 生成的记录
+            gas_used: 交易收据中的Gas使用量，没有收据时为None
+        """
+        self.last = record
+        for key, tracker in self.balances.items():
+            tracker.add(record[key])
+        self.option_balances.add(record['option_balances'])
+        self.option_prices.add(record['option_prices'])
+        if gas_used is not None:
+            self.gas_used += int(gas_used)
+            self.gas_transactions += 1
+
+        operation = record['operation']
+        if operation == INIT_OPERATION:
+            return
+        success = bool(record['success'])
+        self.total += 1
+        self.succeeded += int(success)
+        self.counts[operation] = self.counts.get(operation, 0) + 1
+        if success:
+            self.success_counts[operation] = self.success_counts.get(operation, 0) + 1
+        moments = self.amounts.get(operation)
+        if moments is None:
+            moments = self.amounts[operation] = RunningMoments()
+        moments.add(float(record['amount']))
+
+    def operation_rows(self, operator) -> List[dict]:
+        """
+        按操作的统计表，金额按该操作的小数位数换算
+
+        Args:
+            operator: 提供小数位数和操作名称的操作器
+
+        Returns:
+            每个已执行操作一行的字典列表
+        """
+        from chain_operator import operation_label
+
+        rows = []
+        for name in operator.operation_names():
+            count = self.counts.get(name, 0)
+            if not count:
+                continue
+            scale = 10.0 ** operator.operation_decimals(name)
+            moments = self.amounts[name]
+            rows.append({
+                '操作': operation_label(name),
+                '次数': count,
+                '占比(%)': round(count / self.total * 100, 1),
+                '成功': self.success_counts.get(name, 0),
+                '平均金额': moments.mean / scale,
+                '金额标准差': moments.std / scale,
+            })
+        return rows
+
+    def range_rows(self, operator) -> List[dict]:
+        """
+        余额和价格的最小值、最大值和最新值，按显示单位换算
+
+        Args:
+            operator: 提供小数位数的操作器
+
+        Returns:
+            每个字段一行的字典列表
+        """
+        from chain_operator import PRICE_DECIMALS
+
+        if self.last is None:
+            return []
+        labels = {'pool_balance': '池子余额', 'user_balance': '交易账户余额',
+                  'lp_provider_balance': 'LP提供者余额', 'owner_balance': 'Owner余额',
+                  'user_lp_balance': 'LP余额'}
+        rows = []
+        for key, tracker in self.balances.items():
+            scale = 10.0 ** (operator.lp_decimals if key == 'user_lp_balance' else operator.base_decimals)
+            rows.append({'项目': labels[key], '最小': tracker.min / scale,
+                         '最大': tracker.max / scale, '最新': tracker.last / scale})
+        for i in range(len(self.option_prices.last)):
+            option_scale = 10.0 ** int(operator.option_decimals[i])
+            rows.append({'项目': f'O{i + 1}持仓', '最小': self.option_balances.min[i] / option_scale,
+                         '最大': self.option_balances.max[i] / option_scale,
+                         '最新': self.option_balances.last[i] / option_scale})
+            rows.append({'项目': f'O{i + 1}价格', '最小': self.option_prices.min[i] / 10.0 ** PRICE_DECIMALS,
+                         '最大': self.option_prices.max[i] / 10.0 ** PRICE_DECIMALS,
+                         '最新': self.option_prices.last[i] / 10.0 ** PRICE_DECIMALS})
+        return rows
+
+    def summary_rows(self, operator) -> List[Tuple[str, object]]:
+        """
+        统计摘要的 (统计项目, 数值) 列表，金额按显示单位换算
+
+        Args:
+            operator: 提供小数位数和操作名称的操作器
+
+        Returns:
+            摘要行列表
+        """
+        from chain_operator import PRICE_DECIMALS, operation_label
+        from utils import format_amount
+
+        rows = [
+            ("总操作次数", self.total),
+            ("成功次数", self.succeeded),
+            ("失败次数", self.failed),
+            ("成功率(%)", f"{self.success_rate * 100:.2f}"),
+            ("总Gas使用量", self.gas_used),
+            ("平均Gas使用量", f"{self.mean_gas:.0f}"),
+        ]
+        rows += [(f"{operation_label(name)}次数", self.counts.get(name, 0)) for name in operator.operation_names()]
+        if self.last is not None:
+            last = self.last
+            rows += [
+                ("最终池子余额", format_amount(last['pool_balance'], operator.base_decimals)),
+                ("最终交易账户余额", format_amount(last['user_balance'], operator.base_decimals)),
+                ("最终LP提供者余额", format_amount(last['lp_provider_balance'], operator.base_decimals)),
+                ("最终Owner余额", format_amount(last['owner_balance'], operator.base_decimals)),
+            ]
+            rows += [(f"最终O{i + 1}价格", format_amount(price, PRICE_DECIMALS))
+                     for i, price in enumerate(last['option_prices'])]
+            rows.append(("最终LP余额", format_amount(last['user_lp_balance'], operator.lp_decimals)))
+        return rows
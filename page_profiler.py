@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+页面重跑性能分析
+
+Streamlit每次交互都会从头执行整个页面脚本。PageProfiler 在开启后按页面区块
+（配置、侧边栏、手动操作、批量操作、图表、导出等）记录每次重跑的耗时和内存分配，
+同时用 cProfile 采集函数级数据，可导出为 .prof（snakeviz / pstats）或 speedscope 文件。
+
+页面按顺序调用 begin_run() → mark('config') → mark('sidebar') … → end_run()，
+mark 会结束上一个区块并开始下一个，无需改动页面代码的缩进。
+中途 st.stop() / st.rerun() 的重跑没有调用 end_run()，下次 begin_run() 时只保留其中已结束的区块。
+"""
+
+import cProfile
+import json
+import marshal
+import pstats
+import time
+import tracemalloc
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class PageProfiler:
+    """按页面区块统计重跑耗时与内存分配"""
+
+    def __init__(self, max_runs: int = 200):
+        """
+        Args:
+            max_runs: 保留的最近重跑次数
+        """
+        self.enabled = False
+        self.runs = deque(maxlen=max_runs)
+        self.profile: Optional[cProfile.Profile] = None
+        self._run: Optional[List[dict]] = None
+        self._section: Optional[dict] = None
+        self._run_started = 0.0
+        self._started_tracing = False
+
+    def set_enabled(self, enabled: bool):
+        """开启或关闭分析，关闭时停止内存追踪，已有数据保留"""
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        if enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            if self.profile is None:
+                self.profile = cProfile.Profile()
+        else:
+            self._abandon_run()
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def _abandon_run(self):
+        """
+        收尾未正常结束的重跑（页面中途调用了 st.stop() 或 st.rerun()）
+
+        这种重跑的结束时间未知，按当前时间结束会把两次重跑之间的空闲时间算进最后一个区块，
+        因此丢弃尚未结束的区块，只保留已经结束的区块
+        """
+        if self._run is None:
+            return
+        self._section = None
+        self.profile.disable()
+        if self._run:
+            self.runs.append(self._run)
+        self._run = None
+
+    def begin_run(self):
+        """页面脚本开始执行时调用"""
+        self._abandon_run()
+        if not self.enabled:
+            return
+        self._run = []
+        self._run_started = time.perf_counter()
+        try:
+            self.profile.enable()
+        except ValueError:
+            # 已有其他分析器在运行时只记录区块耗时
+            pass
+
+    def mark(self, name: str):
+        """结束上一个区块并开始名为 name 的区块"""
+        if self._run is None:
+            return
+        now = time.perf_counter()
+        self._close_section(now)
+        tracemalloc.reset_peak()
+        self._section = {
+            'section': name,
+            'start': now - self._run_started,
+            'started': now,
+            'memory': tracemalloc.get_traced_memory()[0],
+        }
+
+    def _close_section(self, now: float):
+        if self._section is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        section = self._section
+        self._run.append({
+            'section': section['section'],
+            'start': section['start'],
+            'seconds': now - section['started'],
+            'allocated': current - section['memory'],
+            'peak': peak - section['memory'],
+        })
+        self._section = None
+
+    def end_run(self):
+        """页面脚本执行结束时调用"""
+        if self._run is None:
+            return
+        self._close_section(time.perf_counter())
+        self.profile.disable()
+        self.runs.append(self._run)
+        self._run = None
+
+    def reset(self):
+        """清空已采集的数据"""
+        self._abandon_run()
+        self.runs.clear()
+        self.profile = cProfile.Profile() if self.enabled else None
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        按区块汇总
+
+        Returns:
+            区块名到统计值的字典，时间单位毫秒，内存单位KB
+        """
+        samples: Dict[str, List[tuple]] = {}
+        for run in self.runs:
+            for row in run:
+                samples.setdefault(row['section'], []).append((row['seconds'], row['allocated'], row['peak']))
+
+        result = {}
+        for name, rows in samples.items():
+            values = np.array(rows, dtype=np.float64)
+            seconds = values[:, 0] * 1000
+            result[name] = {
+                'runs': len(rows),
+                'last_ms': float(seconds[-1]),
+                'mean_ms': float(seconds.mean()),
+                'p90_ms': float(np.percentile(seconds, 90)),
+                'max_ms': float(seconds.max()),
+                'mean_alloc_kb': float(values[:, 1].mean() / 1024),
+                'max_peak_kb': float(values[:, 2].max() / 1024),
+            }
+        return result
+
+    def _stats(self) -> Optional[pstats.Stats]:
+        if self.profile is None or self._run is not None:
+            return None
+        try:
+            return pstats.Stats(self.profile)
+        except TypeError:
+            # 尚未采集到任何数据
+            return None
+
+    def dump_pstats(self) -> bytes:
+        """导出 cProfile 数据，格式与 Profile.dump_stats 相同，可用 snakeviz 或 pstats 打开"""
+        stats = self._stats()
+        return marshal.dumps(stats.stats if stats is not None else {})
+
+    def speedscope(self) -> str:
+        """
+        导出 speedscope 文件（https://www.speedscope.app）
+
+        包含两个profile：按区块排列的重跑时间线（evented），
+        以及 cProfile 的调用方→被调函数耗时（sampled，适合 Sandwich 视图）
+        """
+        frames: List[dict] = []
+        frame_index: Dict[tuple, int] = {}
+
+        def frame(key: tuple, name: str, file: str = None, line: int = None) -> int:
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                entry = {'name': name}
+                if file:
+                    entry['file'] = file
+                    entry['line'] = line
+                frames.append(entry)
+            return frame_index[key]
+
+        events = []
+        offset = 0.0
+        for run in self.runs:
+            for row in run:
+                index = frame(('section', row['section']), row['section'])
+                start = (offset + row['start']) * 1000
+                events.append({'type': 'O', 'frame': index, 'at': start})
+                events.append({'type': 'C', 'frame': index, 'at': start + row['seconds'] * 1000})
+            if run:
+                offset += run[-1]['start'] + run[-1]['seconds']
+
+        profiles = [{
+            'type': 'evented',
+            'name': '页面区块',
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': offset * 1000,
+            'events': events,
+        }]
+
+        stats = self._stats()
+        if stats is not None:
+            samples, weights = [], []
+            for (file, line, name), (_, _, _, _, callers) in stats.stats.items():
+                callee = frame(('func', file, line, name), name, file, line)
+                for (caller_file, caller_line, caller_name), edge in callers.items():
+                    # cProfile 的调用方记录为 (调用次数, 原始调用次数, 自身耗时, 累计耗时)
+                    if edge[2] <= 0:
+                        continue
+                    caller = frame(('func', caller_file, caller_line, caller_name),
+                                   caller_name, caller_file, caller_line)
+                    samples.append([caller, callee])
+                    weights.append(edge[2])
+            profiles.append({
+                'type': 'sampled',
+                'name': 'cProfile',
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': float(sum(weights)),
+                'samples': samples,
+                'weights': weights,
+            })
+
+        return json.dumps({
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': profiles,
+            'name': 'contract_simulator',
+            'exporter': 'page_profiler',
+        }, ensure_ascii=False)
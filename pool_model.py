@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Prediction池子的离线模型
+
+合约内部使用PRBMath的exp2/log做加权LMSR定价，这里用NumPy复现同一套公式，
+用于离线报价、批量计算价格冲击曲线以及在没有RPC的情况下驱动模拟。
+所有金额均为链上原始整数单位（例如USDC的1e6），储备以int64数组保存，
+报价和状态变更的结果都向下取整为整数，与合约的取整方向一致；
+只有指数/对数这一步在float64中计算。模型只做近似，
+与链上结果的偏差可以通过 BatchQuoter 的链上抽查来校准。
+"""
+
+import hashlib
+from typing import Optional, Sequence
+
+import numpy as np
+
+# 合约中 reserves / factor / weights 以及 getAmountOut / getAmountsOut 使用 SD59x18 定点数，
+# 定点值除以 SD59X18_SCALE 为原始整数单位
+SD59X18_SCALE = 10 ** 18
+
+# 合约 state() 返回的 fee 按 1e6 换算的费率
+FEE_SCALE = 10 ** 6
+
+
+def from_sd59x18(value: int, round_up: bool = False) -> int:
+    """SD59x18 定点值换算为原始整数单位，默认向下取整"""
+    value = int(value)
+    return -(-value // SD59X18_SCALE) if round_up else value // SD59X18_SCALE
+
+
+def to_sd59x18(value: int) -> int:
+    """原始整数单位换算为 SD59x18 定点值"""
+    return int(value) * SD59X18_SCALE
+
+
+def _floor_int(values) -> np.ndarray:
+    """报价结果向下取整为int64，无效值和舍入误差造成的负值记为0"""
+    values = np.nan_to_num(np.floor(values), nan=0.0, posinf=0.0, neginf=0.0)
+    return np.maximum(values, 0.0).astype(np.int64)
+
+
+def exp_terms(reserves, weights, factor):
+    """
+    计算LMSR的指数项，支持任意前导维度的广播
+
+    Args:
+        reserves: 形状为(..., n)的储备
+        weights: 形状为(n,)的权重
+        factor: 流动性因子，标量或可与(..., 1)广播的数组
+
+    Returns:
+        (e, s)，e_i = w_i*exp((q_i - max q)/b)，s = sum(e)，s保留最后一维
+    """
+    shift = reserves.max(axis=-1, keepdims=True)
+    e = weights * np.exp((reserves - shift) / factor)
+    return e, e.sum(axis=-1, keepdims=True)
+
+
+def deposit_out(e_out, s, factor, fee_rate, delta):
+    """投入delta基础代币可得的选项数量"""
+    net = delta * (1.0 - fee_rate)
+    return factor * np.log1p(s * np.expm1(net / factor) / e_out)
+
+
+def rest_terms(e):
+    """
+    除各选项自身以外的指数项之和，直接求和而不是 s - e_i
+
+    价格接近1的选项 e_i 与 s 几乎相等，相减只剩浮点误差，卖出这类选项的报价会严重偏离
+    """
+    n = e.shape[-1]
+    return np.stack([np.delete(e, i, axis=-1).sum(axis=-1) for i in range(n)], axis=-1)
+
+
+def withdraw_out(e_in, s, factor, fee_rate, delta, rest=None):
+    """卖出delta个选项可得的基础代币数量（已扣手续费），rest 为其余选项的指数项之和"""
+    if rest is None:
+        return -factor * np.log1p(e_in * np.expm1(-delta / factor) / s) * (1.0 - fee_rate)
+    return -factor * np.log((rest + e_in * np.exp(-delta / factor)) / s) * (1.0 - fee_rate)
+
+
+def swap_out(e_out, e_in, s, factor, fee_rate, delta, same_option=False, rest=None):
+    """卖出delta个option_in后买入option_out可得的数量，rest 为option_in以外的指数项之和"""
+    e_in_after = e_in * np.exp(-delta / factor)
+    s_after = (s - e_in if rest is None else rest) + e_in_after
+    proceeds = factor * np.log(s / s_after) * (1.0 - fee_rate)
+    e_out = np.where(same_option, e_in_after, e_out)
+    return factor * np.log1p(s_after * np.expm1(proceeds / factor) / e_out)
+
+
+class PoolModel:
+    """加权LMSR池子模型
+
+    成本函数: C(q) = b * ln(sum_i w_i * exp(q_i / b))
+    价格:     p_i  = w_i * exp(q_i / b) / sum_j w_j * exp(q_j / b)
+
+    其中 q 为各选项的储备（已发行数量），w 为权重，b 为流动性因子。
+    """
+
+    def __init__(self, reserves: Sequence[int], weights: Optional[Sequence[float]] = None,
+                 factor: float = 1e9, lp_supply: int = 0, pool_balance: int = 0,
+                 fee_rate: float = 0.0):
+        """
+        初始化池子模型
+
+        Args:
+            reserves: 各选项储备（原始单位）
+            weights: 各选项权重，默认等权
+            factor: 流动性因子b（原始单位）
+            lp_supply: LP代币总供应量
+            pool_balance: 池子持有的基础代币数量
+            fee_rate: 手续费率，例如0.003表示0.3%
+        """
+        self.reserves = np.array(reserves, dtype=np.int64)
+        n = len(self.reserves)
+        if weights is None:
+            weights = np.full(n, 1.0 / n)
+        weights = np.asarray(weights, dtype=np.float64)
+        self.weights = weights / weights.sum()
+        self.factor = float(factor)
+        self.lp_supply = int(lp_supply)
+        self.pool_balance = int(pool_balance)
+        self.fee_rate = float(fee_rate)
+
+    @classmethod
+    def from_contract(cls, prediction, fee_rate: Optional[float] = None, block_identifier=None) -> "PoolModel":
+        """
+        从链上合约状态构建模型
+
+        储备、权重和流动性因子都是 SD59x18，统一换算为原始整数单位，q/b 与合约一致
+
+        Args:
+            prediction: PredictionContract实例
+            fee_rate: 手续费率，None时读取合约 state() 返回的 fee
+            block_identifier: 读取状态的区块，默认最新
+
+        Returns:
+            PoolModel实例
+        """
+        functions = prediction.prediction_contract.functions
+        block = block_identifier if block_identifier is not None else 'latest'
+        n = len(prediction.get_options())
+        reserves = [from_sd59x18(functions.reserves(i).call(block_identifier=block)) for i in range(n)]
+        weights = [functions.weights(i).call(block_identifier=block) / SD59X18_SCALE for i in range(n)]
+        factor = functions.factor().call(block_identifier=block) / SD59X18_SCALE
+        if fee_rate is None:
+            fee_rate = functions.state().call(block_identifier=block) / FEE_SCALE
+        lp_supply = functions.totalSupply().call(block_identifier=block)
+        base_token = prediction._get_erc20_contract(prediction.get_base_token())
+        pool_balance = base_token.functions.balanceOf(prediction.prediction_contract.address).call(
+            block_identifier=block)
+        return cls(reserves, weights, factor, lp_supply, pool_balance, fee_rate)
+
+    # ========== 基础量 ==========
+
+    @property
+    def num_options(self) -> int:
+        return len(self.reserves)
+
+    def _terms(self, reserves: Optional[np.ndarray] = None):
+        """返回 (e, S)，用平移避免exp溢出"""
+        q = self.reserves if reserves is None else reserves
+        return exp_terms(q, self.weights, self.factor)
+
+    def cost(self, reserves: Optional[np.ndarray] = None) -> np.ndarray:
+        """成本函数 C(q)，支持最后一维为选项的批量输入"""
+        q = self.reserves if reserves is None else reserves
+        e, s = self._terms(q)
+        return self.factor * np.log(s[..., 0]) + q.max(axis=-1)
+
+    def prices(self) -> np.ndarray:
+        """各选项当前价格，和为1"""
+        e, s = self._terms()
+        return e / s
+
+    def price(self, option: int) -> float:
+        """单个选项价格"""
+        return float(self.prices()[option])
+
+    def state_hash(self) -> str:
+        """池子状态的哈希，用于缓存键"""
+        h = hashlib.sha1()
+        h.update(self.reserves.tobytes())
+        h.update(self.weights.tobytes())
+        h.update(np.array([self.lp_supply, self.pool_balance], dtype=np.int64).tobytes())
+        h.update(np.array([self.factor, self.fee_rate]).tobytes())
+        return h.hexdigest()
+
+    def copy(self) -> "PoolModel":
+        return PoolModel(self.reserves, self.weights, self.factor,
+                         self.lp_supply, self.pool_balance, self.fee_rate)
+
+    # ========== 向量化报价 ==========
+
+    def get_amount_out(self, option_out, delta) -> np.ndarray:
+        """
+        deposit报价：投入delta基础代币可以得到多少option_out代币
+
+        Args:
+            option_out: 选项索引，标量或数组
+            delta: 投入的基础代币数量，标量或数组（与option_out广播）
+
+        Returns:
+            得到的选项代币数量数组
+        """
+        option_out, delta = np.broadcast_arrays(np.asarray(option_out, dtype=np.int64),
+                                                np.asarray(delta, dtype=np.float64))
+        e, s = self._terms()
+        return _floor_int(deposit_out(e[option_out], s[0], self.factor, self.fee_rate, delta))
+
+    def get_withdraw_out(self, option_in, delta) -> np.ndarray:
+        """
+        withdraw报价：卖出delta个option_in代币可以得到多少基础代币
+
+        Args:
+            option_in: 选项索引，标量或数组
+            delta: 卖出的选项代币数量，标量或数组
+
+        Returns:
+            得到的基础代币数量数组（已扣手续费）
+        """
+        option_in, delta = np.broadcast_arrays(np.asarray(option_in, dtype=np.int64),
+                                               np.asarray(delta, dtype=np.float64))
+        e, s = self._terms()
+        return _floor_int(withdraw_out(e[option_in], s[0], self.factor, self.fee_rate, delta,
+                                       rest=rest_terms(e)[option_in]))
+
+    def get_swap_out(self, option_out, option_in, delta) -> np.ndarray:
+        """
+        swap报价：卖出delta个option_in，买入option_out
+
+        Args:
+            option_out: 买入的选项索引
+            option_in: 卖出的选项索引
+            delta: 卖出的选项代币数量
+
+        Returns:
+            得到的option_out代币数量数组
+        """
+        option_out, option_in, delta = np.broadcast_arrays(np.asarray(option_out, dtype=np.int64),
+                                                           np.asarray(option_in, dtype=np.int64),
+                                                           np.asarray(delta, dtype=np.float64))
+        e, s = self._terms()
+        return _floor_int(swap_out(e[option_out], e[option_in], s[0], self.factor, self.fee_rate, delta,
+                                   same_option=option_out == option_in, rest=rest_terms(e)[option_in]))
+
+    def get_amounts_out(self, x) -> np.ndarray:
+        """
+        对应合约的 getAmountsOut(int256[] x)：储备变化向量x对应的成本差
+
+        Args:
+            x: 形状为(..., num_options)的储备变化量
+
+        Returns:
+            每个变化向量需要支付（正）或得到（负）的基础代币数量
+        """
+        x = np.asarray(x, dtype=np.int64)
+        # 支付方向向上取整、得到方向向下取整，对池子有利
+        return np.ceil(self.cost(self.reserves + x) - self.cost()).astype(np.int64)
+
+    # ========== 状态变更 ==========
+
+    def deposit(self, option_out: int, delta: int) -> int:
+        """执行deposit并返回得到的选项代币数量"""
+        amount_out = int(self.get_amount_out(option_out, delta))
+        fee = int(delta) * int(round(self.fee_rate * FEE_SCALE)) // FEE_SCALE
+        self.reserves[option_out] += amount_out
+        self.pool_balance += int(delta) - fee
+        return amount_out
+
+    def withdraw(self, option_in: int, delta: int) -> int:
+        """执行withdraw并返回得到的基础代币数量"""
+        amount_out = int(self.get_withdraw_out(option_in, delta))
+        self.reserves[option_in] -= int(delta)
+        self.pool_balance -= amount_out
+        return amount_out
+
+    def swap(self, option_out: int, option_in: int, delta: int) -> int:
+        """执行swap并返回得到的option_out代币数量"""
+        amount_out = int(self.get_swap_out(option_out, option_in, delta))
+        self.reserves[option_in] -= int(delta)
+        self.reserves[option_out] += amount_out
+        return amount_out
+
+    def _scale_depth(self, ratio: float):
+        """
+        缩放流动性因子，价格保持不变
+
+        储备是持有人手中未偿的选项代币，不能随流动性缩放（否则持有人卖出全部持仓时储备为负）；
+        改为按 w_i' ∝ w_i * exp(q_i / b - q_i / b') 调整权重，使各选项价格在新的b下不变。
+        """
+        factor = self.factor * ratio
+        log_weights = np.log(self.weights) + self.reserves * (1.0 / self.factor - 1.0 / factor)
+        weights = np.exp(log_weights - log_weights.max())
+        self.weights = np.maximum(weights / weights.sum(), np.finfo(np.float64).tiny)
+        self.factor = factor
+
+    def lp_equity(self) -> int:
+        """LP权益：池子基础代币减去按当前价格计价的未偿选项负债"""
+        return self.pool_balance - int(np.ceil(self.prices() @ self.reserves))
+
+    def add_liquidity(self, amount: int) -> int:
+        """添加流动性，按权益比例铸造LP，并同比放大流动性因子（价格不变）"""
+        amount = int(amount)
+        equity = self.lp_equity()
+        if self.lp_supply <= 0 or equity <= 0:
+            minted = amount
+        else:
+            minted = amount * self.lp_supply // equity
+            self._scale_depth((equity + amount) / equity)
+        self.lp_supply += minted
+        self.pool_balance += amount
+        return minted
+
+    def remove_liquidity(self, liquidity: int) -> int:
+        """移除流动性，按份额返还权益，并同比缩小流动性因子（价格不变）"""
+        if self.lp_supply <= 0:
+            return 0
+        liquidity = min(int(liquidity), self.lp_supply)
+        payout = max(self.lp_equity(), 0) * liquidity // self.lp_supply
+        if liquidity < self.lp_supply:
+            self._scale_depth(1.0 - liquidity / self.lp_supply)
+        self.lp_supply -= liquidity
+        self.pool_balance -= payout
+        return payout
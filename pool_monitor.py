@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+只读池子监控
+
+持续采样多个Prediction池子的价格、储备、state() 和池子基础代币余额，
+不发送任何交易。样本写入定长环形缓冲区，并按1小时、1天、1周三个时间窗口
+分别聚合为固定数量的时间桶，因此连续运行数周内存占用也保持不变。
+
+采样方式二选一：
+- start(interval)：后台线程每 interval 秒通过一次批量请求采样全部池子
+- start_subscription(ws_url)：订阅新区块，每个区块采样一次
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from abi_cache import checksum_address, get_contract
+from fast_abi import RawCall, balance_of_data, decode_int, price_data, reserves_data, state_data
+from instrumentation import registry
+from pool_model import SD59X18_SCALE
+
+# (名称, 时间窗口秒数, 时间桶秒数)
+ROLLUP_TIERS: Tuple[Tuple[str, int, int], ...] = (
+    ('1小时', 3600, 10),
+    ('1天', 86400, 300),
+    ('1周', 7 * 86400, 3600),
+)
+
+RAW_RESOLUTION = '原始'
+
+# 原始样本默认保留条数
+DEFAULT_RAW_CAPACITY = 3600
+
+# 合约 price() 返回的定点小数位数
+PRICE_DECIMALS = 6
+
+
+class RingBuffer:
+    """定长环形缓冲区，保存最近 capacity 个 (时间, 数值行)"""
+
+    def __init__(self, capacity: int, width: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((capacity, width), dtype=np.float64)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp: float, row: np.ndarray):
+        index = self.count % self.capacity
+        self.times[index] = timestamp
+        self.values[index] = row
+        self.count += 1
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间顺序返回 (时间, 数值) 的副本"""
+        if self.count <= self.capacity:
+            return self.times[:self.count].copy(), self.values[:self.count].copy()
+        start = self.count % self.capacity
+        order = np.r_[start:self.capacity, 0:start]
+        return self.times[order], self.values[order]
+
+    @property
+    def nbytes(self) -> int:
+        return self.times.nbytes + self.values.nbytes
+
+
+class Rollup:
+    """按固定时间粒度聚合的环形时间桶，每个桶保存样本数、均值、最小值、最大值和最新值"""
+
+    def __init__(self, span: int, bucket: int, width: int):
+        """
+        Args:
+            span: 时间窗口（秒）
+            bucket: 时间桶大小（秒）
+            width: 每行的指标数
+        """
+        self.span = span
+        self.bucket = bucket
+        size = max(1, span // bucket)
+        self.starts = np.full(size, -1.0, dtype=np.float64)
+        self.counts = np.zeros(size, dtype=np.int64)
+        self.sums = np.zeros((size, width), dtype=np.float64)
+        self.mins = np.zeros((size, width), dtype=np.float64)
+        self.maxs = np.zeros((size, width), dtype=np.float64)
+        self.lasts = np.zeros((size, width), dtype=np.float64)
+        self.latest_start = -1.0
+
+    def add(self, timestamp: float, row: np.ndarray):
+        start = float(int(timestamp // self.bucket) * self.bucket)
+        index = int(start // self.bucket) % len(self.starts)
+        if self.starts[index] != start:
+            # 桶已过期（属于上一轮窗口），重新开始
+            self.starts[index] = start
+            self.counts[index] = 0
+            self.sums[index] = 0.0
+            self.mins[index] = row
+            self.maxs[index] = row
+        else:
+            np.minimum(self.mins[index], row, out=self.mins[index])
+            np.maximum(self.maxs[index], row, out=self.maxs[index])
+        self.counts[index] += 1
+        self.sums[index] += row
+        self.lasts[index] = row
+        self.latest_start = max(self.latest_start, start)
+
+    def view(self) -> Dict[str, np.ndarray]:
+        """
+        窗口内的时间桶，按时间排序
+
+        Returns:
+            字典: time（桶起始时间）、count、mean、min、max、last
+        """
+        valid = (self.counts > 0) & (self.starts > self.latest_start - self.span)
+        order = np.argsort(self.starts[valid])
+        counts = self.counts[valid][order]
+        return {
+            'time': self.starts[valid][order],
+            'count': counts,
+            'mean': self.sums[valid][order] / counts[:, None],
+            'min': self.mins[valid][order],
+            'max': self.maxs[valid][order],
+            'last': self.lasts[valid][order],
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return (self.starts.nbytes + self.counts.nbytes + self.sums.nbytes +
+                self.mins.nbytes + self.maxs.nbytes + self.lasts.nbytes)
+
+
+class PoolSeries:
+    """单个池子的原始样本和各时间窗口聚合"""
+
+    def __init__(self, address: str, base_token: str, num_options: int,
+                 base_decimals: int, option_decimals: Sequence[int],
+                 raw_capacity: int = DEFAULT_RAW_CAPACITY, tiers=ROLLUP_TIERS):
+        self.address = address
+        self.base_token = base_token
+        self.num_options = num_options
+        self.columns = (['pool_balance', 'state'] +
+                        [f'o{i + 1}_price' for i in range(num_options)] +
+                        [f'o{i + 1}_reserve' for i in range(num_options)])
+        # 原始整数换算为显示单位的除数，reserves() 返回 SD59x18，另外除以 1e18
+        self.scale = np.array([10.0 ** base_decimals, 1.0] +
+                              [10.0 ** PRICE_DECIMALS] * num_options +
+                              [float(SD59X18_SCALE) * 10.0 ** int(d) for d in option_decimals], dtype=np.float64)
+        width = len(self.columns)
+        self.raw = RingBuffer(raw_capacity, width)
+        self.rollups = {name: Rollup(span, bucket, width) for name, span, bucket in tiers}
+
+    def calls(self, web3) -> List[RawCall]:
+        """一次采样需要的调用，顺序与 columns 一致"""
+        pool = self.address
+        return ([
+            RawCall(web3, self.base_token, balance_of_data(pool)),
+            RawCall(web3, pool, state_data()),
+        ] + [
+            RawCall(web3, pool, price_data(i)) for i in range(self.num_options)
+        ] + [
+            RawCall(web3, pool, reserves_data(i), decode_int) for i in range(self.num_options)
+        ])
+
+    def add(self, timestamp: float, raw_values: Sequence[int]):
+        row = np.array([float(v) for v in raw_values], dtype=np.float64) / self.scale
+        self.raw.append(timestamp, row)
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, row)
+
+    def latest(self) -> Optional[Dict[str, float]]:
+        """最新一次采样，按列名"""
+        if not len(self.raw):
+            return None
+        index = (self.raw.count - 1) % self.raw.capacity
+        return dict(zip(self.columns, self.raw.values[index].tolist()))
+
+    def frame(self, resolution: str = RAW_RESOLUTION, field: str = 'mean'):
+        """
+        转换为DataFrame
+
+        Args:
+            resolution: RAW_RESOLUTION 或 ROLLUP_TIERS 中的名称
+            field: 聚合取值 mean / min / max / last，原始样本时忽略
+
+        Returns:
+            DataFrame，time 列为本地时间
+        """
+        import pandas as pd
+
+        if resolution == RAW_RESOLUTION:
+            times, values = self.raw.view()
+        else:
+            view = self.rollups[resolution].view()
+            times, values = view['time'], view[field]
+        df = pd.DataFrame(values, columns=self.columns)
+        df.insert(0, 'time', pd.to_datetime(times, unit='s', utc=True).tz_convert(None))
+        return df
+
+    @property
+    def nbytes(self) -> int:
+        return self.raw.nbytes + sum(rollup.nbytes for rollup in self.rollups.values())
+
+
+class PoolMonitor:
+    """多个池子的只读监控"""
+
+    def __init__(self, web3, pool_addresses: Sequence[str],
+                 raw_capacity: int = DEFAULT_RAW_CAPACITY, tiers=ROLLUP_TIERS):
+        """
+        Args:
+            web3: Web3实例，只用于读取
+            pool_addresses: Prediction合约地址列表
+            raw_capacity: 每个池子保留的原始样本数
+            tiers: 聚合时间窗口 (名称, 窗口秒数, 桶秒数)
+        """
+        if not pool_addresses:
+            raise ValueError("至少需要一个池子地址")
+        self.web3 = web3
+        self.pools: Dict[str, PoolSeries] = {}
+        for address in pool_addresses:
+            address = checksum_address(address)
+            self.pools[address] = self._discover(address, raw_capacity, tiers)
+        self.samples = 0
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.subscription = None
+
+    def _discover(self, address: str, raw_capacity: int, tiers) -> PoolSeries:
+        """读取池子的基础代币、选项和小数位数（只在创建时查询一次）"""
+        prediction = get_contract(self.web3, 'prediction', address)
+        base_token = checksum_address(prediction.functions.baseToken().call())
+        options = prediction.functions.options().call()
+        base_decimals = get_contract(self.web3, 'erc20', base_token).functions.decimals().call()
+        option_decimals = [get_contract(self.web3, 'erc20', option).functions.decimals().call()
+                           for option in options]
+        return PoolSeries(address, base_token, len(options), base_decimals, option_decimals,
+                          raw_capacity, tiers)
+
+    # ========== 采样 ==========
+
+    def calls(self) -> List[RawCall]:
+        """全部池子一次采样的调用，按池子顺序拼接"""
+        return [call for pool in self.pools.values() for call in pool.calls(self.web3)]
+
+    def ingest(self, results: Sequence[int], timestamp: Optional[float] = None) -> dict:
+        """
+        写入一次采样结果
+
+        Args:
+            results: 按 calls() 顺序排列的解码结果
+            timestamp: 采样时间，默认为当前时间
+
+        Returns:
+            {池子地址: 最新数值} 字典
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        latest = {}
+        with self._lock:
+            offset = 0
+            for address, pool in self.pools.items():
+                width = len(pool.columns)
+                pool.add(timestamp, results[offset:offset + width])
+                latest[address] = pool.latest()
+                offset += width
+            self.samples += 1
+        return latest
+
+    def sample(self) -> dict:
+        """通过一次批量请求采样全部池子"""
+        calls = self.calls()
+        with registry.stage('monitor_sample'):
+            if hasattr(self.web3, 'batch_requests'):
+                with self.web3.batch_requests() as batch:
+                    for call in calls:
+                        batch.add(self.web3.eth.call(call.params()))
+                    results = [call.decode(raw) for call, raw in zip(calls, batch.execute())]
+            else:
+                results = [call.call() for call in calls]
+        return self.ingest(results)
+
+    # ========== 后台运行 ==========
+
+    def start(self, interval: float = 5.0):
+        """
+        在后台线程中按固定间隔采样
+
+        Args:
+            interval: 采样间隔（秒）
+        """
+        if self.running:
+            return
+        self._stopped.clear()
+
+        def loop():
+            while not self._stopped.is_set():
+                started = time.monotonic()
+                try:
+                    self.sample()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    print(f"池子采样失败: {str(e)}")
+                self._stopped.wait(max(0.0, interval - (time.monotonic() - started)))
+
+        self._thread = threading.Thread(target=loop, name='pool-monitor', daemon=True)
+        self._thread.start()
+
+    def start_subscription(self, ws_url: str):
+        """订阅新区块，每个区块采样一次"""
+        from head_subscription import HeadSubscription
+
+        if self.running:
+            return
+        self.subscription = HeadSubscription(ws_url, list(self.pools), self.calls, self.ingest)
+        self.subscription.start()
+
+    def stop(self):
+        """停止采样，已有数据保留"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+        if self.subscription is not None:
+            self.subscription.stop()
+            self.subscription = None
+
+    @property
+    def running(self) -> bool:
+        if self.subscription is not None:
+            return self.subscription.running
+        return self._thread is not None and self._thread.is_alive()
+
+    # ========== 读取 ==========
+
+    def frame(self, address: str, resolution: str = RAW_RESOLUTION, field: str = 'mean'):
+        """指定池子的DataFrame，见 PoolSeries.frame"""
+        with self._lock:
+            return self.pools[checksum_address(address)].frame(resolution, field)
+
+    def latest(self, address: str) -> Optional[Dict[str, float]]:
+        with self._lock:
+            return self.pools[checksum_address(address)].latest()
+
+    @property
+    def nbytes(self) -> int:
+        """全部缓冲区占用的字节数（固定，不随运行时间增长）"""
+        return sum(pool.nbytes for pool in self.pools.values())
@@ -1,13 +1,20 @@
-from web3 import Web3
-import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, TYPE_CHECKING
 from decimal import Decimal
-from abi import PredictionAbiJson
+import fast_abi
+from abi_cache import ERC20_ABI, checksum_address, get_abi, get_contract
+from instrumentation import registry
+
+if TYPE_CHECKING:
+    from web3 import Web3
+
+# deposit / withdraw / swap 默认的截止时间
+DEFAULT_DEADLINE = 2892290396
 
 class PredictionContract:
     """封装Prediction合约和ERC20合约的调用方法"""
     
-    def __init__(self, web3: Web3, prediction_address: str, private_key: str, account_address: str):
+    def __init__(self, web3: "Web3", prediction_address: str, private_key: str, account_address: str,
+                 nonce_manager=None):
         """
         初始化合约实例
         
@@ -16,87 +23,54 @@ class PredictionContract:
             prediction_address: Prediction合约地址
             private_key: 私钥
             account_address: 账户地址
+            nonce_manager: 可选的NonceManager，多个实例共用账户时用于分配nonce
         """
         self.web3 = web3
         self.prediction_address = prediction_address
         self.private_key = private_key
         self.account_address = account_address
+        self.nonce_manager = nonce_manager
         
-        # ABI定义
-        self.erc20_abi = [
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "name",
-                "outputs": [{"name": "", "type": "string"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "symbol",
-                "outputs": [{"name": "", "type": "string"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [],
-                "name": "decimals",
-                "outputs": [{"name": "", "type": "uint8"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [{"name": "_owner", "type": "address"}],
-                "name": "balanceOf",
-                "outputs": [{"name": "balance", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            },
-            {
-                "constant": False,
-                "inputs": [
-                    {"name": "_spender", "type": "address"},
-                    {"name": "_value", "type": "uint256"}
-                ],
-                "name": "approve",
-                "outputs": [{"name": "", "type": "bool"}],
-                "payable": False,
-                "stateMutability": "nonpayable",
-                "type": "function"
-            },
-            {
-                "constant": True,
-                "inputs": [
-                    {"name": "_owner", "type": "address"},
-                    {"name": "_spender", "type": "address"}
-                ],
-                "name": "allowance",
-                "outputs": [{"name": "", "type": "uint256"}],
-                "payable": False,
-                "stateMutability": "view",
-                "type": "function"
-            }
-        ]
-        
-        self.prediction_abi = json.loads(PredictionAbiJson)
-        
-        # 创建合约实例
-        self.prediction_contract = self.web3.eth.contract(
-            address=Web3.to_checksum_address(prediction_address),
-            abi=self.prediction_abi
-        )
+        # ABI只解析一次，合约对象在第一次使用时创建并在实例间共享
+        self.erc20_abi = ERC20_ABI
+        self.prediction_abi = get_abi('prediction')
+        self._prediction_contract = None
+        self._chain_id = None
+    
+    @property
+    def prediction_contract(self):
+        """Prediction合约对象"""
+        if self._prediction_contract is None:
+            self._prediction_contract = get_contract(self.web3, 'prediction', self.prediction_address)
+        return self._prediction_contract
     
     def _get_erc20_contract(self, token_address: str):
         """获取ERC20合约实例"""
-        return self.web3.eth.contract(address=token_address, abi=self.erc20_abi)
+        return get_contract(self.web3, 'erc20', token_address)
+    
+    def _next_nonce(self) -> int:
+        if self.nonce_manager is not None:
+            return self.nonce_manager.next_nonce(self.account_address)
+        return self.web3.eth.get_transaction_count(self.account_address)
+    
+    @property
+    def chain_id(self) -> int:
+        """链ID，只查询一次"""
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        return self._chain_id
+    
+    def _sign_and_send(self, transaction: Dict[str, Any]) -> str:
+        # 签名交易
+        with registry.stage('signing'):
+            signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key=self.private_key)
+        
+        # 发送交易
+        with registry.stage('send'):
+            tx_hash = self.web3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        
+        print(f"交易已发送，哈希: {tx_hash.hex()}")
+        return tx_hash.hex()
     
     def _send_transaction(self, transaction_func, *args, gas_limit: Optional[int] = None, **kwargs) -> str:
         """
@@ -112,28 +86,87 @@ class PredictionContract:
             交易哈希
         """
         try:
+            nonce = self._next_nonce()
+            
             # 构建交易
-            transaction = transaction_func(*args).build_transaction({
-                'from': self.account_address,
-                'nonce': self.web3.eth.get_transaction_count(self.account_address),
-                'gasPrice': self.web3.eth.gas_price,
-                'gas': gas_limit or 30000000,
-                **kwargs
-            })
+            with registry.stage('build_transaction'):
+                transaction = transaction_func(*args).build_transaction({
+                    'from': self.account_address,
+                    'nonce': nonce,
+                    'gasPrice': self.web3.eth.gas_price,
+                    'gas': gas_limit or 30000000,
+                    **kwargs
+                })
             
-            # 签名交易
-            signed_txn = self.web3.eth.account.sign_transaction(transaction, private_key=self.private_key)
+            return self._sign_and_send(transaction)
             
-            # 发送交易
-            tx_hash = self.web3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        except Exception as e:
+            print(f"发送交易失败: {str(e)}")
+            if self.nonce_manager is not None:
+                self.nonce_manager.reset(self.account_address)
+            raise
+    
+    def calldata_transaction(self, data: bytes, nonce: int, gas_price: int,
+                             gas_limit: Optional[int] = None, **kwargs) -> Dict[str, Any]:
+        """
+        构建未签名的Prediction合约调用交易，字段与 build_transaction 的结果一致
+        
+        Args:
+            data: fast_abi 编码的调用数据
+            nonce: 交易nonce
+            gas_price: Gas价格
+            gas_limit: Gas限制
+            **kwargs: 其他交易字段
             
-            print(f"交易已发送，哈希: {tx_hash.hex()}")
-            return tx_hash.hex()
+        Returns:
+            交易字典
+        """
+        return {
+            'to': checksum_address(self.prediction_address),
+            'from': self.account_address,
+            'data': '0x' + data.hex(),
+            'value': 0,
+            'nonce': nonce,
+            'gasPrice': gas_price,
+            'gas': gas_limit or 30000000,
+            'chainId': self.chain_id,
+            **kwargs
+        }
+    
+    def _send_calldata(self, data: bytes, gas_limit: Optional[int] = None, **kwargs) -> str:
+        """
+        发送已编码的Prediction合约调用，跳过web3合约函数对象
+        
+        Args:
+            data: fast_abi 编码的调用数据
+            gas_limit: Gas限制
+            **kwargs: 其他交易字段
+            
+        Returns:
+            交易哈希
+        """
+        try:
+            nonce = self._next_nonce()
+            
+            # 构建交易
+            with registry.stage('build_transaction'):
+                transaction = self.calldata_transaction(data, nonce, self.web3.eth.gas_price, gas_limit, **kwargs)
+            
+            return self._sign_and_send(transaction)
             
         except Exception as e:
             print(f"发送交易失败: {str(e)}")
+            if self.nonce_manager is not None:
+                self.nonce_manager.reset(self.account_address)
             raise
     
+    def _eth_call(self, data: bytes, block_identifier='latest') -> bytes:
+        """对Prediction合约执行已编码的只读调用，返回原始数据"""
+        return self.web3.eth.call({
+            'to': checksum_address(self.prediction_address),
+            'data': '0x' + data.hex(),
+        }, block_identifier)
+    
     # ========== ERC20 合约方法 ==========
     
     def get_balance_of(self, token_address: str, account_address: Optional[str] = None) -> int:
@@ -150,8 +183,10 @@ class PredictionContract:
         if account_address is None:
             account_address = self.account_address
             
-        contract = self._get_erc20_contract(token_address)
-        balance = contract.functions.balanceOf(account_address).call()
+        balance = fast_abi.decode_uint(self.web3.eth.call({
+            'to': checksum_address(token_address),
+            'data': '0x' + fast_abi.balance_of_data(account_address).hex(),
+        }))
         print(f"账户 {account_address} 的代币余额: {balance}")
         return balance
     
@@ -215,13 +250,7 @@ class PredictionContract:
         if to is None:
             to = self.account_address
             
-        return self._send_transaction(
-            self.prediction_contract.functions.addLiquidity,
-            liquidity,
-            to,
-            0,
-            gas_limit=gas_limit
-        )
+        return self._send_calldata(fast_abi.add_liquidity_data(liquidity, to, 0), gas_limit=gas_limit)
     
     def remove_liquidity(self, liquidity: int, gas_limit: Optional[int] = None) -> str:
         """
@@ -234,14 +263,9 @@ class PredictionContract:
         Returns:
             交易哈希
         """
-        return self._send_transaction(
-            self.prediction_contract.functions.removeLiquidity,
-            liquidity,
-            0,
-            gas_limit=gas_limit
-        )
+        return self._send_calldata(fast_abi.remove_liquidity_data(liquidity, 0), gas_limit=gas_limit)
     
-    def deposit(self, option_out: int, delta: int, min_receive: int, deadline: int = 2892290396, gas_limit: Optional[int] = None) -> str:
+    def deposit(self, option_out: int, delta: int, min_receive: int, deadline: int = DEFAULT_DEADLINE, gas_limit: Optional[int] = None) -> str:
         """
         存款操作
         
@@ -255,16 +279,10 @@ class PredictionContract:
         Returns:
             交易哈希
         """
-        return self._send_transaction(
-            self.prediction_contract.functions.deposit,
-            option_out,
-            delta,
-            min_receive,
-            deadline,
-            gas_limit=gas_limit
-        )
+        return self._send_calldata(fast_abi.deposit_data(option_out, delta, min_receive, deadline),
+                                   gas_limit=gas_limit)
     
-    def withdraw(self, option_in: int, delta: int, min_receive: int, deadline: int = 2892290396, gas_limit: Optional[int] = None) -> str:
+    def withdraw(self, option_in: int, delta: int, min_receive: int, deadline: int = DEFAULT_DEADLINE, gas_limit: Optional[int] = None) -> str:
         """
         提款操作
         
@@ -278,16 +296,10 @@ class PredictionContract:
         Returns:
             交易哈希
         """
-        return self._send_transaction(
-            self.prediction_contract.functions.withdraw,
-            option_in,
-            delta,
-            min_receive,
-            deadline,
-            gas_limit=gas_limit
-        )
+        return self._send_calldata(fast_abi.withdraw_data(option_in, delta, min_receive, deadline),
+                                   gas_limit=gas_limit)
     
-    def swap(self, option_out: int, option_in: int, delta: int, min_receive: int, deadline: int = 2892290396, gas_limit: Optional[int] = None) -> str:
+    def swap(self, option_out: int, option_in: int, delta: int, min_receive: int, deadline: int = DEFAULT_DEADLINE, gas_limit: Optional[int] = None) -> str:
         """
         交换操作
         
@@ -302,15 +314,8 @@ class PredictionContract:
         Returns:
             交易哈希
         """
-        return self._send_transaction(
-            self.prediction_contract.functions.swap,
-            option_out,
-            option_in,
-            delta,
-            min_receive,
-            deadline,
-            gas_limit=gas_limit
-        )
+        return self._send_calldata(fast_abi.swap_data(option_out, option_in, delta, min_receive, deadline),
+                                   gas_limit=gas_limit)
     
     # ========== 查询方法 ==========
     
@@ -332,15 +337,19 @@ class PredictionContract:
     
     def get_price(self, option: int) -> int:
         """获取选项价格"""
-        return self.prediction_contract.functions.price(option).call()
+        return fast_abi.decode_uint(self._eth_call(fast_abi.price_data(option)))
     
     def get_reserves(self, index: int) -> int:
         """获取储备金"""
-        return self.prediction_contract.functions.reserves(index).call()
+        return fast_abi.decode_int(self._eth_call(fast_abi.reserves_data(index)))
     
-    def get_amount_out(self, option_out: int, delta: int) -> int:
+    def get_amount_out(self, option_out: int, delta: int, block_identifier='latest') -> int:
         """计算输出金额"""
-        return self.prediction_contract.functions.getAmountOut(option_out, delta).call()
+        return fast_abi.decode_int(self._eth_call(fast_abi.get_amount_out_data(option_out, delta), block_identifier))
+    
+    def get_amounts_out(self, x: List[int], block_identifier='latest') -> int:
+        """根据各选项储备变化向量计算所需/所得金额"""
+        return self.prediction_contract.functions.getAmountsOut(x).call(block_identifier=block_identifier)
     
     def get_state(self) -> Dict[str, Any]:
         """获取合约状态"""
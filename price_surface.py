@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+价格冲击与流动性深度曲面
+
+对给定的池子状态，在「储备水平 × LP水平 × 交易规模」网格上一次性计算
+deposit / withdraw / swap 的成交价格，用于确定LP资金规模。
+计算完全基于 PoolModel 的向量化公式，可选用 BatchQuoter 在链上抽查。
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from pool_model import PoolModel, exp_terms, deposit_out, rest_terms, withdraw_out, swap_out
+
+
+class PriceSurfaceGenerator:
+    """批量生成交易规模到成交价格的曲面，结果按状态哈希缓存"""
+
+    def __init__(self, model: PoolModel, quoter=None, max_cache: int = 32):
+        """
+        初始化曲面生成器
+
+        Args:
+            model: 作为基准状态的 PoolModel
+            quoter: 可选的链上 BatchQuoter，用于抽查
+            max_cache: 最多缓存的曲面数量
+        """
+        self.model = model
+        self.quoter = quoter
+        self.max_cache = max_cache
+        self._cache: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+
+    def _cache_key(self, trade_sizes, reserve_levels, lp_levels) -> str:
+        h = hashlib.sha1(self.model.state_hash().encode())
+        for arr in (trade_sizes, reserve_levels, lp_levels):
+            h.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+            h.update(str(np.shape(arr)).encode())
+        return h.hexdigest()
+
+    def surface(self, trade_sizes: Sequence[float], reserve_levels: Optional[Sequence[Sequence[float]]] = None,
+                lp_levels: Optional[Sequence[float]] = None) -> Dict[str, np.ndarray]:
+        """
+        计算价格曲面
+
+        Args:
+            trade_sizes: 交易规模数组（原始单位），长度K
+            reserve_levels: 形状为(R, n)的储备向量网格，默认仅使用当前储备
+            lp_levels: 长度为L的LP水平，相对当前流动性的倍数，默认[1.0]
+
+        Returns:
+            字典，包含:
+              deposit_price / withdraw_price: 形状(R, L, K, n)
+              swap_price: 形状(R, L, K, n_in, n_out)，对角线为nan
+              spot_price: 形状(R, n)
+            成交价格均以「每个选项代币对应的基础代币」计价
+        """
+        model = self.model
+        n = model.num_options
+        trade_sizes = np.asarray(trade_sizes, dtype=np.float64)
+        if reserve_levels is None:
+            reserve_levels = model.reserves[None, :]
+        reserve_levels = np.asarray(reserve_levels, dtype=np.float64).reshape(-1, n)
+        if lp_levels is None:
+            lp_levels = [1.0]
+        lp_levels = np.asarray(lp_levels, dtype=np.float64)
+
+        key = self._cache_key(trade_sizes, reserve_levels, lp_levels)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        # 广播维度: (R, L, K, n)，LP水平同比缩放流动性因子和储备
+        scale = lp_levels[None, :, None, None]
+        q = reserve_levels[:, None, None, :] * scale
+        b = model.factor * scale
+        delta = trade_sizes[None, None, :, None]
+        e, s = exp_terms(q, model.weights, b)
+        rest = rest_terms(e)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            dep_out = deposit_out(e, s, b, model.fee_rate, delta)
+            wd_out = withdraw_out(e, s, b, model.fee_rate, delta, rest=rest)
+            sw_out = swap_out(e[..., None, :], e[..., :, None], s[..., None], b[..., None],
+                              model.fee_rate, delta[..., None],
+                              same_option=np.eye(n, dtype=bool), rest=rest[..., :, None])
+            deposit_price = np.where(dep_out > 0, delta / dep_out, np.nan)
+            withdraw_price = np.where(wd_out > 0, wd_out / delta, np.nan)
+            swap_price = np.where(sw_out > 0, delta[..., None] / sw_out, np.nan)
+        swap_price[..., np.arange(n), np.arange(n)] = np.nan
+
+        e0, s0 = exp_terms(reserve_levels, model.weights, model.factor)
+        result = {
+            'trade_sizes': trade_sizes,
+            'reserve_levels': reserve_levels,
+            'lp_levels': lp_levels,
+            'spot_price': e0 / s0,
+            'deposit_price': deposit_price,
+            'withdraw_price': withdraw_price,
+            'swap_price': swap_price,
+        }
+        self._cache[key] = result
+        while len(self._cache) > self.max_cache:
+            self._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def liquidity_depth(surface: Dict[str, np.ndarray], max_impact: float = 0.01) -> np.ndarray:
+        """
+        在给定最大价格冲击下可成交的最大deposit规模
+
+        Args:
+            surface: surface() 的返回值
+            max_impact: 相对现价允许的最大冲击，例如0.01表示1%
+
+        Returns:
+            形状(R, L, n)的最大交易规模，网格内没有满足条件的规模时为0
+        """
+        spot = surface['spot_price'][:, None, None, :]
+        impact = surface['deposit_price'] / spot - 1.0
+        ok = impact <= max_impact
+        sizes = surface['trade_sizes'][None, None, :, None]
+        return np.where(ok, sizes, 0.0).max(axis=2)
+
+    def spot_check(self, option: int, trade_sizes: Sequence[int]) -> Dict[str, np.ndarray]:
+        """
+        用链上 getAmountOut 抽查当前状态下的deposit报价
+
+        Args:
+            option: 选项索引
+            trade_sizes: 抽查的交易规模（原始单位）
+
+        Returns:
+            包含 model、chain 和 relative_error 的字典
+        """
+        if self.quoter is None or self.quoter.is_offline:
+            raise ValueError("抽查需要链上BatchQuoter")
+        trade_sizes = np.asarray(trade_sizes, dtype=np.int64)
+        model_out = self.model.get_amount_out(option, trade_sizes)
+        chain_out = self.quoter.quote(np.full(trade_sizes.shape, option), trade_sizes).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative_error = model_out / chain_out - 1.0
+        return {'model': model_out, 'chain': chain_out, 'relative_error': relative_error}
+
+    def clear_cache(self):
+        """清空曲面缓存"""
+        self._cache.clear()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+RPC调用统计与限速
+
+以中间件形式挂在Web3实例上，按JSON-RPC方法和逻辑操作（快照、deposit_o1、
+等待回执等）统计调用次数、耗时和请求/响应字节数；同时用令牌桶把调用速率
+限制在给定的每秒上限内，节点返回429时按指数退避重试。
+"""
+
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# 节点限流时返回的错误码（HTTP 429 以及常见的 JSON-RPC 限流错误码）
+RATE_LIMIT_CODES = (429, -32005)
+
+
+class TokenBucket:
+    """线程安全的令牌桶"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量，默认等于 rate（至少为1）
+        """
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate, 1.0))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        取出令牌，不足时阻塞等待
+
+        Returns:
+            等待的秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RateLimitedError(Exception):
+    """多次退避后节点仍然限流"""
+
+
+def _payload_size(value) -> int:
+    return len(json.dumps(value, default=str, separators=(',', ':')))
+
+
+def _is_rate_limited(error: Optional[BaseException]) -> bool:
+    """
+    异常是否表示节点限流
+
+    只看HTTP状态码、JSON-RPC错误码或异常的 rate_limited 标记（沿 __cause__ 查找），
+    不匹配错误信息文本：回滚数据、十六进制载荷和地址中都可能出现 "429"
+    """
+    while error is not None:
+        if getattr(error, 'rate_limited', False) is True:
+            return True
+        response = getattr(error, 'response', None)
+        if getattr(response, 'status_code', None) in RATE_LIMIT_CODES:
+            return True
+        rpc_response = getattr(error, 'rpc_response', None)
+        rpc_error = rpc_response.get('error') if isinstance(rpc_response, dict) else None
+        if isinstance(rpc_error, dict) and rpc_error.get('code') in RATE_LIMIT_CODES:
+            return True
+        error = error.__cause__
+    return False
+
+
+class RpcAccounting:
+    """按方法和逻辑操作统计RPC调用，并按预算限速"""
+
+    def __init__(self, calls_per_second: Optional[float] = None, burst: Optional[float] = None,
+                 max_retries: int = 5, backoff_base: float = 0.5, measure_bytes: bool = True):
+        """
+        Args:
+            calls_per_second: 每秒调用上限，None或0表示不限速
+            burst: 令牌桶容量，默认等于每秒上限
+            max_retries: 遇到429时的最大重试次数
+            backoff_base: 第一次退避的秒数，之后每次翻倍并加随机抖动
+            measure_bytes: 是否统计请求/响应字节数（需要额外序列化一次）
+        """
+        self.bucket = TokenBucket(calls_per_second, burst) if calls_per_second else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.measure_bytes = measure_bytes
+        # 多个会话的操作器可能在不同线程共用同一个统计对象，当前操作按线程分别保存
+        self._local = threading.local()
+        self.by_method: Dict[str, Dict[str, float]] = {}
+        self.by_operation: Dict[str, Dict[str, float]] = {}
+        self.throttled_seconds = 0.0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current_operation(self) -> str:
+        """当前线程正在执行的逻辑操作"""
+        return getattr(self._local, 'operation', 'other')
+
+    @contextmanager
+    def operation(self, name: str):
+        """把代码块内（当前线程）的RPC调用归入逻辑操作 name"""
+        previous = self.current_operation
+        self._local.operation = name
+        try:
+            yield
+        finally:
+            self._local.operation = previous
+
+    @staticmethod
+    def _empty() -> Dict[str, float]:
+        return {'calls': 0, 'errors': 0, 'seconds': 0.0, 'bytes_sent': 0, 'bytes_received': 0}
+
+    def _account(self, method: str, seconds: float, sent: int, received: int, error: bool):
+        operation = self.current_operation
+        with self._lock:
+            for table, key in ((self.by_method, method), (self.by_operation, operation)):
+                row = table.get(key)
+                if row is None:
+                    row = table[key] = self._empty()
+                row['calls'] += 1
+                row['errors'] += int(error)
+                row['seconds'] += seconds
+                row['bytes_sent'] += sent
+                row['bytes_received'] += received
+
+    def _throttle(self, tokens: int = 1):
+        if self.bucket is not None:
+            waited = self.bucket.acquire(tokens)
+            if waited:
+                with self._lock:
+                    self.throttled_seconds += waited
+
+    def _backoff(self, attempt: int):
+        with self._lock:
+            self.rate_limited += 1
+        if attempt >= self.max_retries:
+            raise RateLimitedError(f"节点持续限流，已重试{attempt}次")
+        delay = self.backoff_base * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+    def call(self, make_request, method: str, params, methods=None):
+        """
+        执行一次RPC请求（批量请求时 methods 为批内各方法名），负责限速、重试和统计
+
+        Args:
+            make_request: 实际发送请求的函数
+            method: 方法名
+            params: 请求参数
+            methods: 批量请求中的方法列表
+
+        Returns:
+            节点响应
+        """
+        if methods is not None and self.bucket is not None and len(methods) > self.bucket.capacity:
+            # 批内每个方法占一个令牌，超过桶容量的批量请求永远取不到足够令牌，按容量拆分发送
+            size = max(int(self.bucket.capacity), 1)
+            responses = []
+            for start in range(0, len(methods), size):
+                part = self.call(make_request, method, params[start:start + size], methods[start:start + size])
+                if not isinstance(part, list):
+                    return part
+                responses.extend(part)
+            return responses
+
+        sent = _payload_size({'method': method, 'params': params}) if self.measure_bytes else 0
+        attempt = 0
+        while True:
+            self._throttle(1 if methods is None else max(len(methods), 1))
+            start = time.perf_counter()
+            try:
+                response = make_request(method, params) if methods is None else make_request(params)
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                if _is_rate_limited(e):
+                    self._backoff(attempt)
+                    attempt += 1
+                    continue
+                self._account(method, elapsed, sent, 0, True)
+                raise
+            elapsed = time.perf_counter() - start
+
+            error = response.get('error') if isinstance(response, dict) else None
+            if isinstance(error, dict) and error.get('code') in RATE_LIMIT_CODES:
+                self._backoff(attempt)
+                attempt += 1
+                continue
+
+            received = _payload_size(response) if self.measure_bytes else 0
+            if methods is None:
+                self._account(method, elapsed, sent, received, error is not None)
+            else:
+                # 批量请求只占一次往返，耗时和字节数均摊到批内各方法；错误按各自的响应统计，
+                # 整个批量请求失败（节点返回单个错误对象）时批内每个方法都记为错误
+                share = 1.0 / max(len(methods), 1)
+                items = response if isinstance(response, list) and len(response) == len(methods) else None
+                for i, name in enumerate(methods):
+                    item_error = (error is not None if items is None
+                                  else isinstance(items[i], dict) and items[i].get('error') is not None)
+                    self._account(name, elapsed * share, int(sent * share), int(received * share), item_error)
+            return response
+
+    def install(self, web3):
+        """在Web3实例上注册统计中间件"""
+        accounting = self
+
+        try:
+            from web3.middleware import Web3Middleware
+        except ImportError:
+            # web3 v6 的函数式中间件
+            def rpc_accounting_middleware(make_request, w3):
+                def middleware(method, params):
+                    return accounting.call(make_request, method, params)
+                return middleware
+
+            web3.middleware_onion.add(rpc_accounting_middleware, name='rpc_accounting')
+            return
+
+        class RpcAccountingMiddleware(Web3Middleware):
+            def wrap_make_request(self, make_request):
+                def middleware(method, params):
+                    return accounting.call(make_request, method, params)
+                return middleware
+
+            def wrap_make_batch_request(self, make_batch_request):
+                def middleware(requests_info):
+                    methods = [str(m) for m, _ in requests_info]
+                    return accounting.call(make_batch_request, 'batch', requests_info, methods=methods)
+                return middleware
+
+        web3.middleware_onion.add(RpcAccountingMiddleware, name='rpc_accounting')
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self.by_method.clear()
+            self.by_operation.clear()
+            self.throttled_seconds = 0.0
+            self.rate_limited = 0
+
+    def total_calls(self) -> int:
+        """累计调用次数"""
+        with self._lock:
+            return int(sum(row['calls'] for row in self.by_method.values()))
+
+    def summary(self) -> Dict[str, object]:
+        """统计摘要"""
+        with self._lock:
+            return {
+                'by_method': {k: dict(v) for k, v in sorted(self.by_method.items())},
+                'by_operation': {k: dict(v) for k, v in sorted(self.by_operation.items())},
+                'throttled_seconds': self.throttled_seconds,
+                'rate_limited': self.rate_limited,
+            }
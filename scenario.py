@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+场景文件与场景运行器
+
+场景用 TOML 或 YAML 描述：市场参数、账户、初始流动性、交易阶段的操作组合和步数、
+结算与领取阶段以及运行结束后的断言。运行器并行执行一个目录下的全部场景：
+离线场景每个一个进程；分叉场景按节点分组，同一节点上的场景依次执行，每个场景前后
+用 evm_snapshot / evm_revert 恢复链状态，不同节点之间并行。结果汇总为一份JSON报告。
+
+场景文件示例（TOML）:
+
+    name = "offline-smoke"
+    backend = "offline"          # offline 或 fork
+    seed = 1
+
+    [market]
+    num_options = 3
+    factor = 1e9
+    liquidity = 1_000_000_000_000
+    fee_rate = 0.003
+
+    [accounts]
+    balance = 100_000_000_000
+    initial_liquidity = 10_000_000_000
+
+    [[phases]]
+    type = "trading"
+    operations = 500
+    mix = { deposit = 30, withdraw = 25, add_liquidity = 20, remove_liquidity = 10 }
+
+    [[assertions]]
+    metric = "invariants.total"
+    op = "=="
+    value = 0
+
+金额均为原始整数。分叉场景的地址和私钥可以写成 "${ACCOUNT_PRIVATE_KEY}" 形式引用环境变量。
+
+用法:
+    python scenario.py scenarios/ --workers 4 --output report.json
+    python scenario.py scenarios/ --fork-url http://127.0.0.1:8545 --fork-url http://127.0.0.1:8546
+"""
+
+import argparse
+import json
+import operator as op
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+SCENARIO_EXTENSIONS = ('.toml', '.yaml', '.yml')
+
+BACKENDS = ('offline', 'fork')
+
+PHASE_TYPES = ('trading', 'settlement', 'claims')
+
+# 只能在分叉节点上执行的阶段
+FORK_ONLY_PHASES = ('settlement', 'claims')
+
+COMPARATORS = {
+    '==': op.eq,
+    '!=': op.ne,
+    '<': op.lt,
+    '<=': op.le,
+    '>': op.gt,
+    '>=': op.ge,
+}
+
+DEFAULT_MARKET = {'num_options': 2, 'factor': 1e9, 'liquidity': 10 ** 12, 'fee_rate': 0.0}
+
+DEFAULT_ACCOUNTS = {'balance': 10 ** 11, 'initial_liquidity': 0}
+
+
+# ========== 读取与校验 ==========
+
+def _expand(value):
+    """递归展开字符串中的环境变量"""
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    if isinstance(value, dict):
+        return {key: _expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+def _read(path: str) -> Dict[str, Any]:
+    if path.endswith('.toml'):
+        # tomllib 从 Python 3.11 起才在标准库中
+        try:
+            import tomllib
+        except ImportError:
+            raise ImportError("TOML 场景文件需要 Python 3.11 及以上版本，或改用 YAML 场景文件")
+
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    # YAML 需要 PyYAML，未安装时抛出 ImportError
+    import yaml
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or {}
+
+
+def validate_scenario(scenario: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    校验场景并补全默认值
+
+    Args:
+        scenario: 解析后的场景字典
+
+    Returns:
+        补全后的场景字典
+
+    Raises:
+        ValueError: 场景内容无效
+    """
+    name = scenario.get('name') or '未命名场景'
+    backend = scenario.get('backend', 'offline')
+    if backend not in BACKENDS:
+        raise ValueError(f"{name}: 不支持的后端 {backend}，可选 {', '.join(BACKENDS)}")
+
+    market = dict(DEFAULT_MARKET, **scenario.get('market', {}))
+    accounts = dict(DEFAULT_ACCOUNTS, **scenario.get('accounts', {}))
+    if backend == 'fork':
+        missing = [key for key, section in (('prediction', market), ('base_token', market), ('account', accounts),
+                                            ('account_key', accounts), ('lp', accounts), ('lp_key', accounts))
+                   if not section.get(key) or '$' in str(section[key])]
+        if missing:
+            raise ValueError(f"{name}: 分叉场景缺少 {', '.join(missing)}（或对应的环境变量未设置）")
+
+    phases = scenario.get('phases') or []
+    if not phases:
+        raise ValueError(f"{name}: 至少需要一个阶段")
+    for index, phase in enumerate(phases):
+        kind = phase.get('type')
+        if kind not in PHASE_TYPES:
+            raise ValueError(f"{name}: 第{index + 1}个阶段的类型 {kind} 无效，可选 {', '.join(PHASE_TYPES)}")
+        if kind in FORK_ONLY_PHASES and backend != 'fork':
+            raise ValueError(f"{name}: {kind} 阶段需要 fork 后端")
+        if kind == 'trading':
+            if int(phase.get('operations', 0)) <= 0:
+                raise ValueError(f"{name}: 第{index + 1}个阶段的 operations 必须大于0")
+            for agent in phase.get('agents', []):
+                if float(agent.get('share', 1)) <= 0 or not agent.get('mix'):
+                    raise ValueError(f"{name}: 代理 {agent.get('name', '?')} 需要正的 share 和 mix")
+        if kind == 'settlement' and 'final_option' not in phase:
+            raise ValueError(f"{name}: settlement 阶段需要 final_option")
+
+    for assertion in scenario.get('assertions', []):
+        if assertion.get('op', '==') not in COMPARATORS or 'metric' not in assertion or 'value' not in assertion:
+            raise ValueError(f"{name}: 无效的断言 {assertion}")
+
+    return dict(scenario, name=name, backend=backend, seed=int(scenario.get('seed', 0)),
+                timeout=int(scenario.get('timeout', 60)), invariants=bool(scenario.get('invariants', True)),
+                market=market, accounts=accounts, phases=phases, assertions=scenario.get('assertions', []))
+
+
+def load_scenario(path: str) -> Dict[str, Any]:
+    """
+    读取并校验场景文件
+
+    Args:
+        path: .toml / .yaml / .yml 文件路径
+
+    Returns:
+        场景字典，'path' 为文件路径，未指定 name 时使用文件名
+    """
+    scenario = _expand(_read(path))
+    scenario.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    scenario = validate_scenario(scenario)
+    scenario['path'] = path
+    return scenario
+
+
+def find_scenarios(paths: Sequence[str]) -> List[str]:
+    """展开目录，返回按名称排序的场景文件列表"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith(SCENARIO_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+# ========== 执行 ==========
+
+def build_operator(scenario: Dict[str, Any], fork_url: Optional[str] = None):
+    """按场景创建操作器"""
+    market, accounts = scenario['market'], scenario['accounts']
+    if scenario['backend'] == 'offline':
+        from benchmark import build_offline_operator
+
+        operator = build_offline_operator(int(market['num_options']), float(market['factor']),
+                                          int(market['liquidity']), int(accounts['balance']))
+        operator.model.fee_rate = float(market['fee_rate'])
+        return operator
+
+    from benchmark import build_chain_operator
+
+    args = argparse.Namespace(prediction=market['prediction'], base_token=market['base_token'],
+                              account=accounts['account'], account_key=accounts['account_key'],
+                              lp=accounts['lp'], lp_key=accounts['lp_key'],
+                              rpc_budget=float(scenario.get('rpc_budget', 0)))
+    return build_chain_operator(args, fork_url)
+
+
+def _record_snapshot(operator, operation: str, amount: int = 0, tx_hash: Optional[str] = None, success: bool = True):
+    balances = operator.get_current_balances()
+    operator.record_operation(operation, amount, tx_hash, success, balances, operator.calculate_prices(balances))
+
+
+def run_trading(operator, phase: Dict[str, Any], rng: random.Random, timeout: int) -> Dict[str, Any]:
+    """
+    交易阶段：按操作组合执行固定步数的批量操作
+
+    Args:
+        operator: 操作器
+        phase: 阶段配置，mix 为按操作类型的权重；agents 为 [{name, share, mix}]，每步先按 share 选代理
+        rng: 选择代理用的随机数生成器
+        timeout: 交易确认超时（秒）
+
+    Returns:
+        阶段统计，latencies 为每步耗时（秒）
+    """
+    from benchmark import DEFAULT_MIX, operation_weights
+
+    agents = phase.get('agents') or [{'name': 'default', 'share': 1, 'mix': phase.get('mix', DEFAULT_MIX)}]
+    weights = [operation_weights(operator.num_options, dict(DEFAULT_MIX, **agent['mix'])) for agent in agents]
+    shares = [float(agent.get('share', 1)) for agent in agents]
+    steps = int(phase['operations'])
+
+    latencies = np.zeros(steps)
+    statuses: Dict[str, int] = {}
+    by_agent = {agent.get('name', f'agent{i + 1}'): 0 for i, agent in enumerate(agents)}
+    executed = succeeded = 0
+    started = time.perf_counter()
+    for i in range(steps):
+        agent = rng.choices(range(len(agents)), weights=shares)[0]
+        step_started = time.perf_counter()
+        step = operator.run_batch_step(weights[agent], timeout=timeout)
+        latencies[i] = time.perf_counter() - step_started
+        statuses[step['status']] = statuses.get(step['status'], 0) + 1
+        if step['status'] == 'no_balances':
+            latencies = latencies[:i + 1]
+            break
+        if step['status'] == 'done':
+            executed += 1
+            succeeded += int(step['success'])
+            by_agent[list(by_agent)[agent]] += 1
+    seconds = time.perf_counter() - started
+    return {
+        'steps': len(latencies),
+        'operations': executed,
+        'succeeded': succeeded,
+        'success_rate': succeeded / executed if executed else 0.0,
+        'statuses': statuses,
+        'by_agent': by_agent,
+        'seconds': seconds,
+        'ops_per_second': executed / seconds if seconds > 0 else 0.0,
+        'step_latency_ms': _latency_percentiles(latencies),
+        'latencies': latencies,
+    }
+
+
+def _latency_percentiles(latencies: np.ndarray) -> Dict[str, float]:
+    return {
+        'p50': float(np.percentile(latencies, 50) * 1000) if len(latencies) else 0.0,
+        'p99': float(np.percentile(latencies, 99) * 1000) if len(latencies) else 0.0,
+    }
+
+
+def _merge_trading(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """多个交易阶段的合计"""
+    operations = sum(result['operations'] for result in results)
+    succeeded = sum(result['succeeded'] for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    return {
+        'operations': operations,
+        'succeeded': succeeded,
+        'success_rate': succeeded / operations if operations else 0.0,
+        'seconds': seconds,
+        'ops_per_second': operations / seconds if seconds > 0 else 0.0,
+        # 分位数按所有阶段的单步延迟合并计算，不能由各阶段的分位数得出
+        'step_latency_ms': _latency_percentiles(np.concatenate([result['latencies'] for result in results])),
+    }
+
+
+def _lp_metrics(operator) -> Dict[str, float]:
+    from lp_analytics import DEFAULT_LP_NAME, LPAnalytics
+
+    analytics = LPAnalytics.from_operator(operator)
+    position = analytics.positions[DEFAULT_LP_NAME]
+    if not analytics.has_data or not len(position['value']):
+        return {}
+    scale = 10.0 ** operator.base_decimals
+    metrics = {key: float(position[key][-1]) / scale
+               for key in ('value', 'contributed', 'pnl', 'fee_income', 'inventory', 'liquidity', 'impermanent_loss')}
+    metrics['return'] = float(position['return'][-1])
+    return metrics
+
+
+def resolve_metric(metrics: Dict[str, Any], path: str):
+    """按点分路径读取指标，例如 trading.ops_per_second"""
+    value: Any = metrics
+    for part in path.split('.'):
+        if isinstance(value, list):
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            raise KeyError(path)
+    return value
+
+
+def check_assertions(assertions: List[Dict[str, Any]], metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """逐条检查断言，返回每条的实际值和结果"""
+    results = []
+    for assertion in assertions:
+        comparator = assertion.get('op', '==')
+        try:
+            actual = resolve_metric(metrics, assertion['metric'])
+            passed = bool(COMPARATORS[comparator](actual, assertion['value']))
+        except (KeyError, IndexError, TypeError, ValueError):
+            actual, passed = None, False
+        results.append({'metric': assertion['metric'], 'op': comparator, 'expected': assertion['value'],
+                        'actual': actual, 'passed': passed})
+    return results
+
+
+def run_scenario(scenario: Dict[str, Any], fork_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    执行一个场景
+
+    Args:
+        scenario: load_scenario 返回的场景
+        fork_url: 分叉节点地址，场景的 market.fork_url 优先
+
+    Returns:
+        {'name', 'path', 'backend', 'passed', 'seconds', 'metrics', 'assertions', 'error'}
+    """
+    from invariants import InvariantChecker
+    from operation_stats import INIT_OPERATION
+
+    started = time.perf_counter()
+    fork_url = scenario['market'].get('fork_url') or fork_url
+    result = {'name': scenario['name'], 'path': scenario.get('path'), 'backend': scenario['backend'],
+              'fork_url': fork_url if scenario['backend'] == 'fork' else None,
+              'passed': False, 'metrics': {}, 'assertions': [], 'error': None}
+    fork = snapshot_id = None
+    try:
+        if scenario['backend'] == 'fork' and not fork_url:
+            raise ValueError("分叉场景需要分叉节点地址（market.fork_url 或 --fork-url）")
+        operator = build_operator(scenario, fork_url)
+        if scenario['backend'] == 'fork':
+            from settlement import ForkControl
+
+            fork = ForkControl(operator.web3)
+            snapshot_id = fork.snapshot()
+
+        seed, timeout = scenario['seed'], scenario['timeout']
+        random.seed(seed)
+        np.random.seed(seed)
+        operator.rng.seed(seed)
+        rng = random.Random(seed)
+        if scenario['invariants']:
+            operator.invariants = InvariantChecker()
+        _record_snapshot(operator, INIT_OPERATION)
+
+        initial_liquidity = int(scenario['accounts'].get('initial_liquidity', 0))
+        if initial_liquidity > 0:
+            tx_hash, success = operator.add_liquidity(initial_liquidity)
+            if success and tx_hash:
+                success, _ = operator.wait_for_transaction(tx_hash, timeout=timeout)
+            if not success:
+                raise RuntimeError("添加初始流动性失败")
+            _record_snapshot(operator, 'add_liquidity', initial_liquidity, tx_hash, bool(success))
+
+        phases, trading, simulator = [], [], None
+        for phase in scenario['phases']:
+            if phase['type'] == 'trading':
+                phase_result = run_trading(operator, phase, rng, timeout)
+                trading.append(phase_result)
+                # 单步延迟只用于合计，不写入报告
+                phase_result = {key: value for key, value in phase_result.items() if key != 'latencies'}
+            else:
+                if simulator is None:
+                    from settlement import SettlementSimulator
+
+                    simulator = SettlementSimulator(operator)
+                if phase['type'] == 'settlement':
+                    holders = int(phase.get('holders', 0))
+                    if holders:
+                        simulator.create_holders(holders, seed=seed)
+                        simulator.fund_holders(int(phase.get('holder_amount', 10 ** 6)), seed=seed, timeout=timeout)
+                    settled = simulator.settle(int(phase['final_option']), phase.get('oracle_key'),
+                                               bool(phase.get('warp', True)), timeout)
+                    phase_result = {key: value for key, value in settled.items() if key.endswith(('_gas', '_seconds'))}
+                    phase_result['status'] = settled['after']['status']
+                else:
+                    phase_result = simulator.claim_storm(int(phase.get('batch_size', 100)),
+                                                         int(phase.get('parts', 1)), timeout)
+                    phase_result.pop('batches', None)
+                result['metrics'].setdefault(phase['type'], phase_result)
+            phases.append(dict(phase_result, type=phase['type']))
+
+        metrics = result['metrics']
+        metrics['phases'] = phases
+        if trading:
+            metrics['trading'] = _merge_trading(trading)
+        if operator.invariants is not None:
+            operator.invariants.check(operator)
+            summary = operator.invariants.summary()
+            metrics['invariants'] = dict(summary, total=sum(summary['violations'].values()))
+        metrics['lp'] = _lp_metrics(operator)
+        metrics['rpc_calls'] = operator.rpc_accounting.total_calls()
+
+        result['assertions'] = check_assertions(scenario['assertions'], metrics)
+        result['passed'] = all(item['passed'] for item in result['assertions'])
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        if snapshot_id is not None:
+            try:
+                fork.revert(snapshot_id)
+            except Exception as e:
+                result['error'] = result['error'] or f"回滚分叉节点失败: {e}"
+                result['passed'] = False
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def run_group(scenarios: List[Dict[str, Any]], fork_url: Optional[str] = None) -> List[Dict[str, Any]]:
+    """依次执行同一节点上的场景（在工作进程中执行）"""
+    return [run_scenario(scenario, fork_url) for scenario in scenarios]
+
+
+def run_scenarios(paths: Sequence[str], workers: Optional[int] = None,
+                  fork_urls: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    并行执行场景文件并汇总
+
+    Args:
+        paths: 场景文件或目录
+        workers: 工作进程数，默认为CPU核数
+        fork_urls: 分叉节点地址；未在场景中指定节点的分叉场景轮流分配
+
+    Returns:
+        汇总报告
+    """
+    started = time.perf_counter()
+    results: List[Dict[str, Any]] = []
+    groups: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    fork_index = 0
+    for path in find_scenarios(paths):
+        try:
+            scenario = load_scenario(path)
+        except Exception as e:
+            results.append({'name': os.path.basename(path), 'path': path, 'passed': False,
+                            'error': f"{type(e).__name__}: {e}", 'metrics': {}, 'assertions': []})
+            continue
+        if scenario['backend'] == 'offline':
+            # 离线场景互不影响，每个单独一组
+            groups[f"offline:{path}"] = [scenario]
+            continue
+        url = scenario['market'].get('fork_url')
+        if not url and fork_urls:
+            url = fork_urls[fork_index % len(fork_urls)]
+            fork_index += 1
+        groups.setdefault(url, []).append(scenario)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_group, scenarios, None if str(key).startswith('offline:') else key)
+                   for key, scenarios in groups.items()]
+        for future in as_completed(futures):
+            results.extend(future.result())
+    results.sort(key=lambda item: str(item.get('path')))
+
+    passed = sum(1 for item in results if item['passed'])
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'scenarios': results,
+        'total': len(results),
+        'passed': passed,
+        'failed': len(results) - passed,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+# ========== 命令行 ==========
+
+def parse_args(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="执行场景文件并汇总结果")
+    parser.add_argument('paths', nargs='+', help="场景文件或目录")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认为CPU核数")
+    parser.add_argument('--fork-url', action='append', default=[],
+                        help="分叉节点地址，可重复指定，分叉场景轮流分配到各节点")
+    parser.add_argument('--output', help="报告JSON文件路径，默认输出到标准输出")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None):
+    args = parse_args(argv)
+    report = run_scenarios(args.paths, args.workers, args.fork_url)
+
+    for item in report['scenarios']:
+        status = '通过' if item['passed'] else '失败'
+        print(f"[{status}] {item['name']} ({item.get('seconds', 0):.1f}s)", file=sys.stderr)
+        if item['error']:
+            print(f"    错误: {item['error']}", file=sys.stderr)
+        for assertion in item['assertions']:
+            if not assertion['passed']:
+                print(f"    {assertion['metric']} {assertion['op']} {assertion['expected']}，实际 {assertion['actual']}",
+                      file=sys.stderr)
+    print(f"共 {report['total']} 个场景，通过 {report['passed']}，失败 {report['failed']}", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+页面会话管理
+
+Streamlit 每个浏览器会话原本在 session_state 中保存一个完整的 ChainContractOperator：
+Web3连接、全部合约封装、私钥和不断增长的操作历史，服务器运行期间一直占用内存。
+这里改为：
+- session_state 中只保存会话ID
+- 相同配置（节点、合约、账户）的会话共用一个已连接的操作器，按引用计数管理，
+  每个会话拿到的是共享连接和合约封装的会话副本，操作历史、统计和随机数生成器各自独立
+- 操作历史超过上限后，较早的记录按块写入磁盘，内存中只保留最近的记录
+- 超过空闲时间没有访问的会话被回收，删除其历史文件，最后一个会话回收后关闭共享连接
+
+SessionManager 本身不依赖 Streamlit，页面通过 st.cache_resource 在进程内共享一个实例。
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# 每个会话在内存中保留的历史记录数
+DEFAULT_HISTORY_LIMIT = 5000
+
+# 每次写入磁盘的记录数
+DEFAULT_SPILL_CHUNK = 1000
+
+# 会话空闲多久后回收（秒）
+DEFAULT_IDLE_SECONDS = 1800
+
+DEFAULT_SPILL_DIR = os.path.join(tempfile.gettempdir(), 'prediction_sessions')
+
+
+class SpillingHistory:
+    """操作历史列表：内存中只保留最近的记录，更早的记录按块追加到磁盘文件
+
+    支持操作器和检查点用到的列表操作：append / extend / clear、len、整数下标和切片、迭代。
+    """
+
+    def __init__(self, path: str, memory_limit: int = DEFAULT_HISTORY_LIMIT, chunk_size: int = DEFAULT_SPILL_CHUNK):
+        """
+        Args:
+            path: 溢出文件路径
+            memory_limit: 内存中至少保留的最近记录数
+            chunk_size: 每次写入磁盘的记录数
+        """
+        self.path = path
+        self.memory_limit = max(1, int(memory_limit))
+        self.chunk_size = max(1, int(chunk_size))
+        self._recent: List[dict] = []
+        # 每块在文件中的 (偏移, 记录数)
+        self._chunks: List[tuple] = []
+        self._spilled = 0
+        self._cached_index: Optional[int] = None
+        self._cached_chunk: List[dict] = []
+
+    def __len__(self) -> int:
+        return self._spilled + len(self._recent)
+
+    @property
+    def in_memory(self) -> int:
+        """内存中的记录数"""
+        return len(self._recent)
+
+    @property
+    def spilled(self) -> int:
+        """已写入磁盘的记录数"""
+        return self._spilled
+
+    # ========== 写入 ==========
+
+    def append(self, record: dict):
+        self._recent.append(record)
+        if len(self._recent) >= self.memory_limit + self.chunk_size:
+            self._spill()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def _spill(self):
+        chunk = self._recent[:self.chunk_size]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._chunks.append((offset, len(chunk)))
+        self._spilled += len(chunk)
+        del self._recent[:self.chunk_size]
+
+    def clear(self):
+        """清空历史并删除溢出文件"""
+        self._recent = []
+        self._chunks = []
+        self._spilled = 0
+        self._cached_index, self._cached_chunk = None, []
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    close = clear
+
+    # ========== 读取 ==========
+
+    def _load_chunk(self, index: int) -> List[dict]:
+        # 顺序读取时同一块连续命中，只缓存最近一块
+        if self._cached_index != index:
+            offset, _ = self._chunks[index]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                self._cached_chunk = pickle.load(f)
+            self._cached_index = index
+        return self._cached_chunk
+
+    def _slice(self, start: int, stop: int) -> List[dict]:
+        records: List[dict] = []
+        if start < self._spilled:
+            first = 0
+            for index, (_, count) in enumerate(self._chunks):
+                last = first + count
+                if last > start and first < stop:
+                    chunk = self._load_chunk(index)
+                    records.extend(chunk[max(start - first, 0):min(stop, last) - first])
+                if last >= stop:
+                    break
+                first = last
+        if stop > self._spilled:
+            records.extend(self._recent[max(start - self._spilled, 0):stop - self._spilled])
+        return records
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._slice(start, max(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        index = key + len(self) if key < 0 else key
+        if not 0 <= index < len(self):
+            raise IndexError("历史记录下标越界")
+        if index >= self._spilled:
+            return self._recent[index - self._spilled]
+        return self._slice(index, index + 1)[0]
+
+    def __iter__(self):
+        for index in range(len(self._chunks)):
+            yield from self._load_chunk(index)
+        yield from list(self._recent)
+
+
+class _SharedConnection:
+    """同一配置的会话共用的已连接操作器"""
+
+    __slots__ = ('operator', 'sessions')
+
+    def __init__(self, operator):
+        self.operator = operator
+        self.sessions = 0
+
+
+class _Session:
+    __slots__ = ('key', 'operator', 'last_seen', 'busy')
+
+    def __init__(self, key: str, operator):
+        self.key = key
+        self.operator = operator
+        self.last_seen = time.monotonic()
+        # 正在执行的长时间操作数，大于0时不回收
+        self.busy = 0
+
+
+class SessionManager:
+    """按会话ID管理操作器，共享连接并限制每个会话的内存占用"""
+
+    def __init__(self, history_limit: int = DEFAULT_HISTORY_LIMIT, idle_seconds: float = DEFAULT_IDLE_SECONDS,
+                 spill_dir: Optional[str] = None, spill_chunk: int = DEFAULT_SPILL_CHUNK):
+        """
+        Args:
+            history_limit: 每个会话在内存中保留的历史记录数，超出部分写入磁盘
+            idle_seconds: 会话空闲多久后回收（秒）
+            spill_dir: 历史溢出文件目录
+            spill_chunk: 每次写入磁盘的记录数
+        """
+        self.history_limit = history_limit
+        self.idle_seconds = idle_seconds
+        self.spill_dir = spill_dir or DEFAULT_SPILL_DIR
+        self.spill_chunk = spill_chunk
+        self._connections: Dict[str, _SharedConnection] = {}
+        self._sessions: Dict[str, _Session] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def connection_key(config: Dict[str, Any]) -> str:
+        """配置的哈希，私钥只参与哈希，不出现在键中"""
+        text = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    # ========== 会话 ==========
+
+    def open(self, session_id: str, config: Dict[str, Any], factory: Callable[[Dict[str, Any]], Any]):
+        """
+        为会话创建操作器，相同配置的已有连接直接复用
+
+        Args:
+            session_id: 会话ID
+            config: 连接配置（节点、合约地址、账户和私钥等）
+            factory: 没有可复用的连接时调用 factory(config) 创建已连接的操作器，失败时抛出异常
+
+        Returns:
+            会话自己的操作器副本
+        """
+        self.close(session_id)
+        self.evict_idle()
+        key = self.connection_key(config)
+        with self._lock:
+            connection = self._connections.get(key)
+        if connection is None:
+            # 连接耗时较长，在锁外创建；并发创建了相同连接时保留先完成的一个
+            operator = factory(config)
+            with self._lock:
+                connection = self._connections.get(key)
+                if connection is None:
+                    connection = self._connections[key] = _SharedConnection(operator)
+                    operator = None
+            if operator is not None:
+                operator.close()
+
+        history = SpillingHistory(os.path.join(self.spill_dir, f'{session_id}.pkl'),
+                                  self.history_limit, self.spill_chunk)
+        with self._lock:
+            connection.sessions += 1
+            view = connection.operator.session_view(history)
+            self._sessions[session_id] = _Session(key, view)
+        return view
+
+    def get(self, session_id: str):
+        """
+        会话的操作器，同时刷新最近访问时间
+
+        Returns:
+            操作器；会话不存在或已被回收时返回None
+        """
+        self.evict_idle()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.last_seen = time.monotonic()
+            return session.operator
+
+    @contextmanager
+    def busy(self, session_id: str):
+        """
+        标记会话正在执行长时间操作（批量操作、结算领取等），期间不会被空闲回收
+
+        页面只在每次重跑开始时调用 get() 刷新访问时间，运行时间超过空闲超时的操作
+        需要用它包住，否则可能被其他会话触发的回收删除历史文件并关闭共享连接
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.busy += 1
+        try:
+            yield
+        finally:
+            if session is not None:
+                with self._lock:
+                    session.busy -= 1
+                    session.last_seen = time.monotonic()
+
+    def close(self, session_id: str) -> bool:
+        """关闭会话，删除历史文件，没有会话使用的连接随之关闭"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            connection = self._connections.get(session.key)
+            shared = None
+            if connection is not None:
+                connection.sessions -= 1
+                if connection.sessions <= 0:
+                    shared = self._connections.pop(session.key).operator
+        session.operator.operation_history.close()
+        if shared is not None:
+            shared.close()
+        return True
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        回收空闲超时的会话，正在执行长时间操作的会话除外
+
+        Returns:
+            回收的会话数
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [session_id for session_id, session in self._sessions.items()
+                    if not session.busy and now - session.last_seen > self.idle_seconds]
+        return sum(self.close(session_id) for session_id in idle)
+
+    def summary(self) -> Dict[str, int]:
+        """会话数、共享连接数以及内存中和磁盘上的历史记录数"""
+        with self._lock:
+            histories = [session.operator.operation_history for session in self._sessions.values()]
+            return {
+                'sessions': len(self._sessions),
+                'connections': len(self._connections),
+                'records_in_memory': sum(history.in_memory for history in histories),
+                'records_on_disk': sum(history.spilled for history in histories),
+            }
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+结算与领取的生命周期模拟
+
+在分叉节点（anvil / hardhat / tenderly）上驱动市场收尾阶段：
+1. 生成一批持有人账户，用分叉节点接口发放Gas，并由交易账户转入选项代币
+2. 由owner调用 settle(option)，再以本地替身代替预言机回调
+   assertionResolvedCallback(assertionId, true)：有预言机私钥时直接签名，
+   否则通过分叉节点冒充 oracle() 地址发送
+3. 持有人按批并发领取：每批交易在签名流水线中预签名，各账户的nonce在本地分配，
+   一个账户拆成多笔 claim 时按nonce顺序连续发送；收据按批量请求轮询
+
+领取阶段统计吞吐量、每笔Gas、从发送到确认的延迟，以及每批之后池子基础代币余额的下降。
+"""
+
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import fast_abi
+from abi_cache import checksum_address
+from instrumentation import Histogram
+from nonce_manager import NonceManager
+from prediction_contract import PredictionContract
+from signing_pipeline import SigningPipeline
+
+# keccak256("Claimed(address,uint256,uint256)")
+CLAIMED_TOPIC = '0x987d620f307ff6b94d58743cb7a7509f24071586a77759b77c2d4e29f75a2f9a'
+
+# 单次批量请求的最大条数
+BATCH_LIMIT = 500
+
+DEFAULT_TRANSFER_GAS = 100000
+DEFAULT_CLAIM_GAS = 300000
+DEFAULT_SETTLE_GAS = 1000000
+
+
+def _hex_int(value) -> int:
+    return int(value, 16) if isinstance(value, str) else int(value or 0)
+
+
+def _chunks(items: Sequence, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ForkControl:
+    """分叉节点的调试接口，按 anvil / hardhat / tenderly 的方法名依次尝试"""
+
+    # 方法名 -> 参数构造函数
+    IMPERSONATE = (
+        ('anvil_impersonateAccount', lambda address: [address]),
+        ('hardhat_impersonateAccount', lambda address: [address]),
+    )
+    SET_BALANCE = (
+        ('anvil_setBalance', lambda address, wei: [address, hex(wei)]),
+        ('hardhat_setBalance', lambda address, wei: [address, hex(wei)]),
+        ('tenderly_setBalance', lambda address, wei: [[address], hex(wei)]),
+    )
+
+    def __init__(self, web3):
+        """
+        Args:
+            web3: 连接分叉节点的Web3实例
+        """
+        self.web3 = web3
+        # 已确认可用的方法，避免每次都从第一个开始尝试
+        self._working: Dict[str, Tuple[str, Any]] = {}
+
+    def request(self, method: str, params: list):
+        """
+        发送原始JSON-RPC请求
+
+        Raises:
+            RuntimeError: 节点返回错误
+        """
+        response = self.web3.provider.make_request(method, params)
+        error = response.get('error')
+        if error:
+            message = error.get('message', error) if isinstance(error, dict) else error
+            raise RuntimeError(f"{method}: {message}")
+        return response.get('result')
+
+    def _request_any(self, kind: str, candidates, *args):
+        if kind in self._working:
+            method, build = self._working[kind]
+            return self.request(method, build(*args))
+        error = None
+        for method, build in candidates:
+            try:
+                result = self.request(method, build(*args))
+            except Exception as e:
+                error = e
+                continue
+            self._working[kind] = (method, build)
+            return result
+        raise RuntimeError(f"节点不支持{kind}接口，需要 anvil / hardhat / tenderly 分叉节点: {str(error)}")
+
+    def impersonate(self, address: str):
+        """冒充账户；tenderly 无需冒充，直接发送即可"""
+        try:
+            self._request_any('冒充账户', self.IMPERSONATE, checksum_address(address))
+        except RuntimeError:
+            pass
+
+    def set_balance(self, address: str, wei: int):
+        """设置账户ETH余额"""
+        self._request_any('设置余额', self.SET_BALANCE, checksum_address(address), wei)
+
+    def warp_to(self, timestamp: int):
+        """把下一个区块的时间设为 timestamp 并出块"""
+        self.request('evm_setNextBlockTimestamp', [hex(timestamp)])
+        self.request('evm_mine', [])
+
+    def snapshot(self) -> str:
+        """保存当前链状态，返回快照ID"""
+        return self.request('evm_snapshot', [])
+
+    def revert(self, snapshot_id: str):
+        """回滚到快照，快照ID只能使用一次"""
+        if not self.request('evm_revert', [snapshot_id]):
+            raise RuntimeError(f"回滚到快照 {snapshot_id} 失败")
+
+    def send_as(self, address: str, to: str, data: bytes, gas: int) -> str:
+        """
+        以冒充的账户发送未签名交易
+
+        Args:
+            address: 发送方地址
+            to: 合约地址
+            data: 调用数据
+            gas: Gas限制
+
+        Returns:
+            交易哈希
+        """
+        self.impersonate(address)
+        return self.request('eth_sendTransaction', [{
+            'from': checksum_address(address),
+            'to': checksum_address(to),
+            'data': '0x' + data.hex(),
+            'gas': hex(gas),
+        }])
+
+
+class SettlementSimulator:
+    """驱动结算并模拟大量持有人同时领取"""
+
+    def __init__(self, operator, max_workers: Optional[int] = None, use_processes: bool = True):
+        """
+        Args:
+            operator: 已初始化的 ChainContractOperator（连接分叉节点）
+            max_workers: 签名进程/线程数
+            use_processes: 是否在进程池中签名
+        """
+        self.operator = operator
+        self.web3 = operator.web3
+        self.prediction_address = checksum_address(operator.PREDICTION_CONTRACT_ADDRESS)
+        self.fork = ForkControl(self.web3)
+        self.nonce_manager = NonceManager(self.web3)
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+
+        # 交易账户兼作选项代币的发放方
+        self.funder = PredictionContract(self.web3, self.prediction_address, operator.ACCOUNT_PRIVATE_KEY,
+                                         operator.ACCOUNT_ADDRESS, self.nonce_manager)
+        self.holders: List[PredictionContract] = []
+        self.holder_options: List[int] = []
+        self.settlement: Optional[Dict[str, Any]] = None
+
+    def _pipeline(self) -> SigningPipeline:
+        return SigningPipeline(self.nonce_manager, max_workers=self.max_workers,
+                               use_processes=self.use_processes)
+
+    # ========== 批量读取 ==========
+
+    def _batch(self, requests: List[Tuple[str, list]]) -> List[dict]:
+        """按原始JSON-RPC批量发送，返回与请求顺序一致的响应"""
+        provider = self.web3.provider
+        responses: List[dict] = []
+        for chunk in _chunks(requests, BATCH_LIMIT):
+            if hasattr(provider, 'make_batch_request'):
+                batch = provider.make_batch_request(chunk)
+                if isinstance(batch, dict):
+                    # 整个批量请求出错
+                    raise RuntimeError(f"批量请求失败: {batch.get('error')}")
+                responses.extend(sorted(batch, key=lambda item: item.get('id', 0)))
+            else:
+                responses.extend(provider.make_request(method, params) for method, params in chunk)
+        return responses
+
+    def _call(self, to: str, data: bytes, decoder=fast_abi.decode_uint):
+        return fast_abi.RawCall(self.web3, checksum_address(to), data, decoder).call()
+
+    def _balances(self, token: str, addresses: Sequence[str]) -> List[int]:
+        """一次批量请求读取多个账户的代币余额"""
+        to = checksum_address(token)
+        responses = self._batch([
+            ('eth_call', [{'to': to, 'data': '0x' + fast_abi.balance_of_data(address).hex()}, 'latest'])
+            for address in addresses
+        ])
+        balances = []
+        for address, response in zip(addresses, responses):
+            if 'error' in response:
+                raise RuntimeError(f"读取 {address} 余额失败: {response['error']}")
+            balances.append(fast_abi.decode_uint(response['result']))
+        return balances
+
+    def pool_balance(self) -> int:
+        """池子持有的基础代币数量"""
+        return self._call(self.operator.BASE_TOKEN_ADDRESS, fast_abi.balance_of_data(self.prediction_address))
+
+    def market_state(self) -> Dict[str, Any]:
+        """市场的结算状态"""
+        address = self.prediction_address
+        return {
+            'status': self._call(address, fast_abi.STATUS),
+            'final_option': self._call(address, fast_abi.FINAL_OPTION, fast_abi.decode_int),
+            'assertion_id': '0x' + self._call(address, fast_abi.ASSERTION_ID, fast_abi.decode_bytes32).hex(),
+            'assert_time': self._call(address, fast_abi.ASSERT_TIME),
+            'oracle': self._call(address, fast_abi.ORACLE, fast_abi.decode_address),
+        }
+
+    def wait_receipts(self, tx_hashes: Sequence[str], timeout: float = 120.0,
+                      poll_interval: float = 0.5) -> Dict[str, Tuple[dict, float]]:
+        """
+        批量轮询交易收据，每轮只对尚未确认的交易发一次批量请求
+
+        Args:
+            tx_hashes: 交易哈希列表
+            timeout: 超时时间（秒）
+            poll_interval: 轮询间隔（秒）
+
+        Returns:
+            {交易哈希: (原始收据, 确认时刻)}，超时未确认的交易不在结果中
+        """
+        # 签名流水线返回的哈希可能没有0x前缀
+        pending = [tx_hash if tx_hash.startswith('0x') else '0x' + tx_hash for tx_hash in tx_hashes if tx_hash]
+        receipts: Dict[str, Tuple[dict, float]] = {}
+        deadline = time.monotonic() + timeout
+        while pending:
+            responses = self._batch([('eth_getTransactionReceipt', [tx_hash]) for tx_hash in pending])
+            now = time.perf_counter()
+            still_pending = []
+            for tx_hash, response in zip(pending, responses):
+                receipt = response.get('result')
+                if receipt:
+                    receipts[tx_hash] = (receipt, now)
+                else:
+                    still_pending.append(tx_hash)
+            pending = still_pending
+            if pending:
+                if time.monotonic() >= deadline:
+                    print(f"⚠️ {len(pending)} 笔交易在 {timeout} 秒内未确认")
+                    break
+                time.sleep(poll_interval)
+        return receipts
+
+    def _wait_one(self, tx_hash: str, timeout: float = 120.0) -> dict:
+        receipts = self.wait_receipts([tx_hash], timeout)
+        if tx_hash not in receipts:
+            raise TimeoutError(f"交易 {tx_hash} 在 {timeout} 秒内未确认")
+        receipt = receipts[tx_hash][0]
+        if _hex_int(receipt.get('status')) != 1:
+            raise RuntimeError(f"交易 {tx_hash} 执行失败")
+        return receipt
+
+    # ========== 持有人 ==========
+
+    def create_holders(self, count: int, seed: int = 0) -> List[str]:
+        """
+        按种子生成持有人账户，同一种子得到相同的账户
+
+        Args:
+            count: 持有人数量
+            seed: 随机种子
+
+        Returns:
+            持有人地址列表
+        """
+        from eth_account import Account
+
+        rng = random.Random(seed)
+        holders = []
+        for _ in range(count):
+            key = '0x' + rng.getrandbits(256).to_bytes(32, 'big').hex()
+            account = Account.from_key(key)
+            holders.append(PredictionContract(self.web3, self.prediction_address, key,
+                                              account.address, self.nonce_manager))
+
+        # 重复运行时账户可能已有交易，一次批量请求读取全部nonce
+        responses = self._batch([('eth_getTransactionCount', [holder.account_address, 'pending'])
+                                 for holder in holders])
+        for holder, response in zip(holders, responses):
+            if 'result' in response:
+                self.nonce_manager.prime(holder.account_address, _hex_int(response['result']))
+
+        self.holders = holders
+        self.holder_options = []
+        return [holder.account_address for holder in holders]
+
+    def fund_holders(self, amount: int, gas_wei: int = 10 ** 18, options: Optional[Sequence[int]] = None,
+                     seed: int = 0, timeout: float = 120.0) -> Dict[str, Any]:
+        """
+        给持有人发放Gas和选项代币：每人随机获得一种选项的 amount 个代币
+
+        Args:
+            amount: 每人转入的选项代币数量（最小单位）
+            gas_wei: 每人设置的ETH余额
+            options: 可选的选项索引，默认全部选项
+            seed: 选择选项的随机种子
+            timeout: 等待转账确认的超时时间（秒）
+
+        Returns:
+            {'transfers', 'failed', 'seconds'}
+        """
+        if not self.holders:
+            raise ValueError("请先生成持有人账户")
+        option_tokens = self.operator.option_tokens
+        options = list(options) if options is not None else list(range(len(option_tokens)))
+        rng = random.Random(seed)
+        start = time.perf_counter()
+
+        for holder in self.holders:
+            self.fork.set_balance(holder.account_address, gas_wei)
+
+        # 交易账户的转账nonce连续分配，预签名后按顺序发送
+        self.holder_options = [rng.choice(options) for _ in self.holders]
+        with self._pipeline() as pipeline:
+            for holder, option in zip(self.holders, self.holder_options):
+                pipeline.submit(self.funder, fast_abi.transfer_data(holder.account_address, amount),
+                                DEFAULT_TRANSFER_GAS, label=holder.account_address,
+                                to=checksum_address(option_tokens[option].token_address))
+            sent = pipeline.send_all()
+        tx_hashes = [tx_hash for _, tx_hash, _ in sent if tx_hash]
+        receipts = self.wait_receipts(tx_hashes, timeout)
+        failed = (len(sent) - len(tx_hashes) +
+                  sum(1 for receipt, _ in receipts.values() if _hex_int(receipt.get('status')) != 1) +
+                  len(tx_hashes) - len(receipts))
+        return {'transfers': len(sent), 'failed': failed, 'seconds': time.perf_counter() - start}
+
+    # ========== 结算 ==========
+
+    def _known_key(self, address: str) -> Optional[str]:
+        """页面中已配置私钥的账户"""
+        operator = self.operator
+        for account, key in ((operator.ACCOUNT_ADDRESS, operator.ACCOUNT_PRIVATE_KEY),
+                             (operator.LP_PROVIDER_ADDRESS, operator.LP_PROVIDER_PRIVATE_KEY)):
+            if account.lower() == address.lower():
+                return key
+        return None
+
+    def _send(self, address: str, data: bytes, gas: int, private_key: Optional[str] = None) -> str:
+        """有私钥时签名发送，否则在分叉节点上冒充该账户发送"""
+        if private_key:
+            contract = PredictionContract(self.web3, self.prediction_address, private_key, address,
+                                          self.nonce_manager)
+            return contract._send_calldata(data, gas_limit=gas)
+        self.fork.set_balance(address, 10 ** 18)
+        return self.fork.send_as(address, self.prediction_address, data, gas)
+
+    def settle(self, final_option: int, oracle_private_key: Optional[str] = None,
+               warp: bool = True, timeout: float = 120.0) -> Dict[str, Any]:
+        """
+        结算市场：owner 调用 settle，再由本地替身完成预言机回调
+
+        Args:
+            final_option: 最终结果的选项索引
+            oracle_private_key: 预言机账户私钥；为空时冒充 oracle() 地址
+            warp: 区块时间早于 assertTime 时是否把分叉节点的时间推进到 assertTime
+            timeout: 等待交易确认的超时时间（秒）
+
+        Returns:
+            结算前后的状态、交易哈希和Gas
+        """
+        before = self.market_state()
+        if warp:
+            latest = self.web3.eth.get_block('latest')
+            if latest['timestamp'] < before['assert_time']:
+                self.fork.warp_to(before['assert_time'] + 1)
+
+        owner = self.operator.owner
+        start = time.perf_counter()
+        settle_hash = self._send(owner, fast_abi.settle_data(final_option), DEFAULT_SETTLE_GAS,
+                                 self._known_key(owner))
+        settle_receipt = self._wait_one(settle_hash, timeout)
+        settle_seconds = time.perf_counter() - start
+
+        # settle 之后 assertionId 才确定
+        settling = self.market_state()
+        assertion_id = bytes.fromhex(settling['assertion_id'][2:])
+        oracle = settling['oracle']
+        if oracle_private_key:
+            from eth_account import Account
+
+            oracle = Account.from_key(oracle_private_key).address
+        start = time.perf_counter()
+        callback_hash = self._send(oracle, fast_abi.assertion_resolved_callback_data(assertion_id, True),
+                                   DEFAULT_SETTLE_GAS, oracle_private_key)
+        callback_receipt = self._wait_one(callback_hash, timeout)
+        callback_seconds = time.perf_counter() - start
+
+        self.settlement = {
+            'before': before,
+            'settling': settling,
+            'after': self.market_state(),
+            'settle_tx': settle_hash,
+            'settle_gas': _hex_int(settle_receipt.get('gasUsed')),
+            'settle_seconds': settle_seconds,
+            'callback_tx': callback_hash,
+            'callback_gas': _hex_int(callback_receipt.get('gasUsed')),
+            'callback_seconds': callback_seconds,
+        }
+        return self.settlement
+
+    # ========== 领取 ==========
+
+    def _claimed_amount(self, receipt: dict) -> int:
+        total = 0
+        for log in receipt.get('logs', []):
+            topics = log.get('topics') or []
+            if (topics and str(topics[0]).lower() == CLAIMED_TOPIC and
+                    str(log.get('address', '')).lower() == self.prediction_address.lower()):
+                # data: option, amount
+                data = bytes.fromhex(str(log['data'])[2:])
+                total += int.from_bytes(data[32:64], 'big')
+        return total
+
+    def claim_storm(self, batch_size: int = 100, parts: int = 1,
+                    timeout: float = 120.0) -> Dict[str, Any]:
+        """
+        持有最终选项代币的账户按批并发领取
+
+        Args:
+            batch_size: 每批的持有人数
+            parts: 每人拆成几笔领取；大于1时前 parts-1 笔为 claim(余额/parts)，最后一笔 claimAll，
+                同一账户的多笔交易使用连续的nonce一起发送
+            timeout: 每批等待确认的超时时间（秒）
+
+        Returns:
+            吞吐量、Gas、延迟和池子余额变化
+        """
+        if not self.holders:
+            raise ValueError("请先生成持有人账户")
+        final_option = self.market_state()['final_option']
+        if final_option < 0:
+            raise ValueError("市场尚未结算")
+
+        winning_token = self.operator.option_tokens[final_option].token_address
+        balances = self._balances(winning_token, [holder.account_address for holder in self.holders])
+        winners = [(holder, balance) for holder, balance in zip(self.holders, balances) if balance > 0]
+
+        parts = max(1, int(parts))
+        latency = Histogram()
+        gas_used: List[int] = []
+        send_errors = 0
+        reverted = 0
+        claimed_total = 0
+        batches = []
+        pool_before = self.pool_balance()
+        pool_last = pool_before
+        start = time.perf_counter()
+
+        with self._pipeline() as pipeline:
+            for index, batch in enumerate(_chunks(winners, max(1, batch_size))):
+                batch_start = time.perf_counter()
+                for holder, balance in batch:
+                    share = balance // parts
+                    for _ in range(parts - 1):
+                        pipeline.submit(holder, fast_abi.claim_data(share), DEFAULT_CLAIM_GAS,
+                                        label=holder.account_address)
+                    pipeline.submit(holder, fast_abi.claim_all_data(), DEFAULT_CLAIM_GAS,
+                                    label=holder.account_address)
+
+                # 逐笔发送以记录每笔交易的发送时刻
+                sent_at: Dict[str, float] = {}
+                while len(pipeline):
+                    try:
+                        tx_hash = pipeline.send_next()
+                    except Exception:
+                        send_errors += 1
+                        continue
+                    sent_at[tx_hash if tx_hash.startswith('0x') else '0x' + tx_hash] = time.perf_counter()
+                send_seconds = time.perf_counter() - batch_start
+
+                receipts = self.wait_receipts(list(sent_at), timeout)
+                batch_gas = 0
+                batch_failed = len(sent_at) - len(receipts)
+                for tx_hash, (receipt, confirmed_at) in receipts.items():
+                    if _hex_int(receipt.get('status')) != 1:
+                        batch_failed += 1
+                        continue
+                    gas = _hex_int(receipt.get('gasUsed'))
+                    gas_used.append(gas)
+                    batch_gas += gas
+                    latency.record(confirmed_at - sent_at[tx_hash])
+                    claimed_total += self._claimed_amount(receipt)
+                reverted += batch_failed
+
+                pool_now = self.pool_balance()
+                batches.append({
+                    'batch': index + 1,
+                    'holders': len(batch),
+                    'transactions': len(sent_at),
+                    'failed': batch_failed,
+                    'send_seconds': send_seconds,
+                    'seconds': time.perf_counter() - batch_start,
+                    'gas': batch_gas,
+                    'pool_balance': pool_now,
+                    'pool_drain': pool_last - pool_now,
+                })
+                pool_last = pool_now
+
+        seconds = time.perf_counter() - start
+        gas_sorted = sorted(gas_used)
+
+        def gas_percentile(p: float) -> int:
+            if not gas_sorted:
+                return 0
+            return gas_sorted[min(len(gas_sorted) - 1, int(len(gas_sorted) * p / 100))]
+
+        return {
+            'holders': len(winners),
+            'transactions': sum(row['transactions'] for row in batches) + send_errors,
+            'succeeded': len(gas_used),
+            'failed': reverted + send_errors,
+            'seconds': seconds,
+            'claims_per_second': len(gas_used) / seconds if seconds > 0 else 0.0,
+            'gas': {
+                'total': sum(gas_used),
+                'mean': sum(gas_used) / len(gas_used) if gas_used else 0,
+                'p50': gas_percentile(50),
+                'p95': gas_percentile(95),
+                'max': gas_sorted[-1] if gas_sorted else 0,
+            },
+            'latency': latency.to_dict(),
+            'claimed_total': claimed_total,
+            'pool_before': pool_before,
+            'pool_after': pool_last,
+            'pool_drain': pool_before - pool_last,
+            'batches': batches,
+        }
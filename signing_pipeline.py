@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+预签名交易流水线
+
+提前为即将发送的交易分配nonce、构建交易并在进程池中完成ECDSA签名和RLP编码，
+签好的原始交易按提交顺序排队，发送时只剩 send_raw_transaction 一次网络往返。
+账户多、操作频率高时，签名的CPU开销可以与网络I/O重叠。
+
+同一账户的nonce在提交时按顺序分配，队列按提交顺序发送，因此nonce顺序不会乱；
+某笔交易签名或发送失败时，会重置该账户的nonce并为队列中该账户的后续交易重新签名。
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from instrumentation import registry
+from nonce_manager import NonceManager
+
+
+def sign_raw(transaction: Dict[str, Any], private_key: str) -> Tuple[bytes, str]:
+    """
+    签名交易（在工作进程中执行）
+
+    Args:
+        transaction: 未签名的交易字典
+        private_key: 私钥
+
+    Returns:
+        (原始交易字节, 交易哈希)
+    """
+    from eth_account import Account
+
+    signed = Account.sign_transaction(transaction, private_key)
+    return bytes(signed.raw_transaction), signed.hash.hex()
+
+
+class QueuedTransaction:
+    """队列中的一笔预签名交易"""
+
+    __slots__ = ('contract', 'data', 'gas_limit', 'label', 'fields', 'nonce', 'future')
+
+    def __init__(self, contract, data: bytes, gas_limit: Optional[int], label: str,
+                 fields: Optional[Dict[str, Any]] = None):
+        self.contract = contract
+        self.data = data
+        self.gas_limit = gas_limit
+        self.label = label
+        self.fields = fields or {}
+        self.nonce: Optional[int] = None
+        self.future: Optional[Future] = None
+
+
+class SigningPipeline:
+    """提前构建并签名交易，按提交顺序发送"""
+
+    def __init__(self, nonce_manager: NonceManager, max_workers: Optional[int] = None,
+                 use_processes: bool = True, gas_price_ttl: float = 2.0):
+        """
+        Args:
+            nonce_manager: 共用的nonce管理器
+            max_workers: 签名进程/线程数，默认为CPU核数
+            use_processes: True时在进程池中签名，账户少时可设为False使用线程池
+            gas_price_ttl: Gas价格缓存时间（秒）
+        """
+        self.nonce_manager = nonce_manager
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_class(max_workers=max_workers)
+        self.gas_price_ttl = gas_price_ttl
+        self.queue: deque = deque()
+        self._lock = threading.Lock()
+        self._gas_price = None
+        self._gas_price_at = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.queue)
+
+    def _current_gas_price(self, web3) -> int:
+        now = time.monotonic()
+        if self._gas_price is None or now - self._gas_price_at > self.gas_price_ttl:
+            self._gas_price = web3.eth.gas_price
+            self._gas_price_at = now
+        return self._gas_price
+
+    def _sign(self, item: QueuedTransaction):
+        contract = item.contract
+        with registry.stage('build_transaction'):
+            item.nonce = self.nonce_manager.next_nonce(contract.account_address)
+            transaction = contract.calldata_transaction(
+                item.data, item.nonce, self._current_gas_price(contract.web3), item.gas_limit, **item.fields)
+        item.future = self.executor.submit(sign_raw, transaction, contract.private_key)
+
+    def submit(self, contract, data: bytes, gas_limit: Optional[int] = None, label: str = '',
+               **fields) -> QueuedTransaction:
+        """
+        提交一笔待发送的交易，立即分配nonce并开始后台签名
+
+        Args:
+            contract: 发送账户的 PredictionContract
+            data: fast_abi 编码的调用数据
+            gas_limit: Gas限制
+            label: 便于识别的标签
+            **fields: 覆盖的交易字段，例如调用选项代币时的 to
+
+        Returns:
+            QueuedTransaction
+        """
+        item = QueuedTransaction(contract, data, gas_limit, label, fields)
+        with self._lock:
+            self._sign(item)
+            self.queue.append(item)
+        return item
+
+    def ready_count(self) -> int:
+        """已签好、可以立即发送的交易数"""
+        return sum(1 for item in list(self.queue) if item.future.done())
+
+    def _resign_account(self, address: str):
+        """重置账户nonce，并为队列中该账户的交易按顺序重新分配nonce和签名"""
+        self.nonce_manager.reset(address)
+        key = address.lower()
+        for item in self.queue:
+            if item.contract.account_address.lower() == key:
+                item.future.cancel()
+                self._sign(item)
+
+    def send_next(self) -> Optional[str]:
+        """
+        发送队首交易
+
+        Returns:
+            交易哈希，队列为空时返回None
+        """
+        with self._lock:
+            if not self.queue:
+                return None
+            item = self.queue.popleft()
+            try:
+                # 正常情况下签名早已完成，这里记录的是仍需等待签名的时间
+                with registry.stage('signing'):
+                    raw, tx_hash = item.future.result()
+                with registry.stage('send'):
+                    item.contract.web3.eth.send_raw_transaction(raw)
+            except Exception as e:
+                # 签名或发送失败都会让该nonce空缺，后续交易需要重新分配nonce并签名
+                print(f"发送预签名交易失败 ({item.label or item.nonce}): {str(e)}")
+                self._resign_account(item.contract.account_address)
+                raise
+        print(f"交易已发送，哈希: {tx_hash}")
+        return tx_hash
+
+    def send_all(self) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        按顺序发送队列中的全部交易
+
+        Returns:
+            [(标签, 交易哈希, 错误信息)]，发送失败时交易哈希为None
+        """
+        results = []
+        while self.queue:
+            label = self.queue[0].label
+            try:
+                results.append((label, self.send_next(), None))
+            except Exception as e:
+                results.append((label, None, str(e)))
+        return results
+
+    def close(self):
+        """关闭签名进程池，未发送的交易被丢弃，相关账户的nonce重置"""
+        with self._lock:
+            for item in self.queue:
+                item.future.cancel()
+            for address in {item.contract.account_address for item in self.queue}:
+                self.nonce_manager.reset(address)
+            self.queue.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+辅助工具函数
+
+链上金额在程序内部一律以原始整数保存，只在用户输入和渲染时
+通过这里的函数与十进制数互相转换，避免浮点误差累积。
+"""
+
+import time
+from decimal import Decimal, ROUND_DOWN
+from typing import Union
+
+Number = Union[int, float, str, Decimal]
+
+
+def to_wei(amount: Number, decimals: int) -> int:
+    """
+    十进制金额转换为原始整数，多余的小数位向下截断
+
+    Args:
+        amount: 十进制金额，浮点数会先按其字符串表示转换
+        decimals: 代币小数位数
+
+    Returns:
+        原始整数金额
+    """
+    value = Decimal(str(amount)) if isinstance(amount, float) else Decimal(amount)
+    return int((value * (Decimal(10) ** decimals)).to_integral_value(rounding=ROUND_DOWN))
+
+
+def from_wei(raw: int, decimals: int) -> Decimal:
+    """
+    原始整数金额转换为精确的十进制数
+
+    Args:
+        raw: 原始整数金额
+        decimals: 代币小数位数
+
+    Returns:
+        Decimal金额
+    """
+    return Decimal(int(raw)).scaleb(-decimals)
+
+
+def format_amount(raw: int, decimals: int) -> str:
+    """原始整数金额格式化为显示字符串，去掉末尾多余的0"""
+    text = f"{from_wei(raw, decimals):f}"
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return text
+
+
+def get_deadline(hours: float = 1) -> int:
+    """
+    生成截止时间戳
+
+    Args:
+        hours: 距当前的小时数
+
+    Returns:
+        Unix时间戳
+    """
+    return int(time.time() + hours * 3600)
+
+
+def calculate_slippage(amount: int, slippage_percent: float) -> int:
+    """
+    计算滑点保护后的最小接收数量
+
+    Args:
+        amount: 预期数量（原始整数）
+        slippage_percent: 滑点百分比，例如0.5表示0.5%
+
+    Returns:
+        最小接收数量（原始整数）
+    """
+    return int(amount) * (10000 - int(round(slippage_percent * 100))) // 10000